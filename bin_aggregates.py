@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import numpy as np
+from log_reader import flow_codes
+
+# Per-(flow, bar) aggregates of resolved datapoints, computed in one
+# vectorized group-by pass.  Flows are the int64 flow codes of log_reader
+# and bars are time // bar_period.  Aggregates are counts and sums, so
+# aggregates of separate parts of a log can be combined with merge_bins.
+#
+# count: datapoints, lost: datapoints not received, outliers: received
+# with latency over max_ms_latency, latency_count, latency_sum and
+# latency_max: the remaining datapoints and their ms latency sum and max,
+# bytes: bytes received, jitter_count and jitter_sum: the number and ms sum
+# of absolute latency changes between consecutively received messages of a
+# flow, counted in the bar of the later message.  jitter_sum / jitter_count
+# is the mean absolute latency change, the |D| of RFC 3550 averaged without
+# its 1/16 smoothing filter, so it is not the RFC 3550 jitter estimate but
+# unlike it can be merged across parts of a log.
+BIN_DTYPE = [("flow", "i8"), ("bar", "i8"), ("count", "i8"),
+             ("lost", "i8"), ("outliers", "i8"), ("latency_count", "i8"),
+             ("latency_sum", "f8"), ("latency_max", "f8"), ("bytes", "i8"),
+             ("jitter_count", "i8"), ("jitter_sum", "f8")]
+
+_SUM_FIELDS = ["count", "lost", "outliers", "latency_count", "latency_sum",
+               "bytes", "jitter_count", "jitter_sum"]
+_MAX_FIELDS = ["latency_max"]
+
+# bar of bins that cover all bars of a flow
+ALL_BARS = -1
+
+# bin index of each datapoint
+def bar_indexes(datapoints, bar_period):
+    return (datapoints["time"] // bar_period).astype(np.int64)
+
+# group index of each (flow, bar) and the (flow, bar) of each group
+def group_indexes(flows, bars):
+    unique_flows, flow_index = np.unique(flows, return_inverse=True)
+    bar_min = bars.min()
+    bar_count = bars.max() - bar_min + 1
+    keys, groups = np.unique(flow_index.reshape(-1) * bar_count
+                             + (bars - bar_min), return_inverse=True)
+    return groups.reshape(-1), unique_flows[keys // bar_count], \
+           keys % bar_count + bar_min
+
+# aggregate datapoints into bins sorted by flow, bar
+def aggregate(datapoints, bar_period, max_ms_latency):
+    if not len(datapoints):
+        return np.zeros(0, dtype=BIN_DTYPE)
+    groups, flows, bars = group_indexes(flow_codes(datapoints),
+                                        bar_indexes(datapoints, bar_period))
+    lost = datapoints["loss"] > 0
+    outliers = ~lost & (datapoints["latency"] > max_ms_latency)
+    valid = ~lost & ~outliers
+
+    size = len(flows)
+    bins = np.zeros(size, dtype=BIN_DTYPE)
+    bins["flow"] = flows
+    bins["bar"] = bars
+    bins["count"] = np.bincount(groups, minlength=size)
+    bins["lost"] = np.bincount(groups, weights=lost, minlength=size)
+    bins["outliers"] = np.bincount(groups, weights=outliers, minlength=size)
+    bins["latency_count"] = np.bincount(groups, weights=valid,
+                                        minlength=size)
+    bins["latency_sum"] = np.bincount(groups,
+                          weights=np.where(valid, datapoints["latency"], 0),
+                          minlength=size)
+    latency_max = np.zeros(size)
+    np.maximum.at(latency_max, groups[valid], datapoints["latency"][valid])
+    bins["latency_max"] = latency_max
+    bins["bytes"] = np.bincount(groups, weights=datapoints["size"],
+                                minlength=size)
+
+    # jitter between consecutive arrivals within each flow
+    received = np.flatnonzero(~lost)
+    rx_flows = flow_codes(datapoints)[received]
+    rx_times = datapoints["time"][received] \
+             + datapoints["latency"][received] / 1000
+    order = np.lexsort((rx_times, rx_flows))
+    received = received[order]
+    rx_flows = rx_flows[order]
+    same_flow = rx_flows[1:] == rx_flows[:-1]
+    later = received[1:][same_flow]
+    jitter = np.abs(datapoints["latency"][received[1:]]
+                  - datapoints["latency"][received[:-1]])[same_flow]
+    bins["jitter_count"] = np.bincount(groups[later], minlength=size)
+    bins["jitter_sum"] = np.bincount(groups[later], weights=jitter,
+                                     minlength=size)
+    return bins
+
+# combine bins from separate parts of a log
+def merge_bins(parts):
+    bins = np.concatenate([np.zeros(0, dtype=BIN_DTYPE)] + list(parts))
+    if not len(bins):
+        return bins
+    bins = bins[np.lexsort((bins["bar"], bins["flow"]))]
+    starts = np.flatnonzero(np.concatenate([[True],
+                      (bins["flow"][1:] != bins["flow"][:-1])
+                    | (bins["bar"][1:] != bins["bar"][:-1])]))
+    merged = bins[starts]
+    for name in _SUM_FIELDS:
+        merged[name] = np.add.reduceat(bins[name], starts)
+    for name in _MAX_FIELDS:
+        merged[name] = np.maximum.reduceat(bins[name], starts)
+    return merged
+
+# split per-bin values into per-flow series
+# key=flow code, value=(bar indexes, values)
+def flow_series(bins, values):
+    series = dict()
+    if not len(bins):
+        return series
+    starts = np.flatnonzero(np.concatenate([[True],
+                                bins["flow"][1:] != bins["flow"][:-1]]))
+    ends = np.concatenate([starts[1:], [len(bins)]])
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        series[int(bins["flow"][start])] = (bins["bar"][start:end],
+                                             values[start:end])
+    return series
+
+# collapse the bars of each flow into one bin per flow with bar ALL_BARS
+def flow_totals(bins):
+    collapsed = bins.copy()
+    collapsed["bar"] = ALL_BARS
+    return merge_bins([collapsed])
+
+def totals(bins):
+    return int(bins["count"].sum()), int(bins["lost"].sum()), \
+           int(bins["outliers"].sum())
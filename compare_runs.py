@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+from log_reader import read_datapoints, cached_datapoints, flow_labels
+from bin_aggregates import aggregate, merge_bins, flow_totals
+from latency_sketch import sketch, merge_sketches, flow_sketches, cdfs, \
+                           quantile_columns, quantile_cells
+
+# Compare the results of several runs, e.g. one scenario under different
+# link settings.  Runs are parsed and aggregated in a process pool, each
+# worker returning only its bins and latency sketches, then one summary
+# table of per-flow statistics per run and one figure of overlaid all-flow
+# trends and latency CDFs are produced.
+
+# the flow code for all flows of a run combined
+ALL_FLOWS = -1
+
+# parse and aggregate one run, in a worker process
+def aggregate_run(input_file, setup_file, bar_period, max_ms_latency,
+                  no_join, no_cache, use_window):
+    if no_cache:
+        read = read_datapoints
+    else:
+        read = cached_datapoints
+    datapoints, robot_names, topic_names = read(input_file, setup_file,
+                                                no_join, use_window)
+    return aggregate(datapoints, bar_period, max_ms_latency), \
+           sketch(datapoints, bar_period, max_ms_latency), \
+           robot_names, topic_names
+
+# bins or sketches with their flows combined into ALL_FLOWS
+def _all_flows(parts, merge):
+    combined = parts.copy()
+    combined["flow"] = ALL_FLOWS
+    return merge([combined])
+
+def write_summary_table(filename, runs, bar_period):
+    with open(filename, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["run", "from", "to", "topic", "count", "lost",
+                         "loss_percent", "mean_ms"] + quantile_columns()
+                        + ["max_ms", "throughput_bytes_per_s"])
+        for run_name, (bins, sketches, robot_names, topic_names) \
+                                                         in runs.items():
+            # duration of the run, for throughput
+            duration = (bins["bar"].max() - bins["bar"].min() + 1) \
+                       * bar_period if len(bins) else 0
+            flow_bins = flow_totals(bins)
+            all_bins = np.concatenate([flow_bins,
+                                       _all_flows(flow_bins, merge_bins)])
+            flow_sketch = flow_sketches(sketches)
+            percentile_cells = quantile_cells(np.concatenate([flow_sketch,
+                      _all_flows(flow_sketch, merge_sketches)]), all_bins)
+            labels = flow_labels(flow_bins["flow"], robot_names,
+                                 topic_names) + ["all, all, all"]
+
+            for label, b, percentiles in zip(labels, all_bins.tolist(),
+                                             percentile_cells):
+                row = dict(zip(all_bins.dtype.names, b))
+                writer.writerow([run_name] + label.split(", ") + [
+                       row["count"], row["lost"],
+                       "%f"%(row["lost"] / row["count"] * 100),
+                       "%f"%(row["latency_sum"] / row["latency_count"])
+                             if row["latency_count"] else ""]
+                       + percentiles + [
+                       "%f"%row["latency_max"] if row["latency_count"]
+                             else "",
+                       "%f"%(row["bytes"] / duration) if duration else ""])
+
+def plot_overlays(runs, args):
+    plt.figure(figsize=(12,10))
+    plt.suptitle(args.dataset_name)
+    for run_name, (bins, sketches, _robot_names, _topic_names) \
+                                                         in runs.items():
+        totals = _all_flows(bins, merge_bins)
+        times = totals["bar"] * args.bar_period
+
+        plt.subplot(2,2,1)
+        has_latency = totals["latency_count"] > 0
+        plt.plot(times[has_latency], totals["latency_sum"][has_latency]
+                 / totals["latency_count"][has_latency], '-',
+                 label=run_name)
+
+        plt.subplot(2,2,2)
+        plt.plot(times, totals["bytes"] / args.bar_period, '-',
+                 label=run_name)
+
+        plt.subplot(2,2,3)
+        plt.plot(times, totals["lost"] / totals["count"] * 100, '-',
+                 label=run_name)
+
+        plt.subplot(2,2,4)
+        for latencies, fractions in cdfs(_all_flows(sketches,
+                                         merge_sketches)).values():
+            plt.step(latencies, fractions, where="post", label=run_name)
+
+    for index, (title, ylabel, xlabel) in enumerate([
+                ("Average latency", "Latency in milliseconds",
+                 "Time in seconds"),
+                ("Average byte throughput", "Bytes per second",
+                 "Time in seconds"),
+                ("% Packet loss", "%Packets lost", "Time in seconds"),
+                ("Latency CDF", "Fraction of messages",
+                 "Latency in milliseconds")]):
+        plt.subplot(2,2,index + 1)
+        plt.title(title)
+        plt.ylabel(ylabel)
+        plt.xlabel(xlabel)
+        plt.legend()
+    plt.xscale("log")
+
+if __name__=="__main__":
+
+    parser = ArgumentParser(description="Compare network flow results "
+                                        "across runs.",
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("input_files", type=str, nargs="+",
+                        help="The CSV data input files, one per run.")
+    parser.add_argument("-d","--dataset_name", type=str,
+                    help="The name of this comparison.",
+                        default = "Run comparison")
+    parser.add_argument("-l","--labels", type=str,
+                    help="Comma separated run names, default the input "
+                         "file names.",
+                        default = "")
+    parser.add_argument("-m","--max_ms_latency", type=float,
+                help="The maximum ms latency allowed without being dropped.",
+                        default = 10000)
+    parser.add_argument("-b","--bar_period", type=int,
+                help="The time, in seconds, for each averaged period.",
+                        default = 5)
+    parser.add_argument("-s","--setup_file", type=str,
+                    help="The scenario setup file, required for binary logs "
+                         "and tx rows logged once per publish.",
+                        default = "")
+    parser.add_argument("-t","--summary_file", type=str,
+                    help="The per-flow per-run summary CSV file.",
+                        default = "run_summary.csv")
+    parser.add_argument("-w","--write_file", type=str,
+                    help="Write the overlay plots to <filename>.png.",
+                        default = "")
+    parser.add_argument("-j","--jobs", type=int,
+                    help="The number of worker processes.",
+                        default = os.cpu_count())
+    parser.add_argument("-n","--no_join", action="store_true",
+                    help="Use receiver-logged latency instead of joining "
+                         "tx and rx, losses are inferred from tx_count gaps.")
+    parser.add_argument("-N","--no_window", action="store_true",
+                    help="Keep messages sent outside the run's measurement "
+                         "window in <input_file>.run.json.")
+    parser.add_argument("-C","--no_cache", action="store_true",
+                    help="Do not read or write the <input_file>.cache.npz "
+                         "cache of parsed datapoints.")
+    args = parser.parse_args()
+
+    if args.labels:
+        run_names = args.labels.split(",")
+        if len(run_names) != len(args.input_files):
+            raise RuntimeError("--labels needs one name per input file")
+    else:
+        run_names = args.input_files
+
+    # parse and aggregate each run in parallel, keeping the given order
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        results = executor.map(aggregate_run, args.input_files,
+                               *[[value] * len(args.input_files) for value in
+                                 (args.setup_file, args.bar_period,
+                                  args.max_ms_latency, args.no_join,
+                                  args.no_cache, not args.no_window)])
+        runs = dict(zip(run_names, results))
+
+    write_summary_table(args.summary_file, runs, args.bar_period)
+    print("wrote %s"%args.summary_file)
+
+    plot_overlays(runs, args)
+    if args.write_file:
+        plt.savefig("%s.png"%args.write_file)
+    else:
+        plt.show()
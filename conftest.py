@@ -0,0 +1,4 @@
+# pytest configuration: the tests import the analysis scripts from the
+# repository root, which pytest puts on sys.path for this conftest.py.
+# The scenario scripts are Mininet scripts, not tests.
+collect_ignore_glob = ["scenarios/*"]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import numpy as np
+
+# Downsampling for plots, keeping what the plot looks like.
+#
+# pixel_thin keeps one point per pixel cell of a scatter plot, so outliers
+# and the extent of dense regions are preserved.  lttb is Largest
+# Triangle Three Buckets: it keeps one point per bucket, the one forming
+# the largest triangle with the point kept from the previous bucket and
+# the mean of the next bucket, which preserves the peaks and shape of a
+# line plot.
+
+"""
+indexes of the points to keep so that at most one point is drawn in each
+cell of a width by height grid over the data.
+"""
+def pixel_thin(x, y, width=1000, height=1000):
+    if len(x) <= width:
+        return np.arange(len(x))
+    def cells(values, count):
+        low = values.min()
+        span = values.max() - low
+        if span == 0:
+            return np.zeros(len(values), dtype=np.int64)
+        return np.minimum(((values - low) / span * count).astype(np.int64),
+                          count - 1)
+    _, keep = np.unique(cells(x, width) * height + cells(y, height),
+                        return_index=True)
+    return np.sort(keep)
+
+# indexes of threshold points of x sorted series x, y chosen by LTTB
+def lttb(x, y, threshold):
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # the first and last points are kept, the rest split into buckets
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+    bucket_sums_x = np.add.reduceat(x[:-1], edges[:-1])
+    bucket_sums_y = np.add.reduceat(y[:-1], edges[:-1])
+    bucket_sizes = np.diff(edges)
+    means_x = np.append(bucket_sums_x / bucket_sizes, x[-1])
+    means_y = np.append(bucket_sums_y / bucket_sizes, y[-1])
+
+    keep = np.zeros(threshold, dtype=np.int64)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = edges[bucket]
+        end = edges[bucket + 1]
+        # twice the triangle areas, the constant factor does not matter
+        areas = np.abs((x[previous] - means_x[bucket + 1])
+                       * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end])
+                       * (means_y[bucket + 1] - y[previous]))
+        previous = start + int(np.argmax(areas))
+        keep[bucket + 1] = previous
+    keep[-1] = size - 1
+    return keep
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import numpy as np
+from log_reader import flow_codes
+from bin_aggregates import bar_indexes, group_indexes, ALL_BARS
+
+# HDR histogram style latency sketches for percentiles.
+#
+# Latencies are counted in log-spaced buckets from MIN_MS to MAX_MS, each
+# bucket spanning a factor of BUCKET_GROWTH, so a quantile read from a
+# bucket is within about 1% of the true value.  Sketches hold only
+# (flow, bar, bucket, count) records, so memory depends on the number of
+# flows, bars and distinct buckets but not on the number of messages, and
+# sketches of separate parts of a log merge by adding counts.
+
+MIN_MS = 0.001
+MAX_MS = 1000000.0
+BUCKET_GROWTH = 1.02
+BUCKET_COUNT = int(np.ceil(np.log(MAX_MS / MIN_MS) / np.log(BUCKET_GROWTH)))
+
+SKETCH_DTYPE = [("flow", "i8"), ("bar", "i8"), ("bucket", "i4"),
+                ("count", "i8")]
+
+def bucket_indexes(latencies):
+    buckets = np.floor(np.log(np.maximum(latencies, MIN_MS) / MIN_MS)
+                       / np.log(BUCKET_GROWTH))
+    return np.minimum(buckets, BUCKET_COUNT - 1).astype(np.int32)
+
+# the geometric middle of each bucket
+def bucket_values(buckets):
+    return MIN_MS * BUCKET_GROWTH ** (buckets + 0.5)
+
+# latency sketch records of datapoints received within max_ms_latency,
+# sorted by flow, bar, bucket
+def sketch(datapoints, bar_period, max_ms_latency):
+    valid = (datapoints["loss"] == 0) \
+          & (datapoints["latency"] <= max_ms_latency)
+    points = datapoints[valid]
+    if not len(points):
+        return np.zeros(0, dtype=SKETCH_DTYPE)
+    groups, flows, bars = group_indexes(flow_codes(points),
+                                        bar_indexes(points, bar_period))
+    keys, counts = np.unique(groups.astype(np.int64) * BUCKET_COUNT
+                             + bucket_indexes(points["latency"]),
+                             return_counts=True)
+    sketches = np.zeros(len(keys), dtype=SKETCH_DTYPE)
+    sketches["flow"] = flows[keys // BUCKET_COUNT]
+    sketches["bar"] = bars[keys // BUCKET_COUNT]
+    sketches["bucket"] = keys % BUCKET_COUNT
+    sketches["count"] = counts
+    return sketches
+
+def _group_starts(sketches, fields):
+    change = np.zeros(len(sketches) - 1, dtype=bool)
+    for name in fields:
+        change |= sketches[name][1:] != sketches[name][:-1]
+    return np.flatnonzero(np.concatenate([[True], change]))
+
+# combine sketches from separate parts of a log
+def merge_sketches(parts):
+    sketches = np.concatenate([np.zeros(0, dtype=SKETCH_DTYPE)] + list(parts))
+    if not len(sketches):
+        return sketches
+    sketches = sketches[np.lexsort((sketches["bucket"], sketches["bar"],
+                                    sketches["flow"]))]
+    starts = _group_starts(sketches, ("flow", "bar", "bucket"))
+    merged = sketches[starts]
+    merged["count"] = np.add.reduceat(sketches["count"], starts)
+    return merged
+
+# collapse the bars of each flow into one sketch per flow with bar ALL_BARS
+def flow_sketches(sketches):
+    collapsed = sketches.copy()
+    collapsed["bar"] = ALL_BARS
+    return merge_sketches([collapsed])
+
+"""
+quantiles of each sketch.  Returns flows, bars and an array of latency
+values with one row per (flow, bar) and one column per quantile.
+"""
+def quantiles(sketches, qs):
+    if not len(sketches):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), \
+               np.zeros((0, len(qs)))
+    starts = _group_starts(sketches, ("flow", "bar"))
+    totals = np.add.reduceat(sketches["count"], starts)
+    cumulative = np.cumsum(sketches["count"])
+    before = cumulative[starts] - sketches["count"][starts]
+
+    values = np.zeros((len(starts), len(qs)))
+    for column, q in enumerate(qs):
+        # first bucket of each group whose cumulative count reaches q
+        ranks = before + np.maximum(np.ceil(q * totals), 1)
+        index = np.searchsorted(cumulative, ranks)
+        values[:, column] = bucket_values(sketches["bucket"][index])
+    return sketches["flow"][starts], sketches["bar"][starts], values
+
+# quantiles reported in statistics tables
+REPORT_QUANTILES = [0.5, 0.95, 0.99]
+
+# table column names of quantiles qs, e.g. p95_ms
+def quantile_columns(qs=REPORT_QUANTILES):
+    return ["p%g_ms"%(q * 100) for q in qs]
+
+"""
+quantile table cells of sketches for each of bins, "%f" latencies capped
+at the bin's latency_max, or empty when the bin has no latencies.
+Returns a list of cells per bin.
+"""
+def quantile_cells(sketches, bins, qs=REPORT_QUANTILES):
+    flows, bars, values = quantiles(sketches, qs)
+    rows = {(flow, bar): row for row, (flow, bar) in
+            enumerate(zip(flows.tolist(), bars.tolist()))}
+    cells = list()
+    for flow, bar, latency_max in zip(bins["flow"].tolist(),
+                                      bins["bar"].tolist(),
+                                      bins["latency_max"].tolist()):
+        if (flow, bar) in rows:
+            # a bucket value can exceed the exact max
+            cells.append(["%f"%min(value, latency_max)
+                          for value in values[rows[(flow, bar)]]])
+        else:
+            cells.append([""] * len(qs))
+    return cells
+
+"""
+CDF of each flow's sketch.  Returns key=flow code, value=(latency values,
+cumulative fractions).
+"""
+def cdfs(sketches):
+    sketches = flow_sketches(sketches)
+    curves = dict()
+    if not len(sketches):
+        return curves
+    starts = _group_starts(sketches, ("flow",))
+    ends = np.concatenate([starts[1:], [len(sketches)]])
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        counts = np.cumsum(sketches["count"][start:end])
+        curves[int(sketches["flow"][start])] = (
+                 bucket_values(sketches["bucket"][start:end]),
+                 counts / counts[-1])
+    return curves
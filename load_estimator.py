@@ -0,0 +1,395 @@
+#!/usr/bin/python3
+
+import sys
+import json
+from argparse import ArgumentParser
+from collections import defaultdict, deque
+from math import ceil
+from os.path import expanduser, abspath
+from imp import load_source # Python2
+
+from setup_reader import load_setup
+from traffic_models import mean_rate, mean_size
+
+# Estimate the offered load of a scenario before the network is built, from
+# the setup file and the links the topology file's myNetwork() adds, which
+# is run against a RecordingNet instead of Mininet so nothing is started.
+#
+# Each robot's publish of a topic sends one RTPS DATA message per
+# subscribing robot on another host, the unicast delivery of user data by
+# default.  Robots on the same host, see the Host column of the Robot
+# directive, exchange messages without the network.  Message sizes are the
+# CDR serialized TestbedMessage plus RTPS, UDP, IPv4 and Ethernet headers,
+# with IP fragmentation at the MTU.  Messages follow the fewest hops between
+# hosts.  A wired link is over capacity when its offered bits/s exceed its
+# bw, and over its queue limit when one publish sends more packets across
+# it than max_queue_size.  Wireless stations share the medium of their
+# adhoc SSID or access point, whose capacity is an approximate achievable
+# UDP throughput for the 802.11 mode.  Publishers with traffic models
+# offer their mean rate and mean message size, see traffic_models, so
+# bursts may exceed a link that the mean load fits.
+
+# bytes of the RTPS header, INFO_TS and DATA submessage headers
+RTPS_OVERHEAD = 20 + 12 + 24
+# HEARTBEAT submessage reliable writers piggyback on data
+RTPS_HEARTBEAT = 32
+# largest RTPS message before the writer fragments the sample, and the
+# bytes of each extra fragment message's RTPS header, INFO_TS and DATA_FRAG
+RTPS_MAX_MESSAGE = 65000
+RTPS_FRAGMENT_OVERHEAD = 20 + 12 + 36
+UDP_HEADER = 8
+IP_HEADER = 20
+ETHERNET_HEADER = 14
+
+# approximate achievable UDP Mbit/s of an 802.11 mode
+MEDIUM_MBPS = {"a": 24, "b": 6, "g": 24, "n": 100, "ac": 300}
+
+class RecordingNode():
+    def __init__(self, name, kind, params):
+        self.name = name
+        self.kind = kind
+        self.params = params
+
+    # accept any other node method the topology file calls
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+"""
+Records the nodes and links a topology file adds in place of Mininet or
+Mininet_wifi.  Links are dicts of node1, node2, the node names or None,
+medium, the shared wireless medium or None, tc, True for TCLinks, and
+params.
+"""
+class RecordingNet():
+    def __init__(self, *args, **kwargs):
+        self.nodes = dict()
+        self.links = list()
+        self.controllers = list()
+
+    def _add(self, name, kind, params):
+        self.nodes[name] = RecordingNode(name, kind, params)
+        return self.nodes[name]
+
+    def addHost(self, name, **params):
+        return self._add(name, "host", params)
+
+    def addSwitch(self, name, **params):
+        return self._add(name, "switch", params)
+
+    def addStation(self, name, **params):
+        return self._add(name, "station", params)
+
+    def addAccessPoint(self, name, **params):
+        return self._add(name, "ap", params)
+
+    def addController(self, name="c0", **params):
+        return self._add(name, "controller", params)
+
+    def _name(self, node):
+        return node if isinstance(node, str) else node.name
+
+    def addLink(self, node1, node2=None, port1=None, port2=None, cls=None,
+                **params):
+        node1 = self._name(node1)
+        node2 = self._name(node2) if node2 is not None else None
+        kinds = {self.nodes[node].kind for node in (node1, node2)
+                 if node in self.nodes}
+        medium = None
+        if node2 is None:
+            # adhoc and mesh links join the stations of an SSID
+            medium = "ssid %s"%params.get("ssid", "")
+        elif kinds == {"station", "ap"}:
+            ap = node1 if self.nodes[node1].kind == "ap" else node2
+            medium = "ap %s"%ap
+            params = dict(self.nodes[ap].params, **params)
+        cls_name = getattr(cls, "__name__", str(cls))
+        self.links.append({"node1": node1, "node2": node2, "medium": medium,
+                           "tc": "TC" in cls_name, "params": params})
+
+    def get(self, name):
+        return self.nodes[name]
+
+    def __getitem__(self, name):
+        return self.nodes[name]
+
+    # accept build, start and any other network method
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+"""
+run the topology file's myNetwork() against a RecordingNet, or with
+py_file -, build the setup's topology directives against one.
+"""
+def record_topology(py_file, setup=None):
+    if py_file == "-":
+        from topology_builder import build_topology
+        return build_topology(setup, RecordingNet)
+    topology_module = load_source("myNetwork_preflight", py_file)
+    recorded = list()
+    def recording_net(*args, **kwargs):
+        recorded.append(RecordingNet())
+        return recorded[-1]
+    for name in ("Mininet", "Mininet_wifi"):
+        if name in vars(topology_module):
+            setattr(topology_module, name, recording_net)
+    if "CLI" in vars(topology_module):
+        setattr(topology_module, "CLI", lambda *args, **kwargs: None)
+    topology_module.myNetwork()
+    if not recorded:
+        raise RuntimeError("%s does not build its network with Mininet or "
+                           "Mininet_wifi"%py_file)
+    return recorded[-1]
+
+# CDR serialized size of a TestbedMessage, with its encapsulation header
+def message_bytes(size, publisher_name):
+    offset = 0
+    def align(offset, n):
+        return (offset + n - 1) // n * n
+    offset = align(offset, 4) + 4 + len(publisher_name) + 1 # publisher_name
+    offset = align(offset, 4) + 4                             # tx_count
+    offset = align(offset, 8) + 8                             # tx_time_ns
+    offset = align(offset, 4) + 4 + size + 1                  # message
+    return 4 + offset
+
+"""
+bytes on the wire and packets of one RTPS sample of serialized bytes,
+including headers and fragmentation.
+"""
+def wire_size(serialized, reliable, mtu=1500):
+    payload = (serialized + 3) // 4 * 4
+    messages = max(1, int(ceil(payload / RTPS_MAX_MESSAGE)))
+    rtps = payload + RTPS_OVERHEAD \
+         + (messages - 1) * RTPS_FRAGMENT_OVERHEAD \
+         + (RTPS_HEARTBEAT if reliable else 0)
+    wire = 0
+    packets = 0
+    for i in range(messages):
+        datagram = UDP_HEADER + int(ceil(rtps / messages))
+        fragments = int(ceil(datagram / float(mtu - IP_HEADER)))
+        wire += datagram + fragments * (IP_HEADER + ETHERNET_HEADER)
+        packets += fragments
+    return wire, packets
+
+# link parameters with the runner's link_config overrides on TCLinks
+def link_params(link, link_config):
+    params = dict(link["params"])
+    if link["tc"] and link_config:
+        params.update(link_config)
+    return params
+
+# key=node, value=list of (neighbor, resource) over links and media
+def _graph(topology):
+    graph = defaultdict(list)
+    for i, link in enumerate(topology.links):
+        if link["medium"]:
+            medium = "medium %s"%link["medium"]
+            for node in (link["node1"], link["node2"]):
+                if node is not None:
+                    graph[node].append((medium, link["medium"]))
+                    graph[medium].append((node, link["medium"]))
+        else:
+            graph[link["node1"]].append((link["node2"], (i, 1)))
+            graph[link["node2"]].append((link["node1"], (i, 2)))
+    return graph
+
+# parent (node, resource) and hop depth of each node on fewest hop paths
+# from source, searching until every target is found
+def _tree(graph, source, targets):
+    parents = {source: None}
+    depths = {source: 0}
+    remaining = set(targets) - {source}
+    queue = deque([source])
+    while queue and remaining:
+        node = queue.popleft()
+        for neighbor, resource in graph[node]:
+            if neighbor not in parents:
+                parents[neighbor] = (node, resource)
+                depths[neighbor] = depths[node] + 1
+                remaining.discard(neighbor)
+                queue.append(neighbor)
+    return parents, depths
+
+"""
+(resource, copies) of the copies sent from the tree's source to each
+destination, key=destination, value=copies, summed up the tree level by
+level so shared hops are visited once.  A medium counts each copy once,
+as it enters the medium.
+"""
+def _tree_copies(parents, depths, demand):
+    levels = defaultdict(lambda: defaultdict(int))
+    for destination, copies in demand.items():
+        levels[depths[destination]][destination] += copies
+    copies_by_resource = list()
+    for level in range(max(levels) if levels else 0, 0, -1):
+        for node, copies in levels[level].items():
+            parent, resource = parents[node]
+            if not isinstance(resource, str) or node.startswith("medium "):
+                copies_by_resource.append((resource, copies))
+            levels[level - 1][parent] += copies
+    return copies_by_resource
+
+def _resource_name(topology, resource):
+    if isinstance(resource, str):
+        return resource
+    link = topology.links[resource[0]]
+    if resource[1] == 1:
+        return "%s->%s"%(link["node1"], link["node2"])
+    return "%s->%s"%(link["node2"], link["node1"])
+
+# capacity in Mbit/s and queue limit in packets of a resource, else None
+def _limits(topology, resource, link_config):
+    if isinstance(resource, str):
+        modes = [link["params"].get("mode", "g") for link in topology.links
+                 if link["medium"] == resource]
+        return MEDIUM_MBPS.get(modes[0] if modes else "g"), None
+    params = link_params(topology.links[resource[0]], link_config)
+    return params.get("bw"), params.get("max_queue_size")
+
+"""
+the offered load of setup on the recorded topology, optionally with the
+runner's link_config overrides.  Returns a report with offered bytes/s,
+utilization and the largest per-publish burst of packets on each loaded
+link direction and medium, bytes/s sent and received by each host, and
+the robot hosts that cannot reach each other.
+"""
+def estimate_load(setup, topology, link_config=None, mtu=1500):
+    hosts = {robot["robot_name"]: robot["host"] for robot in setup["robots"]}
+    robots_by_role = defaultdict(list)
+    for robot in setup["robots"]:
+        robots_by_role[robot["role"]].append(robot["robot_name"])
+    graph = _graph(topology)
+
+    load = defaultdict(float)
+    burst = defaultdict(int)
+    host_tx = defaultdict(float)
+    host_rx = defaultdict(float)
+    unreachable = set()
+    # the hosts each host sends to, to search only as far as needed
+    targets = defaultdict(set)
+    for publisher in setup["publishers"]:
+        recipients = setup["all_recipients"].get(publisher["topic"], [])
+        for robot_name in robots_by_role[publisher["role"]]:
+            targets[hosts[robot_name]].update(hosts[recipient]
+                                              for recipient in recipients)
+
+    trees = dict()
+    for publisher in setup["publishers"]:
+        recipients = setup["all_recipients"].get(publisher["topic"], [])
+        reliable = publisher["reliability"] == "reliable"
+        for robot_name in robots_by_role[publisher["role"]]:
+            source = hosts[robot_name]
+            if source not in trees:
+                trees[source] = _tree(graph, source, targets[source])
+            parents, depths = trees[source]
+            wire, packets = wire_size(message_bytes(
+                                      int(round(mean_size(publisher))),
+                                      robot_name), reliable, mtu)
+            rate = wire * mean_rate(publisher)
+
+            # copies of one publish to each other host
+            demand = defaultdict(int)
+            for recipient in recipients:
+                destination = hosts[recipient]
+                if destination == source:
+                    continue
+                if destination not in parents:
+                    unreachable.add((source, destination))
+                    continue
+                demand[destination] += 1
+                host_tx[source] += rate
+                host_rx[destination] += rate
+            for resource, copies in _tree_copies(parents, depths, demand):
+                load[resource] += rate * copies
+                burst[resource] = max(burst[resource], packets * copies)
+
+    links = list()
+    for resource in sorted(load, key=load.get, reverse=True):
+        mbps, max_queue_size = _limits(topology, resource, link_config)
+        utilization = load[resource] * 8 / (mbps * 1e6) if mbps else None
+        links.append({"link": _resource_name(topology, resource),
+                      "bytes_per_s": load[resource],
+                      "mbps": mbps,
+                      "utilization": utilization,
+                      "burst_packets": burst[resource],
+                      "max_queue_size": max_queue_size,
+                      "over_capacity": bool(utilization
+                                            and utilization > 1),
+                      "over_queue": bool(max_queue_size and
+                                         burst[resource] > max_queue_size)})
+    return {"links": links,
+            "hosts": {host: {"tx_bytes_per_s": host_tx[host],
+                             "rx_bytes_per_s": host_rx[host]}
+                      for host in sorted(set(host_tx) | set(host_rx))},
+            "unreachable": sorted(unreachable),
+            "overloaded": any(link["over_capacity"] or link["over_queue"]
+                              for link in links)}
+
+def show_report(report, count=20):
+    print("%-32s %12s %8s %7s %12s"%("Link", "Offered kB/s", "Mbit/s",
+                                     "Util %", "Burst/queue"))
+    for link in report["links"][:count]:
+        flags = ""
+        if link["over_capacity"]:
+            flags += " OVER CAPACITY"
+        if link["over_queue"]:
+            flags += " OVER QUEUE"
+        print("%-32s %12.1f %8s %7s %12s%s"%(link["link"],
+              link["bytes_per_s"] / 1000,
+              "-" if link["mbps"] is None else "%g"%link["mbps"],
+              "-" if link["utilization"] is None
+                  else "%.1f"%(link["utilization"] * 100),
+              "%d/%s"%(link["burst_packets"],
+                       link["max_queue_size"] or "-"), flags))
+    if len(report["links"]) > count:
+        print("... %d more links"%(len(report["links"]) - count))
+    hosts = sorted(report["hosts"].items(), reverse=True,
+                   key=lambda item: item[1]["tx_bytes_per_s"]
+                                  + item[1]["rx_bytes_per_s"])
+    print("\n%-32s %12s %12s"%("Host", "Tx kB/s", "Rx kB/s"))
+    for host, rates in hosts[:count]:
+        print("%-32s %12.1f %12.1f"%(host, rates["tx_bytes_per_s"] / 1000,
+                                     rates["rx_bytes_per_s"] / 1000))
+    if len(hosts) > count:
+        print("... %d more hosts"%(len(hosts) - count))
+    for source, destination in report["unreachable"]:
+        print("Warning: no path from %s to %s"%(source, destination))
+    if report["overloaded"]:
+        print("Warning: links are predicted to exceed their capacity or "
+              "queue limit")
+
+def write_report(filename, report):
+    with open(filename, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Estimate the offered load of a "
+                                        "Mininet swarm emulation before "
+                                        "running it")
+    parser.add_argument("py_file", type=str,
+                        help="Python network setup file, or - for the CSV "
+                             "setup file's topology directives")
+    parser.add_argument("csv_file", type=str,
+                        help="CSV communication setup file")
+    parser.add_argument("-l", "--link_config", type=str, default="",
+                        help="JSON link parameters applied to every TCLink, "
+                             "as with mininet_runner")
+    parser.add_argument("-m", "--mtu", type=int, default=1500,
+                        help="MTU in bytes")
+    parser.add_argument("-n", "--count", type=int, default=20,
+                        help="Number of links and hosts to show")
+    parser.add_argument("-j", "--json_file", type=str, default="",
+                        help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    setup = load_setup(expanduser(args.csv_file))
+    py_file = args.py_file
+    if py_file != "-":
+        py_file = abspath(expanduser(py_file))
+    topology = record_topology(py_file, setup)
+    link_config = json.loads(args.link_config) if args.link_config else None
+    report = estimate_load(setup, topology, link_config, args.mtu)
+    show_report(report, args.count)
+    if args.json_file:
+        write_report(expanduser(args.json_file), report)
+    sys.exit(1 if report["overloaded"] else 0)
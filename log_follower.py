@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+import numpy as np
+from os.path import isfile, getsize, join
+from tempfile import TemporaryDirectory
+from log_records import RECORD_DTYPE, RECORD_SIZE, is_binary_log
+from log_reader import log_files, setup_tables, parse_text_lines, \
+                       records_to_events, expand_tx, flow_codes, \
+                       run_window, in_window, \
+                       TX_DTYPE, RX_DTYPE, DATAPOINT_DTYPE, NO_LATENCY
+from bin_aggregates import aggregate, merge_bins
+from latency_sketch import sketch, merge_sketches
+
+# Follow a log, text or binary, one file or per-robot shards, while the
+# experiment is still writing it.
+#
+# Each poll reads only the bytes appended since the last poll, resolves the
+# new rx against tx still pending, and merges the new datapoints into the
+# running bins and latency sketches, so the log is never re-read.  tx that
+# are still unresolved tx_timeout seconds of log time after they were sent
+# are aged out as lost, and rx that arrive before their tx are resolved
+# with their logged latency, or dropped if they have none, after the same
+# timeout, so memory stays bounded.  rx of tx missing from a log written
+# with tx_log_every over 1 are counted that way, but unlike the batch
+# resolve the follower does not infer the lost ones.  With no_join, rx alone
+# are used, with losses inferred from tx_count gaps; late reordered
+# messages are then counted as lost.
+#
+# Results differ from a batch read of the same log in two ways.  A tx aged
+# out as lost stays lost if its rx turns up later, where a batch resolve
+# counts it as received, so set tx_timeout above the longest latency in
+# the log.  Jitter pairs of consecutive arrivals that resolve in different
+# polls are not counted, so jitter counts are slightly lower.
+#
+# With use_window, a finished log's run measurement window is applied as
+# by log_reader.read_datapoints.  A log still being written has none yet.
+#
+# With shards, log time is the watermark up to which every shard has been
+# read, so a shard read ahead of the others does not age out tx early.
+# chunked_aggregates uses the same machinery to read a finished log that
+# does not fit in memory: each poll reads at most read_bytes, aggregates
+# over spill_bytes are moved to disk and merged back one spill at a time at
+# the end, and only a thinned sample of datapoints is kept for the latency
+# points plot.
+class LogFollower():
+
+    def __init__(self, filename, setup_file, bar_period, max_ms_latency,
+                 no_join=False, tx_timeout=10.0, max_points=100000,
+                 thin_points=False, read_bytes=0, use_mmap=False,
+                 spill_bytes=0, use_window=True):
+        self.filename = filename
+        self.robots, self.topics, self.all_recipients = \
+                                             setup_tables(setup_file)
+        self.bar_period = bar_period
+        self.max_ms_latency = max_ms_latency
+        self.no_join = no_join
+        self.tx_timeout_ns = int(tx_timeout * 1e9)
+        self.max_points = max_points
+        self.thin_points = thin_points
+        self.read_bytes = read_bytes
+        self.use_mmap = use_mmap
+        self.spill_bytes = spill_bytes
+
+        self.offsets = dict() # key=log file, value=bytes consumed
+        self.file_latest = dict() # key=log file, value=latest timestamp_ns
+        self.at_end = dict() # key=log file, value=read to its end
+        self.binary = None
+        self.window = run_window(filename) if use_window else None
+        self.t0 = self.window[0] if self.window else None
+        self.latest_ns = None
+
+        # key=(flow, tx_count), value=tx timestamp_ns
+        self.pending_tx = dict()
+        # key=(flow, tx_count), value=(size, latency_ns, rx timestamp_ns)
+        self.early_rx = dict()
+        # tx aged out in the last tx_timeout, whose late rx are disregarded
+        # key=(flow, tx_count), value=tx timestamp_ns
+        self.aged_tx = dict()
+        # no_join, key=flow, value=(last tx_count, its tx timestamp_ns)
+        self.last_counts = dict()
+
+        self.bins = aggregate(np.zeros(0, dtype=DATAPOINT_DTYPE),
+                              bar_period, max_ms_latency)
+        self.sketches = sketch(np.zeros(0, dtype=DATAPOINT_DTYPE),
+                               bar_period, max_ms_latency)
+        self.points = np.zeros(0, dtype=DATAPOINT_DTYPE) # recent datapoints
+        self.point_stride = 1
+        self.point_offset = 0
+        self.spill_dir = None
+        self.spill_files = list()
+        self.spill_bars = list() # the first bar of each spill file
+
+    @property
+    def robot_names(self):
+        return self.robots.names
+
+    @property
+    def topic_names(self):
+        return self.topics.names
+
+    """
+    read bytes appended since the last poll, complete lines or records
+    only, at most read_bytes in total if set.  With complete, the log is
+    finished, so a last line without a newline is read and a partial last
+    record is dropped.
+    """
+    def _read_new(self, complete=False):
+        filenames = [filename for filename in log_files(self.filename)
+                     if isfile(filename)]
+        if self.read_bytes:
+            max_bytes = max(self.read_bytes // max(len(filenames), 1),
+                            RECORD_SIZE)
+        tx_parts = list()
+        rx_parts = list()
+        for filename in filenames:
+            size = getsize(filename)
+            offset = self.offsets.get(filename, 0)
+            if size < offset:
+                offset = 0 # the file was restarted
+            if size == offset:
+                self.at_end[filename] = True
+                continue
+            if self.binary is None:
+                self.binary = is_binary_log(filename)
+                if self.binary and self.all_recipients is None:
+                    raise RuntimeError("Binary logs require --setup_file")
+            end = size
+            if self.read_bytes:
+                end = min(size, offset + max_bytes)
+
+            if self.binary:
+                partial = (end - offset) % RECORD_SIZE
+                end -= partial
+                if self.use_mmap:
+                    records = np.memmap(filename, dtype=np.dtype(RECORD_DTYPE),
+                                        mode="r", offset=offset,
+                                        shape=((end - offset) // RECORD_SIZE,))
+                else:
+                    with open(filename, "rb") as f:
+                        f.seek(offset)
+                        records = np.frombuffer(f.read(end - offset),
+                                                dtype=np.dtype(RECORD_DTYPE))
+                tx, rx = records_to_events(records)
+                del records
+                tx_chunk = [tx]
+                rx_chunk = [rx]
+                end_offset = end
+                if complete and partial and end + partial == size:
+                    print("disregarding %d bytes of a partial record at the "
+                          "end of %s"%(partial, filename))
+                    end_offset = size
+            else:
+                with open(filename, "rb") as f:
+                    f.seek(offset)
+                    data = f.read(end - offset)
+                if not (complete and end == size):
+                    data = data[:data.rfind(b"\n") + 1]
+                if not data and end < size:
+                    # a line longer than max_bytes
+                    with open(filename, "rb") as f:
+                        f.seek(offset)
+                        data = f.readline()
+                tx_chunk = list()
+                rx_chunk = list()
+                if data:
+                    tx_chunk, rx_chunk = parse_text_lines(
+                        data.decode().splitlines(keepends=True),
+                        self.robots, self.topics)
+                end_offset = offset + len(data)
+
+            # log time read so far in this file
+            for part in tx_chunk + rx_chunk:
+                if len(part):
+                    self.file_latest[filename] = max(
+                             self.file_latest.get(filename, 0),
+                             int(part["timestamp_ns"].max()))
+            tx_parts.extend(tx_chunk)
+            rx_parts.extend(rx_chunk)
+            self.offsets[filename] = end_offset
+            self.at_end[filename] = end_offset == size
+
+        tx = np.concatenate([np.zeros(0, dtype=TX_DTYPE)] + tx_parts)
+        rx = np.concatenate([np.zeros(0, dtype=RX_DTYPE)] + rx_parts)
+        return tx, rx
+
+    # log time up to which all files have been read, files that are read to
+    # their end do not hold it back
+    def _watermark(self):
+        behind = [latest for filename, latest in self.file_latest.items()
+                  if not self.at_end.get(filename)]
+        if behind:
+            return min(behind)
+        return max(self.file_latest.values())
+
+    def _datapoints(self, rows):
+        # rows of flow, tx timestamp_ns, size, latency, loss
+        datapoints = np.zeros(len(rows), dtype=DATAPOINT_DTYPE)
+        if not rows:
+            return datapoints
+        flows, tx_ns, sizes, latencies, losses = [np.array(column)
+                                                  for column in zip(*rows)]
+        datapoints["from"] = flows >> 32
+        datapoints["to"] = (flows >> 16) & 0xffff
+        datapoints["topic"] = flows & 0xffff
+        datapoints["time"] = (tx_ns - self.t0) / 1e9
+        datapoints["size"] = sizes
+        datapoints["latency"] = latencies
+        datapoints["loss"] = losses
+        if self.window:
+            datapoints = in_window(datapoints, self.window)
+        return datapoints
+
+    def _resolve(self, tx, rx):
+        rows = list()
+        for flow, count, tx_ns in zip(flow_codes(tx).tolist(),
+                                      tx["tx_count"].tolist(),
+                                      tx["timestamp_ns"].tolist()):
+            key = (flow, count)
+            if key in self.early_rx:
+                size, _latency_ns, rx_ns = self.early_rx.pop(key)
+                rows.append((flow, tx_ns, size, (rx_ns - tx_ns) / 1e6, 0))
+            else:
+                self.pending_tx[key] = tx_ns
+
+        for flow, count, size, latency_ns, rx_ns in zip(
+                             flow_codes(rx).tolist(), rx["tx_count"].tolist(),
+                             rx["size"].tolist(), rx["latency_ns"].tolist(),
+                             rx["timestamp_ns"].tolist()):
+            key = (flow, count)
+            if key in self.pending_tx:
+                tx_ns = self.pending_tx.pop(key)
+                rows.append((flow, tx_ns, size, (rx_ns - tx_ns) / 1e6, 0))
+            elif key not in self.aged_tx:
+                self.early_rx[key] = (size, latency_ns, rx_ns)
+        return rows
+
+    # rows of rx whose tx was not logged, from their logged latency
+    def _unjoined_rx(self, keys):
+        rows = list()
+        for key in keys:
+            size, latency_ns, rx_ns = self.early_rx.pop(key)
+            if latency_ns != NO_LATENCY:
+                rows.append((key[0], rx_ns - latency_ns, size,
+                             latency_ns / 1e6, 0))
+        return rows
+
+    def _resolve_rx_only(self, rx):
+        rx = rx[rx["latency_ns"] != NO_LATENCY]
+        flows = flow_codes(rx)
+        order = np.lexsort((rx["tx_count"], flows))
+        rows = list()
+        for flow, count, size, latency_ns, rx_ns in zip(
+                             flows[order].tolist(),
+                             rx["tx_count"][order].tolist(),
+                             rx["size"][order].tolist(),
+                             rx["latency_ns"][order].tolist(),
+                             rx["timestamp_ns"][order].tolist()):
+            tx_ns = rx_ns - latency_ns
+            last_count, last_tx_ns = self.last_counts.get(flow, (0, tx_ns))
+            if count <= last_count:
+                continue # already counted as lost
+            for missing in range(last_count + 1, count):
+                # interpolate the tx time of the lost message
+                fraction = (missing - last_count) / (count - last_count)
+                rows.append((flow, int(last_tx_ns + fraction
+                                       * (tx_ns - last_tx_ns)), 0, 0, 100))
+            rows.append((flow, tx_ns, size, latency_ns / 1e6, 0))
+            self.last_counts[flow] = (count, tx_ns)
+        return rows
+
+    def _age_out(self):
+        cutoff = self.latest_ns - self.tx_timeout_ns
+        rows = list()
+        for key, tx_ns in list(self.aged_tx.items()):
+            if tx_ns < cutoff - self.tx_timeout_ns:
+                del self.aged_tx[key]
+        for key, tx_ns in list(self.pending_tx.items()):
+            if tx_ns < cutoff:
+                del self.pending_tx[key]
+                self.aged_tx[key] = tx_ns
+                rows.append((key[0], tx_ns, 0, 0, 100))
+        late = [key for key, (_size, _latency_ns, rx_ns)
+                in self.early_rx.items() if rx_ns < cutoff]
+        rows.extend(self._unjoined_rx(late))
+        return rows
+
+    # read and resolve new log data, returns the number of new datapoints
+    def poll(self, complete=False):
+        tx, rx = self._read_new(complete)
+        if not self.no_join:
+            tx = expand_tx(tx, self.all_recipients, self.robots.name_ids(),
+                           self.topics.names)
+        if not len(tx) and not len(rx):
+            return 0
+
+        # log time
+        self.latest_ns = max(self.latest_ns or 0, self._watermark())
+        if self.t0 is None:
+            if len(tx):
+                self.t0 = int(tx["timestamp_ns"].min())
+            else:
+                self.t0 = int((rx["timestamp_ns"] - np.maximum(
+                               rx["latency_ns"], 0)).min())
+
+        if self.no_join:
+            rows = self._resolve_rx_only(rx)
+        else:
+            rows = self._resolve(tx, rx) + self._age_out()
+        datapoints = self._datapoints(rows)
+        self._merge(datapoints)
+        return len(datapoints)
+
+    # merge datapoints into the running aggregates and the kept points
+    def _merge(self, datapoints):
+        self.bins = merge_bins([self.bins, aggregate(datapoints,
+                                   self.bar_period, self.max_ms_latency)])
+        self.sketches = merge_sketches([self.sketches, sketch(datapoints,
+                                   self.bar_period, self.max_ms_latency)])
+        if self.spill_bytes and self.bins.nbytes + self.sketches.nbytes \
+                                > self.spill_bytes:
+            self._spill()
+
+        if not self.thin_points:
+            # the most recent points
+            self.points = np.concatenate([self.points, datapoints]
+                                         )[len(self.points) + len(datapoints)
+                                           - self.max_points:]
+            return
+
+        # every point_stride'th point of the run, doubling the stride to
+        # stay within max_points
+        start = (-self.point_offset) % self.point_stride
+        self.point_offset += len(datapoints)
+        self.points = np.concatenate([self.points,
+                                      datapoints[start::self.point_stride]])
+        while len(self.points) > self.max_points:
+            self.points = self.points[::2]
+            self.point_stride *= 2
+
+    # move the running aggregates to disk
+    def _spill(self):
+        if self.spill_dir is None:
+            self.spill_dir = TemporaryDirectory(prefix="log_follower_")
+        spill_file = join(self.spill_dir.name,
+                          "%d.npz"%len(self.spill_files))
+        np.savez(spill_file, bins=self.bins, sketches=self.sketches)
+        self.spill_files.append(spill_file)
+        self.spill_bars.append(_first_bar(self.bins))
+        self.bins = self.bins[:0]
+        self.sketches = self.sketches[:0]
+
+    """
+    merge the spilled name arrays and current with merge, loading one spill
+    at a time.  Rows with bars before the first bar of every later part
+    cannot change, so they are set aside and only the rest is merged with
+    the next spill.  Spills are written in log time order, so that is
+    about one spill's worth.
+    """
+    def _merge_spilled(self, name, merge, current):
+        later_bars = self.spill_bars[1:] + [_first_bar(current)]
+        settled = list()
+        pending = current[:0]
+        for spill_file, later_bar in zip(self.spill_files,
+                                         np.minimum.accumulate(
+                                             later_bars[::-1])[::-1]):
+            with np.load(spill_file) as spill:
+                pending = merge([pending, spill[name]])
+            done = pending["bar"] < later_bar
+            settled.append(pending[done])
+            pending = pending[~done]
+        merged = np.concatenate(settled + [merge([pending, current])])
+        # groups are in one part each, already in order within the group
+        return merged[np.lexsort((merged["bar"], merged["flow"]))]
+
+    # True when all log files have been read to their end
+    def at_log_end(self):
+        return bool(self.at_end) and all(self.at_end.values())
+
+    # read a finished log to its end, then finish
+    def read_all(self):
+        if not any([isfile(filename)
+                    for filename in log_files(self.filename)]):
+            raise RuntimeError("No log files for %s"%self.filename)
+        while not self.at_log_end():
+            offsets = dict(self.offsets)
+            self.poll(complete=True)
+            if self.offsets == offsets:
+                break # no progress, the log changed while being read
+        self.finish()
+
+    """
+    end of the log: count tx still pending as lost, as a batch read does,
+    and merge spilled aggregates back into bins and sketches.
+    """
+    def finish(self):
+        if not self.no_join and (self.pending_tx or self.early_rx):
+            early_count = len(self.early_rx)
+            rows = self._unjoined_rx(list(self.early_rx))
+            if len(rows) < early_count:
+                print("disregarding %d rx without tx"
+                      %(early_count - len(rows)))
+            self._merge(self._datapoints(rows + [(key[0], tx_ns, 0, 0, 100)
+                        for key, tx_ns in self.pending_tx.items()]))
+            self.pending_tx.clear()
+            self.early_rx.clear()
+
+        if self.spill_files:
+            self.bins = self._merge_spilled("bins", merge_bins, self.bins)
+            self.sketches = self._merge_spilled("sketches", merge_sketches,
+                                                self.sketches)
+        self.spill_files = list()
+        self.spill_bars = list()
+        if self.spill_dir is not None:
+            self.spill_dir.cleanup()
+            self.spill_dir = None
+
+# the first bar of bins, after every bar if there are none
+def _first_bar(bins):
+    if not len(bins):
+        return np.iinfo(np.int64).max
+    return int(bins["bar"].min())
+
+"""
+read a whole log in chunks with memory bounded by about memory_limit
+bytes.  Returns a finished LogFollower holding bins, sketches and an
+evenly thinned sample of datapoints.
+"""
+def chunked_aggregates(filename, setup_file, bar_period, max_ms_latency,
+                       no_join=False, tx_timeout=10.0,
+                       memory_limit=1<<30, use_mmap=False, use_window=True):
+    # parsing expands a text chunk several fold
+    follower = LogFollower(filename, setup_file, bar_period, max_ms_latency,
+                           no_join, tx_timeout,
+                           max_points=max(memory_limit // 200, 1000),
+                           thin_points=True,
+                           read_bytes=max(memory_limit // 16, 1<<20),
+                           use_mmap=use_mmap,
+                           spill_bytes=max(memory_limit // 8, 1<<20),
+                           use_window=use_window)
+    follower.read_all()
+    return follower
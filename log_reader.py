@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+import os
+import json
+from hashlib import blake2b
+import numpy as np
+from log_records import RECORD_DTYPE, TX, RX, ALL_RECIPIENTS, \
+                        name_tables, name_ids, is_binary_log
+from merge_logs import shard_files, shard_dir
+from setup_reader import load_setup
+
+# Read robot logs, text or binary, one file or per-robot shards, into NumPy
+# structured arrays in a single pass, then resolve rx against tx with a
+# vectorized sort and search on (from, to, topic, tx_count).
+#
+# Text rows, by number of fields:
+#   4: tx once per publish: from, topic, tx_count, ts
+#   5: legacy tx per recipient: from, to, topic, tx_count, ts
+#   7: legacy rx: from, to, topic, tx_count, rx_count, size, ts
+#   8: rx: from, to, topic, tx_count, rx_count, size, latency ms, ts
+#
+# Robots and topics are interned as IDs into robot_names and topic_names.
+# When a setup file is given, the IDs match the binary log record IDs.
+#
+# A timed run writes its measurement window to <log>.run.json, see
+# mininet_runner.  When it exists, datapoints are kept only for messages
+# sent within the window, warmup and shutdown excluded, and times are from
+# the start of the window.
+
+# tx events, to is ALL_RECIPIENTS until expanded
+TX_DTYPE = [("from", "u2"), ("to", "u2"), ("topic", "u2"),
+            ("tx_count", "u4"), ("timestamp_ns", "i8")]
+
+# rx events, latency_ns is NO_LATENCY for legacy rows that do not log it
+RX_DTYPE = [("from", "u2"), ("to", "u2"), ("topic", "u2"),
+            ("tx_count", "u4"), ("size", "u4"), ("latency_ns", "i8"),
+            ("timestamp_ns", "i8")]
+NO_LATENCY = -1
+
+# resolved datapoints, one per message per recipient: time is the tx time
+# in seconds since the first tx, latency is in ms, loss is 0 or 100 %
+DATAPOINT_DTYPE = [("from", "u2"), ("to", "u2"), ("topic", "u2"),
+                   ("time", "f8"), ("size", "i8"), ("latency", "f8"),
+                   ("loss", "f8")]
+
+# bump when the datapoint layout or resolution changes to invalidate caches
+CACHE_VERSION = 2
+
+# the log files of one log, sharded or not
+def log_files(filename):
+    return shard_files(filename) or [filename]
+
+def is_binary_input(filename):
+    return any([is_binary_log(name) for name in log_files(filename)])
+
+# names interned as IDs in order of first appearance
+class NameTable():
+    def __init__(self, names):
+        self.names = list(names)
+        self.ids = {name.encode(): i for i, name in enumerate(self.names)}
+
+    # IDs of a column of byte string names, looking up only its unique
+    # names, new ones in order of first appearance in the column
+    def codes(self, column):
+        ids = self.ids
+        uniques, first, inverse = np.unique(column, return_index=True,
+                                            return_inverse=True)
+        names = uniques.tolist()
+        unique_codes = np.zeros(len(names), dtype=np.uint16)
+        for i in np.argsort(first, kind="stable").tolist():
+            name = names[i]
+            if name not in ids:
+                ids[name] = len(self.names)
+                self.names.append(name.decode())
+            unique_codes[i] = ids[name]
+        return unique_codes[inverse.reshape(-1)]
+
+    # key=str name, value=ID
+    def name_ids(self):
+        return name_ids(self.names)
+
+# text row dtypes by number of fields, name fields are sized per chunk
+def _row_dtype(field_count, width):
+    name = "S%d"%width
+    if field_count == 4:
+        return [("from", name), ("topic", name), ("tx_count", "i8"),
+                ("ts", "f8")]
+    if field_count == 5:
+        return [("from", name), ("to", name), ("topic", name),
+                ("tx_count", "i8"), ("ts", "f8")]
+    if field_count == 7:
+        return [("from", name), ("to", name), ("topic", name),
+                ("tx_count", "i8"), ("rx_count", "i8"), ("size", "i8"),
+                ("ts", "f8")]
+    return [("from", name), ("to", name), ("topic", name),
+            ("tx_count", "i8"), ("rx_count", "i8"), ("size", "i8"),
+            ("latency", "f8"), ("ts", "f8")]
+
+# parse lines with the C parser, disregarding lines that do not parse
+def _load_rows(lines, dtype):
+    try:
+        return np.loadtxt(lines, delimiter=",", dtype=dtype, ndmin=1)
+    except ValueError:
+        good_lines = list()
+        for line in lines:
+            try:
+                np.loadtxt([line], delimiter=",", dtype=dtype, ndmin=1)
+                good_lines.append(line)
+            except ValueError:
+                print("disregarding row", line.rstrip("\n"))
+        if not good_lines:
+            return np.zeros(0, dtype=dtype)
+        return np.loadtxt(good_lines, delimiter=",", dtype=dtype, ndmin=1)
+
+def _seconds_to_ns(seconds):
+    return np.round(seconds * 1e9).astype(np.int64)
+
+# parse complete text lines into lists of tx and rx arrays
+def parse_text_lines(lines, robots, topics):
+    groups = {4: list(), 5: list(), 7: list(), 8: list()}
+    for line in lines:
+        field_count = line.count(",") + 1
+        if field_count in groups:
+            groups[field_count].append(line)
+        elif line.strip():
+            print("disregarding row", line.rstrip("\n"))
+    width = max(map(len, lines))
+
+    tx_parts = list()
+    rx_parts = list()
+    for field_count, group in groups.items():
+        if not group:
+            continue
+        rows = _load_rows(group, _row_dtype(field_count, width))
+        if field_count == 4 or field_count == 5:
+            tx = np.zeros(len(rows), dtype=TX_DTYPE)
+            tx["from"] = robots.codes(rows["from"])
+            if field_count == 4:
+                tx["to"] = ALL_RECIPIENTS
+            else:
+                tx["to"] = robots.codes(rows["to"])
+            tx["topic"] = topics.codes(rows["topic"])
+            tx["tx_count"] = rows["tx_count"]
+            tx["timestamp_ns"] = _seconds_to_ns(rows["ts"])
+            tx_parts.append(tx)
+        else:
+            rx = np.zeros(len(rows), dtype=RX_DTYPE)
+            rx["from"] = robots.codes(rows["from"])
+            rx["to"] = robots.codes(rows["to"])
+            rx["topic"] = topics.codes(rows["topic"])
+            rx["tx_count"] = rows["tx_count"]
+            rx["size"] = rows["size"]
+            if field_count == 7:
+                rx["latency_ns"] = NO_LATENCY
+            else:
+                rx["latency_ns"] = np.round(rows["latency"] * 1e6)
+            rx["timestamp_ns"] = _seconds_to_ns(rows["ts"])
+            rx_parts.append(rx)
+    return tx_parts, rx_parts
+
+def _read_text(filenames, robots, topics, chunk_bytes):
+    tx_parts = list()
+    rx_parts = list()
+    for filename in filenames:
+        with open(filename) as f:
+            while True:
+                lines = f.readlines(chunk_bytes)
+                if not lines:
+                    break
+                tx_chunk, rx_chunk = parse_text_lines(lines, robots, topics)
+                tx_parts.extend(tx_chunk)
+                rx_parts.extend(rx_chunk)
+    return tx_parts, rx_parts
+
+# convert binary log records into tx and rx arrays
+def records_to_events(records):
+    tx_records = records[records["kind"] == TX]
+    tx = np.zeros(len(tx_records), dtype=TX_DTYPE)
+    for name, _ in TX_DTYPE:
+        tx[name] = tx_records[name]
+    rx_records = records[records["kind"] == RX]
+    rx = np.zeros(len(rx_records), dtype=RX_DTYPE)
+    for name, _ in RX_DTYPE:
+        rx[name] = rx_records[name]
+    return tx, rx
+
+def _read_binary(filenames):
+    tx_parts = list()
+    rx_parts = list()
+    for filename in filenames:
+        tx, rx = records_to_events(np.fromfile(filename,
+                                               dtype=np.dtype(RECORD_DTYPE)))
+        tx_parts.append(tx)
+        rx_parts.append(rx)
+    return tx_parts, rx_parts
+
+# expand tx events logged once per publish into one per recipient
+def expand_tx(tx, all_recipients, robot_ids, topic_names):
+    is_broadcast = tx["to"] == ALL_RECIPIENTS
+    if not is_broadcast.any():
+        return tx
+    if all_recipients is None:
+        raise RuntimeError("tx rows logged once per publish "
+                           "require --setup_file")
+
+    # recipient IDs of all topics, flattened, with per-topic offsets
+    recipient_counts = np.array([len(all_recipients.get(topic, []))
+                                 for topic in topic_names], dtype=np.int64)
+    recipient_offsets = np.concatenate([[0], np.cumsum(recipient_counts)])
+    recipient_ids = np.array([robot_ids[name] for topic in topic_names
+                              for name in all_recipients.get(topic, [])],
+                             dtype=np.uint16)
+
+    broadcast = tx[is_broadcast]
+    counts = recipient_counts[broadcast["topic"]]
+    expanded = np.repeat(broadcast, counts)
+
+    # position of each expanded event within its topic's recipients
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    positions = np.arange(len(expanded)) - starts
+    expanded["to"] = recipient_ids[
+             np.repeat(recipient_offsets[broadcast["topic"]], counts)
+             + positions]
+    return np.concatenate([tx[~is_broadcast], expanded])
+
+# robot and topic name tables and all_recipients, from the setup file if any
+def setup_tables(setup_file):
+    if setup_file:
+        setup = load_setup(setup_file)
+        robot_names, topic_names = name_tables(setup)
+        all_recipients = setup["all_recipients"]
+    else:
+        robot_names = list()
+        topic_names = list()
+        all_recipients = None
+    return NameTable(robot_names), NameTable(topic_names), all_recipients
+
+"""
+read tx and rx arrays from a text or binary log, sharded or not.
+Returns tx, rx, robot_names, topic_names.  Binary logs, and expanding tx
+rows logged once per publish, require the setup file.
+"""
+def read_events(filename, setup_file="", expand=True, chunk_bytes=1<<24):
+    filenames = log_files(filename)
+    robots, topics, all_recipients = setup_tables(setup_file)
+
+    if is_binary_input(filename):
+        if not setup_file:
+            raise RuntimeError("Binary logs require --setup_file")
+        tx_parts, rx_parts = _read_binary(filenames)
+    else:
+        tx_parts, rx_parts = _read_text(filenames, robots, topics,
+                                        chunk_bytes)
+
+    tx = np.concatenate([np.zeros(0, dtype=TX_DTYPE)] + tx_parts)
+    rx = np.concatenate([np.zeros(0, dtype=RX_DTYPE)] + rx_parts)
+    if expand:
+        tx = expand_tx(tx, all_recipients, robots.name_ids(), topics.names)
+    return tx, rx, robots.names, topics.names
+
+# int64 code for each from, to, topic
+def flow_codes(events):
+    return (events["from"].astype(np.int64) << 32) \
+         | (events["to"].astype(np.int64) << 16) | events["topic"]
+
+# "from, to, topic" label of each flow code in flows
+def flow_labels(flows, robot_names, topic_names):
+    return ["%s, %s, %s"%(robot_names[flow >> 32],
+                          robot_names[(flow >> 16) & 0xffff],
+                          topic_names[flow & 0xffff])
+            for flow in flows.tolist()]
+
+# ways of grouping flows, see group_datapoints
+GROUP_BY = ["flow", "topic", "role", "publisher"]
+
+# name of a group that covers all robots or all topics
+ANY_NAME = "*"
+
+"""
+robot and topic ID maps that group flows by topic, role or publisher, so
+that figures of large swarms stay readable.  Grouped flows are labeled
+like flows, from, to and topic being IDs into the returned robot_names
+and topic_names:
+  topic: *, *, topic
+  role: from role, to role, topic, requires robot_roles
+  publisher: from, *, topic
+robot_roles: key=robot name, value=role.  Returns from_ids, to_ids,
+robot_names, topic_names where from_ids and to_ids map old to new IDs.
+"""
+def _group_maps(robot_names, group_by, robot_roles):
+    robot_ids = np.arange(len(robot_names), dtype=np.uint16)
+    any_ids = np.zeros(len(robot_names), dtype=np.uint16)
+    if group_by == "flow":
+        return robot_ids, robot_ids, robot_names
+    if group_by == "topic":
+        return any_ids, any_ids, [ANY_NAME]
+    if group_by == "publisher":
+        return robot_ids, any_ids + len(robot_names), \
+               list(robot_names) + [ANY_NAME]
+    if group_by == "role":
+        if robot_roles is None:
+            raise RuntimeError("--group_by role requires --setup_file")
+        role_names = sorted(set(robot_roles.values()))
+        role_ids = name_ids(role_names)
+        # robots not in the setup file form their own group
+        robot_role_ids = np.array([role_ids.get(robot_roles.get(name),
+                                   len(role_names)) for name in robot_names],
+                                  dtype=np.uint16)
+        return robot_role_ids, robot_role_ids, role_names + [ANY_NAME]
+    raise RuntimeError("unknown group_by %s"%group_by)
+
+# datapoints with from and to rewritten to groups, and the group names
+def group_datapoints(datapoints, robot_names, group_by, robot_roles=None):
+    from_ids, to_ids, group_names = _group_maps(robot_names, group_by,
+                                                robot_roles)
+    grouped = datapoints.copy()
+    grouped["from"] = from_ids[datapoints["from"]]
+    grouped["to"] = to_ids[datapoints["to"]]
+    return grouped, group_names
+
+# flow codes rewritten to groups, and the group names
+def group_flows(flows, robot_names, group_by, robot_roles=None):
+    from_ids, to_ids, group_names = _group_maps(robot_names, group_by,
+                                                robot_roles)
+    grouped = (from_ids[flows >> 32].astype(np.int64) << 32) \
+            | (to_ids[(flows >> 16) & 0xffff].astype(np.int64) << 16) \
+            | (flows & 0xffff)
+    return grouped, group_names
+
+# key=robot name, value=role, from the setup file if any
+def robot_roles(setup_file):
+    if not setup_file:
+        return None
+    return {robot["robot_name"]: robot["role"]
+            for robot in load_setup(setup_file)["robots"]}
+
+"""
+size models of the publishers whose message size is not fixed, from the
+setup file if any.  Keyed by the names flows are labeled with whether
+grouped or not: key=(publishing robot, role or ANY_NAME, topic), value=
+model text, e.g. "uniform 100 1000".
+"""
+def size_models(setup_file):
+    models = dict()
+    if not setup_file:
+        return models
+    setup = load_setup(setup_file)
+    for publisher in setup["publishers"]:
+        name, *args = publisher["sizes"]
+        if name == "fixed":
+            continue
+        if name == "trace":
+            args = [os.path.basename(args[0])]
+        text = " ".join([name] + [str(arg) for arg in args])
+        topic = publisher["topic"]
+        models[(publisher["role"], topic)] = text
+        for robot in setup["robots"]:
+            if robot["role"] == publisher["role"]:
+                models[(robot["robot_name"], topic)] = text
+        if models.get((ANY_NAME, topic), text) != text:
+            text = "variable size"
+        models[(ANY_NAME, topic)] = text
+    return models
+
+"""
+tx missing from each flow's tx_count sequence, which starts at 1, as when
+robots log only every Nth publish with tx_log_every.  The missing tx are
+placed in time from the logged tx and from the tx times of rx that log
+their latency, interpolating between them by tx_count.  Missing tx after
+the last logged tx or rx of a flow cannot be seen.  Flows with neither are
+left alone, so their rx are disregarded.
+"""
+def infer_tx(tx, rx):
+    tx_flows = flow_codes(tx)
+    timed = rx["latency_ns"] != NO_LATENCY
+    rx_flows = flow_codes(rx)
+    tx_order = np.lexsort((tx["tx_count"], tx_flows))
+    rx_order = np.lexsort((rx["tx_count"], rx_flows))
+    tx_flows = tx_flows[tx_order]
+    rx_flows = rx_flows[rx_order]
+    rx_timed = timed[rx_order]
+    rx_tx_times = (rx["timestamp_ns"] - rx["latency_ns"])[rx_order]
+
+    parts = list()
+    for flow in np.unique(np.concatenate([tx_flows, rx_flows])).tolist():
+        tx_range = slice(*np.searchsorted(tx_flows, [flow, flow + 1]))
+        rx_range = slice(*np.searchsorted(rx_flows, [flow, flow + 1]))
+        logged = tx["tx_count"][tx_order[tx_range]].astype(np.int64)
+        received = rx["tx_count"][rx_order[rx_range]].astype(np.int64)
+        last = max(logged.max(initial=0), received.max(initial=0))
+        missing = np.setdiff1d(np.arange(1, last + 1), logged)
+        if not len(missing):
+            continue
+
+        # tx times known by tx_count, logged tx first
+        timed_range = rx_timed[rx_range]
+        counts, first = np.unique(np.concatenate([logged,
+                                                  received[timed_range]]),
+                                  return_index=True)
+        if not len(counts):
+            continue
+        times = np.concatenate([tx["timestamp_ns"][tx_order[tx_range]],
+                                rx_tx_times[rx_range][timed_range]])[first]
+        missing = missing[missing <= counts[-1]]
+        inferred = np.zeros(len(missing), dtype=TX_DTYPE)
+        inferred["from"] = flow >> 32
+        inferred["to"] = (flow >> 16) & 0xffff
+        inferred["topic"] = flow & 0xffff
+        inferred["tx_count"] = missing
+        inferred["timestamp_ns"] = np.round(np.interp(missing, counts,
+                                                      times))
+        parts.append(inferred)
+    return np.concatenate([np.zeros(0, dtype=TX_DTYPE)] + parts)
+
+"""
+resolve rx against tx, giving one datapoint per tx per recipient.  tx
+missing from the log are inferred from tx_count gaps, see infer_tx.  Times
+are from t0_ns, or from the first tx if None.
+"""
+def resolve(tx, rx, t0_ns=None):
+    inferred = infer_tx(tx, rx)
+    if len(inferred):
+        print("inferred %d tx missing from the log"%len(inferred))
+        tx = np.concatenate([tx, inferred])
+    datapoints = np.zeros(len(tx), dtype=DATAPOINT_DTYPE)
+    if not len(tx):
+        return datapoints
+    t0 = tx["timestamp_ns"].min() if t0_ns is None else t0_ns
+
+    # key = flow code, tx_count
+    _, codes = np.unique(np.concatenate([flow_codes(tx), flow_codes(rx)]),
+                         return_inverse=True)
+    keys = (codes.astype(np.int64) << 32) \
+         | np.concatenate([tx["tx_count"], rx["tx_count"]])
+    tx_keys = keys[:len(tx)]
+    rx_keys = keys[len(tx):]
+
+    # find each rx's tx with a sorted search
+    order = np.argsort(tx_keys, kind="stable")
+    sorted_keys = tx_keys[order]
+    index = np.minimum(np.searchsorted(sorted_keys, rx_keys), len(tx) - 1)
+    found = sorted_keys[index] == rx_keys
+    if not found.all():
+        print("disregarding %d rx without tx"%(~found).sum())
+    tx_index = order[index[found]]
+
+    for name in ("from", "to", "topic"):
+        datapoints[name] = tx[name]
+    datapoints["time"] = (tx["timestamp_ns"] - t0) / 1e9
+    datapoints["size"][tx_index] = rx["size"][found]
+    datapoints["latency"][tx_index] = (rx["timestamp_ns"][found]
+                                    - tx["timestamp_ns"][tx_index]) / 1e6
+    datapoints["loss"] = 100
+    datapoints["loss"][tx_index] = 0
+    return datapoints
+
+"""
+get datapoints from rx alone using the latency logged by the receiver, so
+no tx join is needed.  Lost messages are inferred from gaps in each flow's
+tx_count sequence, which starts at 1, and are placed in time by
+interpolating the tx times of the received messages around them.  Losses
+after the last received message of a flow cannot be seen.  Times are from
+t0_ns, or from the first tx if None.
+"""
+def resolve_rx_only(rx, t0_ns=None):
+    rx = rx[rx["latency_ns"] != NO_LATENCY]
+    if not len(rx):
+        return np.zeros(0, dtype=DATAPOINT_DTYPE)
+
+    tx_times_ns = rx["timestamp_ns"] - rx["latency_ns"]
+    t0 = tx_times_ns.min() if t0_ns is None else t0_ns
+    flows = flow_codes(rx)
+    order = np.lexsort((rx["tx_count"], flows))
+    rx = rx[order]
+    flows = flows[order]
+    tx_times = (tx_times_ns[order] - t0) / 1e9
+
+    received = np.zeros(len(rx), dtype=DATAPOINT_DTYPE)
+    for name in ("from", "to", "topic"):
+        received[name] = rx[name]
+    received["time"] = tx_times
+    received["size"] = rx["size"]
+    received["latency"] = rx["latency_ns"] / 1e6
+
+    parts = [received]
+    starts = np.flatnonzero(np.concatenate([[True], flows[1:] != flows[:-1]]))
+    ends = np.concatenate([starts[1:], [len(rx)]])
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        counts = rx["tx_count"][start:end].astype(np.int64)
+        missing = np.setdiff1d(np.arange(1, counts[-1] + 1), counts)
+        lost = np.zeros(len(missing), dtype=DATAPOINT_DTYPE)
+        for name in ("from", "to", "topic"):
+            lost[name] = rx[name][start]
+        lost["time"] = np.interp(missing, counts, tx_times[start:end])
+        lost["loss"] = 100
+        parts.append(lost)
+    return np.concatenate(parts)
+
+# the run metadata file of a log, given the log or its shard directory
+def run_file(filename):
+    filename = filename.rstrip("/")
+    if filename.endswith(shard_dir("")):
+        filename = filename[:-len(shard_dir(""))]
+    return "%s.run.json"%filename
+
+# (start_ns, end_ns) measurement window of a log's run, None if not timed
+def run_window(filename):
+    if not os.path.isfile(run_file(filename)):
+        return None
+    with open(run_file(filename)) as f:
+        metadata = json.load(f)
+    if "start_ns" not in metadata or "end_ns" not in metadata:
+        return None
+    return metadata["start_ns"], metadata["end_ns"]
+
+# datapoints with times from the window start sent within the window
+def in_window(datapoints, window):
+    start_ns, end_ns = window
+    return datapoints[(datapoints["time"] >= 0)
+                      & (datapoints["time"] < (end_ns - start_ns) / 1e9)]
+
+"""
+get datapoints, robot_names, topic_names from a log.  With no_join, use
+the latency logged by the receivers instead of resolving rx against tx.
+With use_window, keep only messages sent within the run's measurement
+window, if the log has one.
+"""
+def read_datapoints(filename, setup_file="", no_join=False, use_window=True):
+    tx, rx, robot_names, topic_names = read_events(filename, setup_file,
+                                                   expand=not no_join)
+    window = run_window(filename) if use_window else None
+    t0_ns = window[0] if window else None
+    if no_join:
+        datapoints = resolve_rx_only(rx, t0_ns)
+    else:
+        datapoints = resolve(tx, rx, t0_ns)
+    if window:
+        datapoints = in_window(datapoints, window)
+    return datapoints, robot_names, topic_names
+
+# cache key of a log, its setup file and its run metadata: size, mtime and
+# a hash of the start and end of each file, so a changed log is detected
+# without reading all of it
+def _cache_key(filename, setup_file, no_join, use_window,
+               sample_bytes=1<<20):
+    digest = blake2b(digest_size=16)
+    digest.update(("%d,%s,%s"%(CACHE_VERSION, no_join,
+                               use_window)).encode())
+    names = log_files(filename) + ([setup_file] if setup_file else [])
+    if use_window and os.path.isfile(run_file(filename)):
+        names.append(run_file(filename))
+    for name in names:
+        stat = os.stat(name)
+        digest.update(("%s,%d,%d"%(name, stat.st_size,
+                                   stat.st_mtime_ns)).encode())
+        with open(name, "rb") as f:
+            digest.update(f.read(sample_bytes))
+            if stat.st_size > sample_bytes:
+                f.seek(max(sample_bytes, stat.st_size - sample_bytes))
+                digest.update(f.read(sample_bytes))
+    return digest.hexdigest()
+
+def cache_file(filename, no_join=False, use_window=True):
+    options = ("no_join." if no_join else "") \
+            + ("" if use_window else "no_window.")
+    return "%s.%scache.npz"%(filename.rstrip("/"), options)
+
+"""
+read_datapoints through a .npz sidecar cache of the resolved datapoints
+and names.  The cache is rebuilt when the log, setup file or run metadata
+changes.
+"""
+def cached_datapoints(filename, setup_file="", no_join=False,
+                      use_window=True):
+    key = _cache_key(filename, setup_file, no_join, use_window)
+    sidecar = cache_file(filename, no_join, use_window)
+    if os.path.isfile(sidecar):
+        try:
+            with np.load(sidecar) as cache:
+                if str(cache["key"]) == key:
+                    return cache["datapoints"], \
+                           cache["robot_names"].tolist(), \
+                           cache["topic_names"].tolist()
+        except (OSError, ValueError, KeyError):
+            print("disregarding unreadable cache %s"%sidecar)
+
+    datapoints, robot_names, topic_names = read_datapoints(filename,
+                                               setup_file, no_join,
+                                               use_window)
+    try:
+        # write then rename so a concurrent reader never sees a partial cache
+        temp_file = "%s.tmp.npz"%sidecar[:-len(".npz")]
+        np.savez(temp_file, key=np.array(key), datapoints=datapoints,
+                 robot_names=np.array(robot_names, dtype=str),
+                 topic_names=np.array(topic_names, dtype=str))
+        os.replace(temp_file, sidecar)
+    except OSError as e:
+        print("unable to write cache %s: %s"%(sidecar, e))
+    return datapoints, robot_names, topic_names
@@ -0,0 +1 @@
+testbed_ws/testbed_nodes/testbed_nodes/log_records.py
\ No newline at end of file
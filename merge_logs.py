@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from os import listdir, remove
+from os.path import join, isdir, isfile, expanduser
+from heapq import merge
+from tempfile import NamedTemporaryFile
+from log_records import RECORD_STRUCT, RECORD_SIZE, is_binary_log
+
+# Per-robot log shards are written by testbed_robot --shard into
+# <out_file>.shards/<robot_name>.  Each shard is already in timestamp order,
+# so the shards are combined with a streaming k-way merge on the timestamp
+# in the last column.  At most max_open shards are merged at once; with more
+# shards, groups are first merged into temporary files, so memory and open
+# file handles stay bounded however many shards there are.  Binary shards,
+# see log_records.py, are merged the same way on their timestamp_ns field.
+
+def shard_dir(out_file):
+    return "%s.shards"%out_file
+
+# get the sorted list of shard files for out_file, empty if not sharded
+def shard_files(out_file):
+    if isdir(out_file):
+        directory = out_file
+    elif isdir(shard_dir(out_file)):
+        directory = shard_dir(out_file)
+    else:
+        return list()
+    return sorted([join(directory, name) for name in listdir(directory)
+                   if isfile(join(directory, name))])
+
+# yield (timestamp, line) for each line of one shard
+def _keyed_lines(filename):
+    ts = float("-inf")
+    with open(filename) as f:
+        for line in f:
+            try:
+                ts = float(line.rsplit(",", 1)[1])
+            except (IndexError, ValueError):
+                pass # keep malformed lines in place
+            yield ts, line
+
+# yield (timestamp_ns, record) for each binary record of one shard
+def _keyed_records(filename):
+    with open(filename, "rb") as f:
+        while True:
+            record = f.read(RECORD_SIZE)
+            if len(record) < RECORD_SIZE:
+                return
+            yield RECORD_STRUCT.unpack(record)[-1], record
+
+def _merge_group(filenames, binary):
+    keyed = _keyed_records if binary else _keyed_lines
+    for _ts, line in merge(*[keyed(filename) for filename in filenames]):
+        yield line
+
+# yield the lines, or binary records, of all shards in timestamp order
+def merged_lines(filenames, max_open=256, binary=False):
+    filenames = list(filenames)
+    temp_files = list()
+    try:
+        # reduce the fan-in with intermediate merges
+        while len(filenames) > max_open:
+            groups = [filenames[i:i+max_open]
+                      for i in range(0, len(filenames), max_open)]
+            filenames = list()
+            for group in groups:
+                with NamedTemporaryFile("wb" if binary else "w",
+                                        suffix=".shard", delete=False) as f:
+                    f.writelines(_merge_group(group, binary))
+                temp_files.append(f.name)
+                filenames.append(f.name)
+
+        yield from _merge_group(filenames, binary)
+
+    finally:
+        for temp_file in temp_files:
+            remove(temp_file)
+
+# yield the lines of out_file, or of its shards merged in timestamp order
+def log_lines(out_file, max_open=256):
+    shards = shard_files(out_file)
+    if shards:
+        yield from merged_lines(shards, max_open)
+    else:
+        with open(out_file) as f:
+            yield from f
+
+if __name__=="__main__":
+    parser = ArgumentParser(description="Merge per-robot log shards into "
+                            "one combined log file.",
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("out_file", type=str,
+                        help="The out_file that the robots were started with.")
+    parser.add_argument("-o","--output_file", type=str,
+                        help="The combined output file, default out_file.",
+                        default="")
+    parser.add_argument("-n","--max_open", type=int,
+                        help="The maximum number of shards merged at once.",
+                        default=256)
+    args = parser.parse_args()
+
+    out_file = expanduser(args.out_file)
+    output_file = expanduser(args.output_file) if args.output_file \
+                                               else out_file
+    shards = shard_files(out_file)
+    if not shards:
+        raise RuntimeError("No shards found for %s"%out_file)
+
+    binary = any([is_binary_log(shard) for shard in shards])
+    print("Merging %d %s shards into %s"%(len(shards),
+                          "binary" if binary else "text", output_file))
+    with open(output_file, "wb" if binary else "w") as f:
+        f.writelines(merged_lines(shards, args.max_open, binary))
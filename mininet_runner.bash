@@ -1,6 +1,6 @@
 #!/bin/bash
-# usage: minininet_runner.py <py file> <csv file> <output file>
-echo Command: ./mininet_runner.py $1 $2 $3
+# usage: minininet_runner.py <py file> <csv file> <output file> [options]
+echo Command: ./mininet_runner.py $@
 
 sudo LD_LIBRARY_PATH="${LD_LIBRARY_PATH}" \
      AMENT_PREFIX_PATH="${AMENT_PREFIX_PATH}" \
@@ -10,5 +10,5 @@ sudo LD_LIBRARY_PATH="${LD_LIBRARY_PATH}" \
      ROS_SECURITY_ROOT_DIRECTORY="${ROS_SECURITY_ROOT_DIRECTORY}" \
      ROS_SECURITY_ENABLE="${ROS_SECURITY_ENABLE}" \
      ROS_SECURITY_STRATEGY="${ROS_SECURITY_STRATEGY}" \
-     ./mininet_runner.py $1 $2 $3
+     ./mininet_runner.py $@
 
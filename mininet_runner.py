@@ -1,14 +1,24 @@
 #!/usr/bin/python
 
 import sys
+import re
+import json
+from collections import defaultdict
+from inspect import signature
+from time import sleep, monotonic_ns, time
 from argparse import ArgumentParser
-from os.path import join, expanduser, abspath
+from os import makedirs, remove
+from os.path import join, expanduser, abspath, isdir, isfile
+from shutil import rmtree
 from importlib import import_module
 from imp import load_source # Python2
 from mininet.log import info
 from mininet.cli import CLI
 
-from setup_reader import read_setup, show_setup
+from setup_reader import load_setup, show_setup
+from load_estimator import record_topology, estimate_load, show_report, \
+                           write_report
+from topology_builder import build_topology
 
 # import file and run its topology(args) function, return net
 def code_topology(py_file):
@@ -18,18 +28,326 @@ def code_topology(py_file):
     net = topology_module.myNetwork()
     return net
 
-def start_robots(net, robots, csv_file, out_file):
-    info("\nmininet_runner: Starting ROS2 nodes...\n")
+"""
+override traffic control parameters such as bw, delay, loss, jitter and
+max_queue_size on every link interface that supports them, keeping the
+parameters the topology file gave each interface otherwise.
+"""
+def configure_links(net, link_config):
+    info("mininet_runner: Configuring links with %s\n"%link_config)
+    for link in net.links:
+        for intf in (link.intf1, link.intf2):
+            # TCIntf and its wireless variants
+            if "bw" not in signature(intf.config).parameters:
+                continue
+            params = dict(intf.params)
+            params.update(link_config)
+            intf.config(**params)
+
+# (publisher, subscriber) host name pairs that exchange any topic
+def communicating_pairs(setup):
+    roles = defaultdict(list)
+    hosts = dict()
+    for robot in setup["robots"]:
+        roles[robot["role"]].append(robot["robot_name"])
+        hosts[robot["robot_name"]] = robot["host"]
+    pairs = set()
+    for publisher in setup["publishers"]:
+        for source in roles[publisher["role"]]:
+            for destination in setup["all_recipients"][publisher["topic"]]:
+                if hosts[source] != hosts[destination]:
+                    pairs.add((hosts[source], hosts[destination]))
+    return sorted(pairs)
+
+# summary of one ping's output, RTTs in ms
+def _ping_summary(lines):
+    summary = {"sent": 0, "received": 0}
+    for line in lines:
+        match = re.search(r"(\d+) packets transmitted, (\d+) received", line)
+        if match:
+            summary["sent"] = int(match.group(1))
+            summary["received"] = int(match.group(2))
+        match = re.search(r"= ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+) ms", line)
+        if match:
+            for name, value in zip(("rtt_min", "rtt_avg", "rtt_max",
+                                    "rtt_mdev"), match.groups()):
+                summary[name] = float(value)
+    return summary
+
+"""
+warm up the network by pinging only the pairs that exchange topics, all
+pairs at once, instead of every pair in turn as pingAll does.  Returns a
+list of per-pair RTT summaries as a baseline for the run.
+"""
+def ping_pairs(net, pairs, count=3):
+    info("mininet_runner: Pinging %d communicating pairs\n"%len(pairs))
+    destinations = defaultdict(list)
+    for source, destination in pairs:
+        destinations[source].append(destination)
+
+    # one shell line per source host, its pings run in the background and
+    # their output lines are prefixed with the destination
+    hosts = list()
+    for source, names in destinations.items():
+        pings = ["ping -c %d -i 0.2 -W 1 -q %s 2>&1 | sed 's/^/%s /' &"%(
+                 count, net[name].IP(), name) for name in names]
+        host = net[source]
+        if host.waiting:
+            host.waitOutput()
+        host.sendCmd(" ".join(pings) + " wait")
+        hosts.append((source, host))
+
+    baseline = list()
+    for source, host in hosts:
+        lines = defaultdict(list)
+        for line in host.waitOutput().splitlines():
+            name, _, text = line.partition(" ")
+            lines[name].append(text)
+        for name in destinations[source]:
+            summary = {"from": source, "to": name}
+            summary.update(_ping_summary(lines[name]))
+            if not summary["received"]:
+                info("mininet_runner: No ping replies from %s to %s\n"%(
+                                                           source, name))
+            baseline.append(summary)
+    return baseline
+
+def write_ping_baseline(out_file, baseline):
+    with open("%s.ping.json"%out_file, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+# the barrier files of a run's robots
+def ready_dir(out_file):
+    return "%s.ready"%out_file
+
+def start_file(out_file):
+    return join(ready_dir(out_file), "start")
+
+"""
+wait up to timeout seconds for every robot to report its peers matched,
+returns the names of robots that did not.
+"""
+def wait_ready(robots, out_file, timeout):
+    info("mininet_runner: Waiting for ROS2 nodes to match peers...\n")
+    waiting = [robot["robot_name"] for robot in robots]
+    waited = 0.0
+    while waiting and waited < timeout:
+        sleep(0.1)
+        waited += 0.1
+        waiting = [robot_name for robot_name in waiting
+                   if not isfile(join(ready_dir(out_file), robot_name))]
+    for robot_name in waiting:
+        info("mininet_runner: '%s' not ready after %.1f s\n"%(
+                                                  robot_name, timeout))
+    return waiting
+
+# one testbed_robot per robot, or one testbed_group per host with group
+def _robot_commands(robots, csv_file, out_file, robot_options, group):
+    commands = list()
+    if group:
+        hosts = list()
+        for robot in robots:
+            if robot["host"] not in hosts:
+                hosts.append(robot["host"])
+        for host in hosts:
+            commands.append((host,
+                  "ros2 run testbed_nodes testbed_group %s %s %s %s "
+                  "> _log_%s 2>&1 &"%(host, csv_file, out_file,
+                                       robot_options, host)))
+        return commands
     for robot in robots:
         robot_name = robot["robot_name"]
         role = robot["role"]
         logfile = "_log_%s"%robot_name
-        cmd = "ros2 run testbed_nodes testbed_robot %s %s %s %s " \
-              "> %s 2>&1 &"%(robot_name, role, csv_file, out_file, logfile)
+        commands.append((robot["host"],
+              "ros2 run testbed_nodes testbed_robot %s %s %s %s %s "
+              "> %s 2>&1 &"%(robot_name, role, csv_file, out_file,
+                             robot_options, logfile)))
+    return commands
+
+"""
+start every robot concurrently.  robot_options are extra testbed_robot
+command line options.  With group, the robots of each host run in one
+testbed_group process.  With barrier, robots publish only after all have
+matched their peers or ready_timeout seconds, and with start_delay, at
+that many seconds after launch.  Returns launch metadata.
+"""
+def start_robots(net, robots, csv_file, out_file, robot_options="",
+                 barrier=False, ready_timeout=60.0, start_delay=0,
+                 group=False):
+    info("\nmininet_runner: Starting ROS2 nodes...\n")
+    launch = dict()
+    if barrier:
+        # robots write into a new barrier directory, stale ready and start
+        # files of a previous run would release the barrier at once
+        if isdir(ready_dir(out_file)):
+            rmtree(ready_dir(out_file))
+        makedirs(ready_dir(out_file))
+        robot_options += " --ready_dir %s --start_file %s"%(
+                              ready_dir(out_file), start_file(out_file))
+    if start_delay:
+        launch["start_time"] = time() + start_delay
+        robot_options += " --start_time %f"%launch["start_time"]
+
+    # send every command before waiting for any, so robots start together
+    hosts = list()
+    for host_name, cmd in _robot_commands(robots, csv_file, out_file,
+                                          robot_options, group):
         info("mininet_runner: Starting '%s'\n"%cmd)
-        if not robot_name in net:
-            print("Error with robot name '%s'"%robot_name)
-        net[robot_name].cmd(cmd)
+        if not host_name in net:
+            print("Error with robot host name '%s'"%host_name)
+        host = net[host_name]
+        if host.waiting:
+            host.waitOutput()
+        host.sendCmd(cmd)
+        hosts.append(host)
+    for host in hosts:
+        if host.waiting:
+            host.waitOutput()
+
+    if barrier:
+        launch["not_ready"] = wait_ready(robots, out_file, ready_timeout)
+        with open(start_file(out_file), "w") as f:
+            f.write("%f\n"%time())
+        info("mininet_runner: Started publishing\n")
+    return launch
+
+# process pattern matching a robot's testbed_robot or testbed_group process
+def _robot_pattern(robot):
+    return "testbed_robot %s |testbed_group %s "%(robot["robot_name"],
+                                                  robot["host"])
+
+# key=host, value=pattern matching each robot process on the host once,
+# a testbed_group process runs several robots
+def _host_patterns(robots):
+    patterns = dict()
+    for robot in robots:
+        host = robot["host"]
+        if host not in patterns:
+            patterns[host] = "testbed_group %s "%host
+        patterns[host] += "|testbed_robot %s "%robot["robot_name"]
+    return patterns
+
+def robot_running(net, robot):
+    return net[robot["host"]].cmd("pgrep -f '%s'"%_robot_pattern(robot)
+                                  ).strip() != ""
+
+"""
+signal each robot process once to flush its log and exit, waiting up to
+timeout seconds before killing it.  A second signal would interrupt a
+testbed_group while it writes out its logs.  Returns the names of robots
+that had to be killed.
+"""
+def stop_robots(net, robots, timeout=10.0):
+    info("mininet_runner: Stopping ROS2 nodes...\n")
+    for host, pattern in _host_patterns(robots).items():
+        net[host].cmd("pkill -INT -f '%s'"%pattern)
+    waited = 0.0
+    running = robots
+    while running and waited < timeout:
+        sleep(0.1)
+        waited += 0.1
+        running = [robot for robot in running if robot_running(net, robot)]
+    for robot in running:
+        info("mininet_runner: Killing '%s'\n"%robot["robot_name"])
+    for host, pattern in _host_patterns(running).items():
+        net[host].cmd("pkill -KILL -f '%s'"%pattern)
+    running = [robot["robot_name"] for robot in running]
+    return running
+
+"""
+run robots for warmup then duration seconds without the CLI.  Returns run
+metadata including the measurement window in CLOCK_MONOTONIC ns, the
+clock of the robot logs, and status 0 if every robot ran the whole time
+and exited cleanly.
+"""
+def run_headless(net, robots, warmup, duration, stop_timeout=10.0):
+    info("mininet_runner: Warming up for %.1f s\n"%warmup)
+    sleep(warmup)
+    start_ns = monotonic_ns()
+    info("mininet_runner: Measuring for %.1f s\n"%duration)
+    sleep(duration)
+    end_ns = monotonic_ns()
+
+    failed = [robot for robot in robots if not robot_running(net, robot)]
+    for robot in failed:
+        info("mininet_runner: '%s' on '%s' exited early, see _log_*\n"%(
+                                   robot["robot_name"], robot["host"]))
+    failed = [robot["robot_name"] for robot in failed]
+    killed = stop_robots(net, robots, stop_timeout)
+    return {"warmup": warmup, "duration": duration,
+            "start_ns": start_ns, "end_ns": end_ns,
+            "failed_robots": failed, "killed_robots": killed,
+            "status": 1 if failed or killed else 0}
+
+# clear out_file and any shards, creating the shard directory if sharding
+def clear_output(out_file, shard):
+    # clear any existing content from out_file
+    with open(out_file, "w") as f:
+        f.flush()
+
+    # clear any existing shards
+    shard_dir = "%s.shards"%out_file
+    if isdir(shard_dir):
+        rmtree(shard_dir)
+    if shard:
+        makedirs(shard_dir)
+
+    # clear any barrier files of a previous run
+    if isdir(ready_dir(out_file)):
+        rmtree(ready_dir(out_file))
+
+"""
+warm up the network before robots start, with the ping RTT baseline in
+<out_file>.ping.json.  ping_count 0 skips the warm up and -1 pings all
+pairs with pingAll.
+"""
+def warm_up(net, setup, out_file, ping_count):
+    if ping_count < 0:
+        net.pingAll()
+    elif ping_count > 0:
+        write_ping_baseline(out_file, ping_pairs(net,
+                            communicating_pairs(setup), ping_count))
+
+"""
+run one scenario headless on a built network: clear its output, warm up
+the network, start its robots, measure and stop them.  Successive
+scenarios can run on the same network since only the robot processes are
+restarted.  launch_options are start_robots options.  Returns run
+metadata.
+"""
+def run_scenario(net, py_file, csv_file, out_file, robot_options, shard,
+                 warmup, duration, ping_count=3, **launch_options):
+    clear_output(out_file, shard)
+    setup = load_setup(csv_file)
+    warm_up(net, setup, out_file, ping_count)
+    launch = start_robots(net, setup["robots"], csv_file, out_file,
+                          robot_options, **launch_options)
+    metadata = run_headless(net, setup["robots"], warmup, duration)
+    metadata.update(launch)
+    metadata.update({"py_file": py_file, "csv_file": csv_file,
+                     "out_file": out_file, "robot_options": robot_options,
+                     "ping_count": ping_count})
+    return metadata
+
+"""
+estimate the offered load of csv_file on the recorded topology with
+link_config, showing the report and writing it to <out_file>.load.json.
+Returns True if links are predicted to exceed their capacity or queue
+limit.
+"""
+def preflight(topology, csv_file, out_file, link_config):
+    report = estimate_load(load_setup(csv_file), topology, link_config)
+    info("mininet_runner: Predicted load of %s\n"%csv_file)
+    show_report(report)
+    write_report("%s.load.json"%out_file, report)
+    return report["overloaded"]
+
+def write_run_metadata(out_file, metadata):
+    with open("%s.run.json"%out_file, "w") as f:
+        json.dump(metadata, f, indent=2)
+        f.write("\n")
 
 #    # start Wireshark on first node object (first robot)
 #    net[robots[0]["robot_name"]].cmd("wireshark &")
@@ -37,43 +355,161 @@ def start_robots(net, robots, csv_file, out_file):
 if __name__ == '__main__':
     # args
     parser = ArgumentParser(description="Start Mininet swarm emulation")
-    parser.add_argument("py_file", type=str, help="Python network setup file")
+    parser.add_argument("py_file", type=str,
+                        help="Python network setup file, or - to build the "
+                             "network from the CSV setup file's topology "
+                             "directives")
     parser.add_argument("csv_file", type=str,
                         help="CSV communication setup file")
     parser.add_argument("out_file", type=str, help="Log output file")
+    parser.add_argument("-s", "--shard", action="store_true",
+                        help="Each robot logs to <out_file>.shards/<robot>, "
+                             "combine with merge_logs.py")
+    parser.add_argument("-f", "--log_format", type=str,
+                        choices=["text", "binary"], default="text",
+                        help="Robot log record format")
+    parser.add_argument("-t", "--tx_log_every", type=int, default=1,
+                        help="Robots log every Nth publish, 0 for no tx logs")
+    parser.add_argument("-l", "--link_config", type=str, default="",
+                        help="JSON object of link parameters to override, "
+                             "e.g. '{\"bw\": 10, \"delay\": \"5ms\"}'")
+    parser.add_argument("-d", "--duration", type=float, default=0,
+                        help="Run headless, measuring for this many seconds "
+                             "after warmup then stopping, 0 to run the CLI")
+    parser.add_argument("-w", "--warmup", type=float, default=0,
+                        help="Seconds to run robots before measuring, "
+                             "with --duration")
+
+    parser.add_argument("-r", "--barrier", action="store_true",
+                        help="Robots publish only once all robots have "
+                             "matched their expected peers")
+    parser.add_argument("-y", "--ready_timeout", type=float, default=60,
+                        help="Seconds to wait for robots to match peers, "
+                             "with --barrier")
+    parser.add_argument("-a", "--start_delay", type=float, default=0,
+                        help="Robots publish at this many seconds after "
+                             "launch")
+    parser.add_argument("-g", "--group", action="store_true",
+                        help="Run the robots of each host in one "
+                             "testbed_group process")
+    parser.add_argument("-p", "--ping_count", type=int, default=3,
+                        help="Pings per communicating pair to warm up the "
+                             "network, 0 for none, -1 for pingAll")
+    parser.add_argument("-b", "--batch", type=str, default="",
+                        help="JSON list of headless runs on one network, "
+                             "each optionally setting csv_file, out_file, "
+                             "link_config, duration and warmup")
+    parser.add_argument("-P", "--preflight", action="store_true",
+                        help="Estimate the offered load on each link "
+                             "before running, see load_estimator.py")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Show the setup file rows and parsed setup")
 
     args = parser.parse_args()
     csv_file = expanduser(args.csv_file)
-    py_file = abspath(expanduser(args.py_file))
+    py_file = args.py_file
+    if py_file != "-":
+        py_file = abspath(expanduser(py_file))
     out_file = expanduser(args.out_file)
 
-    # clear any existing content from out_file
-    with open(out_file, "w") as f:
-        f.flush()
-
-    # read setup
-    setup = read_setup(csv_file)
-    show_setup(csv_file, setup)
+    # read setup, compiling it once for the robots to load their slices
+    setup = load_setup(csv_file, args.verbose)
+    if args.verbose:
+        show_setup(csv_file, setup)
 
     # show total count of robot nodes
     print("Robot count: %d"%len(setup["robots"]))
 
-    # load the network topology from myNetwork created by miniedit
-    print("Building network topology from %s"%py_file)
-    topology_module = load_source("myNetwork", py_file)
-    net = topology_module.myNetwork()
+    # estimate the load from the recorded links before building the network
+    topology = None
+    if args.preflight:
+        topology = record_topology(py_file, setup)
+        if not args.batch:
+            overloaded = preflight(topology, csv_file, out_file,
+                                   json.loads(args.link_config or "{}"))
 
-    # avoid any setup delay by performing an all-pairs ping
-    net.pingAll()
+    if py_file == "-":
+        # build the network from the Station, Switch and Link directives
+        print("Building network topology from %s"%csv_file)
+        net = build_topology(setup)
+    else:
+        # load the network topology from myNetwork created by miniedit
+        net = code_topology(py_file)
 
-    # start the robots
-    start_robots(net, setup["robots"], csv_file, out_file)
+    # start the robots with these options
+    robot_options = "--log_format %s --tx_log_every %d"%(
+                                     args.log_format, args.tx_log_every)
+    if args.shard:
+        robot_options += " --shard"
+    launch_options = {"barrier": args.barrier,
+                      "ready_timeout": args.ready_timeout,
+                      "start_delay": args.start_delay,
+                      "group": args.group}
 
-    # start CLI
-    info("mininet_runner: Running CLI\n")
-    CLI(net)
+    status = 0
+    if args.batch:
+        # successive runs on the network built once
+        with open(expanduser(args.batch)) as f:
+            runs = json.load(f)
+        links_changed = False
+        for count, run in enumerate(runs, 1):
+            run_csv_file = expanduser(run.get("csv_file", csv_file))
+            run_out_file = expanduser(run.get("out_file", out_file))
+            link_config = run.get("link_config", dict())
+            duration = run.get("duration", args.duration)
+            if not duration:
+                raise RuntimeError("Batch runs require a duration")
+            info("mininet_runner: Run %d of %d\n"%(count, len(runs)))
+
+            # reset links changed by the previous run
+            if link_config or links_changed:
+                configure_links(net, link_config)
+            links_changed = bool(link_config)
+            if topology:
+                overloaded = preflight(topology, run_csv_file, run_out_file,
+                                       link_config)
+            metadata = run_scenario(net, py_file, run_csv_file, run_out_file,
+                                    robot_options, args.shard,
+                                    run.get("warmup", args.warmup), duration,
+                                    args.ping_count, **launch_options)
+            if topology:
+                metadata["predicted_overload"] = overloaded
+            metadata["link_config"] = link_config
+            metadata["batch_run"] = count
+            write_run_metadata(run_out_file, metadata)
+            status |= metadata["status"]
+
+    else:
+        # sweep overrides of the link parameters in the topology file
+        link_config = dict()
+        if args.link_config:
+            link_config = json.loads(args.link_config)
+            configure_links(net, link_config)
+
+        if args.duration:
+            # timed run, the measurement window is in <out_file>.run.json
+            metadata = run_scenario(net, py_file, csv_file, out_file,
+                                    robot_options, args.shard, args.warmup,
+                                    args.duration, args.ping_count,
+                                    **launch_options)
+            if topology:
+                metadata["predicted_overload"] = overloaded
+            metadata["link_config"] = link_config
+            write_run_metadata(out_file, metadata)
+            status = metadata["status"]
+        else:
+            # avoid any setup delay by pinging the communicating pairs
+            clear_output(out_file, args.shard)
+            warm_up(net, setup, out_file, args.ping_count)
+            start_robots(net, setup["robots"], csv_file, out_file,
+                         robot_options, **launch_options)
+
+            # start CLI
+            info("mininet_runner: Running CLI\n")
+            CLI(net)
+            stop_robots(net, setup["robots"])
 
     # on exit or Ctrl-D
     info("mininet_runner: Stopping network\n")
     net.stop()
-
+    sys.exit(status)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import numpy as np
+import matplotlib.pyplot as plt
+from log_reader import read_datapoints, cached_datapoints
+
+# All-pairs robot matrices of median latency, p99 latency and % loss, one
+# cell per publisher, subscriber pair over all topics, computed in one
+# vectorized pass per frame: datapoints are keyed by (from, to), losses are
+# counted with bincount and latency quantiles are read from one sort of
+# the received latencies by key.  Matrices cover only the robots active in
+# the run and are computed one frame at a time, so memory does not grow
+# with the number of robots in the setup or of frames.  Cells without
+# datapoints are NaN.
+
+MATRICES = [("median", "Median latency in milliseconds"),
+            ("p99", "p99 latency in milliseconds"),
+            ("loss", "% Packet loss")]
+
+"""
+matrices of the datapoints of one frame, key=matrix name, value=array of
+shape (robots, robots) indexed [from, to] by position in robots, the
+sorted IDs of the robots to show.  Latencies over max_ms_latency are
+outliers, excluded from quantiles and not counted as lost.
+"""
+def pair_matrices(datapoints, robots, max_ms_latency):
+    robot_count = len(robots)
+    size = robot_count * robot_count
+    keys = np.searchsorted(robots, datapoints["from"]).astype(np.int64) \
+         * robot_count + np.searchsorted(robots, datapoints["to"])
+
+    lost = datapoints["loss"] > 0
+    counts = np.bincount(keys, minlength=size)
+    losses = np.bincount(keys, weights=lost, minlength=size)
+    matrices = dict()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matrices["loss"] = losses / counts * 100
+
+    # latency quantiles by rank within each key's sorted latencies
+    valid = ~lost & (datapoints["latency"] <= max_ms_latency)
+    valid_keys = keys[valid]
+    order = np.lexsort((datapoints["latency"][valid], valid_keys))
+    latencies = datapoints["latency"][valid][order]
+    valid_counts = np.bincount(valid_keys, minlength=size)
+    starts = np.cumsum(valid_counts) - valid_counts
+    has_latency = valid_counts > 0
+    for name, q in (("median", 0.5), ("p99", 0.99)):
+        values = np.full(size, np.nan)
+        ranks = np.ceil(q * valid_counts[has_latency]).astype(np.int64) - 1
+        values[has_latency] = latencies[starts[has_latency]
+                                        + np.maximum(ranks, 0)]
+        matrices[name] = values
+
+    return {name: values.reshape(robot_count, robot_count)
+            for name, values in matrices.items()}
+
+"""
+yield the frame index and datapoints of each frame with datapoints, in
+order.  window is the frame length in seconds, 0 for one frame of the
+whole run.
+"""
+def frames(datapoints, window=0):
+    if not window:
+        yield 0, datapoints
+        return
+    windows = (datapoints["time"] // window).astype(np.int64)
+    order = np.argsort(windows, kind="stable")
+    windows = windows[order]
+    starts = np.flatnonzero(np.concatenate([[True],
+                                            windows[1:] != windows[:-1]]))
+    ends = np.concatenate([starts[1:], [len(windows)]])
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        yield int(windows[start]), datapoints[order[start:end]]
+
+# robots that publish or subscribe in any datapoint, to trim the matrices
+def active_robots(datapoints, robot_count):
+    active = np.zeros(robot_count, dtype=bool)
+    active[datapoints["from"]] = True
+    active[datapoints["to"]] = True
+    return np.flatnonzero(active)
+
+def plot_heatmaps(matrices, robots, robot_names, title):
+    plt.suptitle(title)
+    labels = [robot_names[robot] for robot in robots.tolist()]
+    for index, (name, label) in enumerate(MATRICES):
+        plt.subplot(1, len(MATRICES), index + 1)
+        plt.imshow(matrices[name], cmap="viridis", interpolation="nearest")
+        plt.colorbar(shrink=0.6)
+        plt.title(label)
+        plt.ylabel("Publisher")
+        plt.xlabel("Subscriber")
+        # label every robot while the labels still fit
+        if len(labels) <= 40:
+            plt.xticks(range(len(labels)), labels, rotation=90, fontsize=6)
+            plt.yticks(range(len(labels)), labels, fontsize=6)
+
+if __name__=="__main__":
+
+    parser = ArgumentParser(description="Plot all-pairs latency and loss "
+                                        "matrices for network flows.",
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("input_file", type=str,
+                        help="The CSV data input file.")
+    parser.add_argument("dataset_name", type=str,
+                    help="The name of this dataset.")
+    parser.add_argument("-m","--max_ms_latency", type=float,
+                help="The maximum ms latency allowed without being dropped.",
+                        default = 10000)
+    parser.add_argument("-W","--window", type=float,
+                help="The time, in seconds, of each frame, 0 for one frame "
+                     "of the whole run.",
+                        default = 0)
+    parser.add_argument("-w","--write_file", type=str,
+                    help="Write to <filename>.png, or <filename>_<frame>.png "
+                         "with --window.",
+                        default = "")
+    parser.add_argument("-s","--setup_file", type=str,
+                    help="The scenario setup file, required for binary logs "
+                         "and tx rows logged once per publish.",
+                        default = "")
+    parser.add_argument("-n","--no_join", action="store_true",
+                    help="Use receiver-logged latency instead of joining "
+                         "tx and rx, losses are inferred from tx_count gaps.")
+    parser.add_argument("-N","--no_window", action="store_true",
+                    help="Keep messages sent outside the run's measurement "
+                         "window in <input_file>.run.json.")
+    parser.add_argument("-C","--no_cache", action="store_true",
+                    help="Do not read or write the <input_file>.cache.npz "
+                         "cache of parsed datapoints.")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        read = read_datapoints
+    else:
+        read = cached_datapoints
+    datapoints, robot_names, topic_names = read(args.input_file,
+                                             args.setup_file, args.no_join,
+                                             not args.no_window)
+    robots = active_robots(datapoints, len(robot_names))
+
+    # one frame at a time, to screen frames are shown in turn
+    for frame, frame_points in frames(datapoints, args.window):
+        matrices = pair_matrices(frame_points, robots, args.max_ms_latency)
+        if args.window:
+            title = "%s\n%d to %d seconds"%(args.dataset_name,
+                          frame * args.window, (frame + 1) * args.window)
+        else:
+            title = args.dataset_name
+        plt.figure(figsize=(18,6))
+        plot_heatmaps(matrices, robots, robot_names, title)
+        if not args.write_file:
+            plt.show()
+        elif args.window:
+            plt.savefig("%s_%d.png"%(args.write_file, frame))
+        else:
+            plt.savefig("%s.png"%args.write_file)
+        plt.close()
@@ -1,195 +1,169 @@
 #!/usr/bin/env python3
 
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
-from collections import defaultdict
-from statistics import mean
 import csv
+import numpy as np
 import matplotlib.pyplot as plt
+from log_reader import read_datapoints, cached_datapoints, flow_codes, \
+                       flow_labels, group_datapoints, group_flows, \
+                       robot_roles, size_models, GROUP_BY
+from bin_aggregates import aggregate, merge_bins, flow_series, flow_totals, \
+                           totals, ALL_BARS
+from latency_sketch import sketch, merge_sketches, flow_sketches, cdfs, \
+                           quantile_columns, quantile_cells
+from downsample import pixel_thin, lttb
+from log_follower import LogFollower, chunked_aggregates
 
 """
-get datapoints: from, to, topic, time, bar_time, size, latency, %loss
+datapoints, bins and sketches with flows grouped by group_by, and the
+group names replacing robot_names.
 """
-def read_datapoints(filename, bar_period):
-    points = dict()
-    t0=None
-    with open(args.input_file) as f:
-        row=csv.reader(f)
-
-        # Reading points is a two-step process: 1) find tx and 2) resolve
-        # in rx.  Unresolved rx will have latency and size values of 0.
-        # Loop twice because items can be out of order: rx before tx.
-        for c in row:
-            try:
-                # key = from, to, topic, tx_count
-                # value = either: (tx_time) or (tx_time, size, latency)
-                key = c[0],c[1],c[2], int(c[3])
-
-                if len(c) == 5:
-                    # from, to, topic, tx_count, timestamp
-                    if not t0:
-                        t0 = float(c[4]) # start time in seconds
-
-                    tx_time = float(c[4]) - t0
-                    points[key] = (tx_time,)
-
-                elif len(c) == 7:
-                    pass
-
-                else:
-                    raise RuntimeError("unexpected length %d"%len(c))
-
-            except Exception as e:
-                print("disregarding row in first pass", c)
-                print(repr(e))
-
-    with open(args.input_file) as f:
-        row=csv.reader(f)
-        for c in row:
-            try:
-                # key = from, to, topic, tx_count
-                # value = either: (tx_time) or (tx_time, size, latency)
-                key = c[0],c[1],c[2], int(c[3])
-
-                if len(c) == 5:
-                    pass
-
-                elif len(c) == 7:
-                    # from, to, topic, tx_count, rx_count, size, timestamp
-                    tx_time = points[key][0]
-                    rx_time = float(c[6]) - t0
-                    latency = (rx_time - tx_time) * 1000 # ms
-                    size = int(c[5])
-                    points[key] = (tx_time, size, latency)
-
-                else:
-                    raise RuntimeError("unexpected length %d"%len(c))
-
-            except Exception as e:
-                print("disregarding row in second pass", c)
-                print(repr(e))
-
-    # convert points into big list of tuple datapoints
-    datapoints = list()
-    for key, value in points.items():
-
-        # bar time
-        bar_time = (value[0] // bar_period) * bar_period
-        
-        # from, to, topic, time, bar_time, size, latency, %loss
-        if len(value) == 3:
-            # resolved
-            datapoints.append((*key[:3], value[0], bar_time, *value[1:], 0))
-        else:
-            datapoints.append((*key[:3], value[0], bar_time, 0, 0, 100))
-
-    return datapoints
-
-def latency_points(datapoints, max_ms_latency):
-    # datapoints are:
-    # from, to, topic, time, bar_time, size, latency, %loss
-    count_total = 0
-    count_dropped = 0
-    count_outliers = 0
-    time_points_x = defaultdict(list)
-    latency_points_y = defaultdict(list)
-
-    for point in datapoints:
-        count_total += 1
-        latency = point[6]
-        size = point[5]
-        time = point[3]
-
-        if latency == 0:
-            count_dropped += 1
-        elif latency > max_ms_latency:
-            count_outliers += 1
-        else:
-            time_latency_key = "%s, %s, %s, %d bytes"%(*point[:3], size)
-            time_points_x[time_latency_key].append(time)
-            latency_points_y[time_latency_key].append(latency)
+def group_results(datapoints, bins, sketches, robot_names, group_by, roles):
+    if group_by == "flow":
+        return datapoints, bins, sketches, robot_names
+    grouped_points, group_names = group_datapoints(datapoints, robot_names,
+                                                   group_by, roles)
+    grouped_bins = bins.copy()
+    grouped_bins["flow"], _ = group_flows(bins["flow"], robot_names,
+                                          group_by, roles)
+    grouped_sketches = sketches.copy()
+    grouped_sketches["flow"], _ = group_flows(sketches["flow"], robot_names,
+                                              group_by, roles)
+    return grouped_points, merge_bins([grouped_bins]), \
+           merge_sketches([grouped_sketches]), group_names
 
-    return time_points_x, latency_points_y, \
-           count_total, count_dropped, count_outliers
-
-def latency_averages(datapoints, max_ms_latency):
-    # datapoints are:
-    # from, to, topic, time, bar_time, size, latency, %loss
-    count_total = 0
-    count_dropped = 0
-    count_outliers = 0
-    bar_latencies = defaultdict(list)
-
-    # get bar latencies as dict of list of latencies
-    for point in datapoints:
-        count_total += 1
-        if point[6] == 0:
-            count_dropped += 1
-        elif point[6] > max_ms_latency:
-            count_outliers += 1
+"""
+latency points series by flow and message size, or by flow alone for
+publishers with a size model, see log_reader.size_models, labeled with
+the model.
+"""
+def latency_points(datapoints, robot_names, topic_names, max_ms_latency,
+                   models):
+    count_total = len(datapoints)
+    dropped = datapoints["loss"] > 0
+    outliers = ~dropped & (datapoints["latency"] > max_ms_latency)
+    points = datapoints[~dropped & ~outliers]
+
+    # group by flow and size, size -1 for flows of a size model
+    flows = flow_codes(points)
+    unique_flows, flow_index = np.unique(flows, return_inverse=True)
+    flow_models = [models.get((robot_names[flow >> 32],
+                               topic_names[flow & 0xffff]))
+                   for flow in unique_flows.tolist()]
+    has_model = np.array([model is not None for model in flow_models],
+                         dtype=bool)
+    sizes = np.where(has_model[flow_index.reshape(-1)], -1, points["size"])
+    _, first, codes = np.unique(np.stack([flows, sizes], axis=1),
+                                axis=0, return_index=True, return_inverse=True)
+    codes = codes.reshape(-1)
+    labels = flow_labels(flows[first], robot_names, topic_names)
+    time_points_x = dict()
+    latency_points_y = dict()
+    for code, (label, size, index) in enumerate(zip(labels,
+                        sizes[first].tolist(),
+                        flow_index.reshape(-1)[first].tolist())):
+        in_group = codes == code
+        if size < 0:
+            time_latency_key = "%s, %s"%(label, flow_models[index])
         else:
-            bar_time = point[4]
-            latency = point[6]
-            key = ("%s, %s, %s"%(point[:3]), bar_time)
-            bar_latencies[key].append(latency)
+            time_latency_key = "%s, %d bytes"%(label, size)
+        time_points_x[time_latency_key] = points["time"][in_group]
+        latency_points_y[time_latency_key] = points["latency"][in_group]
 
+    return time_points_x, latency_points_y, \
+           count_total, int(dropped.sum()), int(outliers.sum())
+
+# plottable bar series from bins: key=flow label, value=bar times, values
+def _bar_series(bins, values, robot_names, topic_names, bar_period):
+    plots_x = dict()
+    plots_y = dict()
+    series = flow_series(bins, values)
+    labels = flow_labels(np.array(list(series.keys()), dtype=np.int64),
+                         robot_names, topic_names)
+    for label, (bars, bar_values) in zip(labels, series.values()):
+        plots_x[label] = bars * bar_period
+        plots_y[label] = bar_values
+    return plots_x, plots_y
+
+def latency_averages(bins, robot_names, topic_names, bar_period):
+    has_latency = bins[bins["latency_count"] > 0]
+    latencies_x, latencies_y = _bar_series(has_latency,
+                     has_latency["latency_sum"] / has_latency["latency_count"],
+                     robot_names, topic_names, bar_period)
+    count_total, count_dropped, count_outliers = totals(bins)
+    return latencies_x, latencies_y, count_total, count_dropped, count_outliers
 
-    # get plottable latencies
-    latencies_x = defaultdict(list)
-    latencies_y = defaultdict(list)
+def throughput_averages(bins, robot_names, topic_names, bar_period):
+    return _bar_series(bins, bins["bytes"] / bar_period,
+                       robot_names, topic_names, bar_period)
 
-    for key, value in bar_latencies.items():
-        key_string, bar_time = key
-        latencies_x[key_string].append(bar_time)
-        latencies_y[key_string].append(mean(value))
+def loss_averages(bins, robot_names, topic_names, bar_period):
+    return _bar_series(bins, bins["lost"] / bins["count"] * 100,
+                       robot_names, topic_names, bar_period)
 
-    return latencies_x, latencies_y, count_total, count_dropped, count_outliers
-
-def throughput_averages(datapoints, bar_period):
-    # datapoints are:
-    # from, to, topic, time, bar_time, size, latency, %loss
-    bar_throughputs = defaultdict(list)
-
-    # get bar latencies as dict of list of size
-    for point in datapoints:
-            bar_time = point[4]
-            size = point[5]
-            throughput = size / bar_period
-            key = ("%s, %s, %s"%(point[:3]), bar_time)
-            bar_throughputs[key].append(throughput)
-
-    # get plottable latencies
-    throughputs_x = defaultdict(list)
-    throughputs_y = defaultdict(list)
-
-    for key, value in bar_throughputs.items():
-        key_string, bar_time = key
-        throughputs_x[key_string].append(bar_time)
-        throughputs_y[key_string].append(sum(value))
-
-    return throughputs_x, throughputs_y
-
-def loss_averages(datapoints):
-    # datapoints are:
-    # from, to, topic, time, bar_time, size, latency, %loss
-    bar_losses = defaultdict(list)
-
-    # get bar losses as dict of list of %loss values
-    for point in datapoints:
-            bar_time = point[4]
-            loss = point[7]
-            key = ("%s, %s, %s"%(point[:3]), bar_time)
-            bar_losses[key].append(loss)
-
-    # get plottable latencies
-    losses_x = defaultdict(list)
-    losses_y = defaultdict(list)
-
-    for key, value in bar_losses.items():
-        key_string, bar_time = key
-        losses_x[key_string].append(bar_time)
-        losses_y[key_string].append(mean(value))
-
-    return losses_x, losses_y
+"""
+write a CSV table of per-flow statistics, one row per flow for the whole
+run, bar_time "all", then one row per flow per bar.
+"""
+def write_stats_table(filename, bins, sketches, robot_names, topic_names,
+                      bar_period):
+    flow_bins = flow_totals(bins)
+    all_bins = np.concatenate([flow_bins, bins])
+    percentile_cells = quantile_cells(np.concatenate([
+                             flow_sketches(sketches), sketches]), all_bins)
+    labels = flow_labels(all_bins["flow"], robot_names, topic_names)
+
+    with open(filename, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["from", "to", "topic", "bar_time", "count", "lost",
+                         "loss_percent", "outliers", "mean_ms"]
+                        + quantile_columns() + ["max_ms", "jitter_ms"])
+        for label, b, percentiles in zip(labels, all_bins.tolist(),
+                                         percentile_cells):
+            row = dict(zip(all_bins.dtype.names, b))
+            writer.writerow(label.split(", ") + [
+                   "all" if row["bar"] == ALL_BARS
+                         else "%d"%(row["bar"] * bar_period),
+                   row["count"], row["lost"],
+                   "%f"%(row["lost"] / row["count"] * 100),
+                   row["outliers"],
+                   "%f"%(row["latency_sum"] / row["latency_count"])
+                         if row["latency_count"] else ""]
+                   + percentiles + [
+                   "%f"%row["latency_max"] if row["latency_count"] else "",
+                   "%f"%(row["jitter_sum"] / row["jitter_count"])
+                         if row["jitter_count"] else ""])
+
+def plot_latency_cdf(curves, robot_names, topic_names, args):
+    plt.title("Latency CDF")
+    plt.ylabel("Fraction of messages")
+    plt.xlabel("Latency in milliseconds")
+    plt.xscale("log")
+    labels = flow_labels(np.array(list(curves.keys()), dtype=np.int64),
+                         robot_names, topic_names)
+    for label, (latencies, fractions) in sorted(zip(labels, curves.values()),
+                                                key=lambda x: x[0]):
+        plt.step(latencies, fractions, where="post", label=label)
+    _legend(len(curves))
+
+# legends with more entries than this are left out
+MAX_LEGEND_ENTRIES = 20
+
+def _legend(entries):
+    if entries <= MAX_LEGEND_ENTRIES:
+        plt.legend()
+
+# one point per pixel cell of a plot_points square grid
+def _thin_points(x, y, args):
+    if not args.plot_points:
+        return np.arange(len(x))
+    return pixel_thin(x, y, args.plot_points, args.plot_points)
+
+# at most plot_points points of a line, keeping its shape
+def _thin_series(x, y, args):
+    if not args.plot_points:
+        return np.arange(len(x))
+    return lttb(x, y, args.plot_points)
 
 def plot_latency_points(plots_x, plots_y, args,
                         total, dropped, outliers):
@@ -202,9 +176,10 @@ def plot_latency_points(plots_x, plots_y, args,
     plt.ylabel("Latency in milliseconds")
     plt.xlabel("Time in seconds")
     for key in sorted(list(plots_x.keys())):
-        plt.plot(plots_x[key], plots_y[key], '.', markersize=2,
+        keep = _thin_points(plots_x[key], plots_y[key], args)
+        plt.plot(plots_x[key][keep], plots_y[key][keep], '.', markersize=2,
                  label="%s, %d datapoints"%(key, len(plots_x[key])))
-    plt.legend()
+    _legend(len(plots_x))
 
 def plot_latency_trend(plots_x, plots_y, args, total, dropped, outliers):
     if outliers == 1:
@@ -216,79 +191,212 @@ def plot_latency_trend(plots_x, plots_y, args, total, dropped, outliers):
     plt.ylabel("Latency in milliseconds")
     plt.xlabel("Time in seconds")
     for key in sorted(list(plots_x.keys())):
-        plt.plot(plots_x[key], plots_y[key], '-', markersize=2, label=key)
-    plt.legend()
+        keep = _thin_series(plots_x[key], plots_y[key], args)
+        plt.plot(plots_x[key][keep], plots_y[key][keep], '-', markersize=2,
+                 label=key)
+    _legend(len(plots_x))
 
 def plot_throughput_trend(plots_x, plots_y, args):
     plt.title("Average byte throughput")
     plt.ylabel("Bytes per second")
     plt.xlabel("Time in seconds")
     for key in sorted(list(plots_x.keys())):
-        plt.plot(plots_x[key], plots_y[key], '-', markersize=2, label=key)
-    plt.legend()
+        keep = _thin_series(plots_x[key], plots_y[key], args)
+        plt.plot(plots_x[key][keep], plots_y[key][keep], '-', markersize=2,
+                 label=key)
+    _legend(len(plots_x))
 
 def plot_loss_trend(plots_x, plots_y, args):
     plt.title("% Packet loss")
     plt.ylabel("%Packets lost")
     plt.xlabel("Time in seconds")
     for key in sorted(list(plots_x.keys())):
-        plt.plot(plots_x[key], plots_y[key], '-', markersize=2, label=key)
-    plt.legend()
-
-if __name__=="__main__":
-
-    parser = ArgumentParser(description="Plot latency graph for network flows.",
-                        formatter_class=ArgumentDefaultsHelpFormatter)
-    parser.add_argument("input_file", type=str,
-                        help="The CSV data input file.")
-    parser.add_argument("dataset_name", type=str,
-                    help="The name of this dataset.")
-    parser.add_argument("-m","--max_ms_latency", type=float,
-                help="The maximum ms latency allowed without being dropped.",
-                        default = 10000)
-    parser.add_argument("-b","--bar_period", type=int,
-                help="The time, in seconds, for each averaged period.",
-                        default = 5)
-    parser.add_argument("-w","--write_file", type=str,
-                    help="Write to <filename>_<plot_type>.png.",
-                        default = "")
-    args = parser.parse_args()
+        keep = _thin_series(plots_x[key], plots_y[key], args)
+        plt.plot(plots_x[key][keep], plots_y[key][keep], '-', markersize=2,
+                 label=key)
+    _legend(len(plots_x))
 
-    datapoints = read_datapoints(args.input_file, args.bar_period)
-
-    # plots
-    plt.figure(figsize=(12,10))
+# the latency points, latency, throughput and loss plots on the current figure
+def plot_all(datapoints, bins, robot_names, topic_names, models, args):
     plt.suptitle(args.dataset_name)
 
     # latency points
     plt.subplot(2,2,1)
     time_points_x, latency_points_y, \
                       count_total, count_dropped, count_outliers = \
-                      latency_points(datapoints, args.max_ms_latency)
+                      latency_points(datapoints, robot_names, topic_names,
+                                     args.max_ms_latency, models)
     plot_latency_points(time_points_x, latency_points_y, args,
                         count_total, count_dropped, count_outliers)
 
     # latency bar averages
     plt.subplot(2,2,2)
     latencies_x, latencies_y, count_total, count_dropped, count_outliers = \
-                 latency_averages(datapoints, args.max_ms_latency)
+                 latency_averages(bins, robot_names, topic_names,
+                                  args.bar_period)
     plot_latency_trend(latencies_x, latencies_y, args,
                        count_total, count_dropped, count_outliers)
 
     # bytes throughput
     plt.subplot(2,2,3)
-    throughputs_x, throughputs_y = throughput_averages(datapoints,
-                                                       args.bar_period)
+    throughputs_x, throughputs_y = throughput_averages(bins, robot_names,
+                                            topic_names, args.bar_period)
     plot_throughput_trend(throughputs_x, throughputs_y, args)
 
     # % loss
     plt.subplot(2,2,4)
-    throughputs_x, throughputs_y = loss_averages(datapoints)
-    plot_loss_trend(throughputs_x, throughputs_y, args)
+    losses_x, losses_y = loss_averages(bins, robot_names, topic_names,
+                                       args.bar_period)
+    plot_loss_trend(losses_x, losses_y, args)
+
+if __name__=="__main__":
+
+    parser = ArgumentParser(description="Plot latency graph for network flows.",
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("input_file", type=str,
+                        help="The CSV data input file.")
+    parser.add_argument("dataset_name", type=str,
+                    help="The name of this dataset.")
+    parser.add_argument("-m","--max_ms_latency", type=float,
+                help="The maximum ms latency allowed without being dropped.",
+                        default = 10000)
+    parser.add_argument("-b","--bar_period", type=int,
+                help="The time, in seconds, for each averaged period.",
+                        default = 5)
+    parser.add_argument("-w","--write_file", type=str,
+                    help="Write to <filename>_<plot_type>.png.",
+                        default = "")
+    parser.add_argument("-s","--setup_file", type=str,
+                    help="The scenario setup file, required for binary logs "
+                         "and tx rows logged once per publish.",
+                        default = "")
+    parser.add_argument("-t","--stats_file", type=str,
+                    help="Write per-flow latency percentile, loss and "
+                         "jitter statistics to this CSV file.",
+                        default = "")
+    parser.add_argument("-c","--cdf", action="store_true",
+                    help="Also plot per-flow latency CDFs.")
+    parser.add_argument("-n","--no_join", action="store_true",
+                    help="Use receiver-logged latency instead of joining "
+                         "tx and rx, losses are inferred from tx_count gaps.")
+    parser.add_argument("-N","--no_window", action="store_true",
+                    help="Keep messages sent outside the run's measurement "
+                         "window in <input_file>.run.json.")
+    parser.add_argument("-f","--follow", action="store_true",
+                    help="Follow the log while it is being written, "
+                         "redrawing the plots until the window is closed.")
+    parser.add_argument("-r","--refresh", type=float,
+                    help="The time, in seconds, between redraws with --follow.",
+                        default = 2.0)
+    parser.add_argument("-x","--tx_timeout", type=float,
+                    help="With --follow or --chunked, the time, in seconds, "
+                         "after which a tx not yet received is counted as "
+                         "lost, even if it is received later.",
+                        default = 10.0)
+    parser.add_argument("-C","--no_cache", action="store_true",
+                    help="Do not read or write the <input_file>.cache.npz "
+                         "cache of parsed datapoints.")
+    parser.add_argument("-k","--chunked", action="store_true",
+                    help="Read the log in chunks for logs too large for "
+                         "memory, the latency points plot shows a sample.")
+    parser.add_argument("-M","--memory_limit", type=int,
+                    help="With --chunked, the approximate peak memory, "
+                         "in megabytes.",
+                        default = 1024)
+    parser.add_argument("-a","--mmap", action="store_true",
+                    help="With --chunked, memory map binary logs.")
+    parser.add_argument("-g","--group_by", type=str, choices=GROUP_BY,
+                    help="Plot and tabulate per flow, or per topic, role "
+                         "or publisher.",
+                        default = "flow")
+    parser.add_argument("-p","--plot_points", type=int,
+                    help="Downsample each plotted series to about this "
+                         "many points, 0 for all points.",
+                        default = 2000)
+    args = parser.parse_args()
+
+    if args.group_by == "role":
+        roles = robot_roles(args.setup_file)
+    else:
+        roles = None
+    models = size_models(args.setup_file)
+
+    if args.follow:
+        # read new log data and redraw until the window is closed
+        follower = LogFollower(args.input_file, args.setup_file,
+                               args.bar_period, args.max_ms_latency,
+                               args.no_join, args.tx_timeout)
+        plt.ion()
+        plt.figure(figsize=(12,10))
+        figure_number = plt.gcf().number
+        try:
+            while plt.fignum_exists(figure_number):
+                follower.poll()
+                datapoints, bins, _sketches, robot_names = group_results(
+                         follower.points, follower.bins, follower.sketches,
+                         follower.robot_names, args.group_by, roles)
+                plt.figure(figure_number)
+                plt.clf()
+                plot_all(datapoints, bins, robot_names, follower.topic_names,
+                         models, args)
+                plt.pause(args.refresh)
+        except KeyboardInterrupt:
+            pass
+        plt.ioff()
+        datapoints = follower.points
+        bins = follower.bins
+        sketches = follower.sketches
+        robot_names = follower.robot_names
+        topic_names = follower.topic_names
+
+    elif args.chunked:
+        follower = chunked_aggregates(args.input_file, args.setup_file,
+                                      args.bar_period, args.max_ms_latency,
+                                      args.no_join, args.tx_timeout,
+                                      args.memory_limit << 20, args.mmap,
+                                      not args.no_window)
+        datapoints = follower.points
+        bins = follower.bins
+        sketches = follower.sketches
+        robot_names = follower.robot_names
+        topic_names = follower.topic_names
+
+    else:
+        if args.no_cache:
+            read = read_datapoints
+        else:
+            read = cached_datapoints
+        datapoints, robot_names, topic_names = read(
+                            args.input_file, args.setup_file, args.no_join,
+                            not args.no_window)
+
+        # one aggregation pass serves all of the bar plots
+        bins = aggregate(datapoints, args.bar_period, args.max_ms_latency)
+        sketches = sketch(datapoints, args.bar_period, args.max_ms_latency)
+
+    datapoints, bins, sketches, robot_names = group_results(datapoints,
+                        bins, sketches, robot_names, args.group_by, roles)
+    if not args.follow or (args.write_file
+                           and not plt.fignum_exists(figure_number)):
+        plt.figure(figsize=(12,10))
+        plot_all(datapoints, bins, robot_names, topic_names, models, args)
+
+    if args.stats_file:
+        write_stats_table(args.stats_file, bins, sketches, robot_names,
+                          topic_names, args.bar_period)
 
-    # to screen or file
     if args.write_file:
         plt.savefig("%s.png"%args.write_file)
-    else:
+
+    # latency CDFs
+    if args.cdf:
+        plt.figure(figsize=(12,10))
+        plt.suptitle(args.dataset_name)
+        plot_latency_cdf(cdfs(sketches), robot_names, topic_names, args)
+        if args.write_file:
+            plt.savefig("%s_cdf.png"%args.write_file)
+
+    # to screen, the followed figure was already shown
+    if not args.write_file and (not args.follow or args.cdf):
         plt.show()
 
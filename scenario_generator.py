@@ -0,0 +1,515 @@
+#!/usr/bin/python3
+
+import json
+from argparse import ArgumentParser
+from collections import defaultdict
+from math import ceil, cos, sin, pi, sqrt, log
+from os.path import expanduser
+from random import Random
+from setup_reader import absolute_sizes
+
+# Generate a matching CSV setup file and Python topology file for a
+# synthetic swarm, for mininet_runner.  The same parameters and seed always
+# generate the same files.
+#
+# The layout places robots and connects them in a graph:
+#   ring       robots on a circle, each connected to its two neighbors
+#   mesh       robots on a circle, every pair connected
+#   star       robots around the first robot, each connected to it
+#   line       robots in a row, each connected to the next
+#   grid       robots in rows, each connected to its right and lower
+#              neighbors
+#   geometric  robots placed at random, connected within radius
+# Distances are in units of spacing.
+#
+# With the wired medium, each robot is a host on its own switch and the
+# switches are linked by the layout graph, except with star, where all
+# robots share one switch.  Links are TCLinks with the given QoS.  Layouts
+# with loops enable STP on the switches, which takes some seconds to
+# converge after the network starts.  With the wifi medium, robots are
+# Mininet-WiFi adhoc stations at the layout positions, each with the radio
+# range to reach its farthest layout neighbor.
+#
+# The traffic is either by role, with robots assigned roles by the role mix
+# and each role publishing topics subscribed to by fanout other roles, or by
+# neighbor, with each robot publishing its state to up to fanout of its
+# layout neighbors, fanout 0 for all of them.
+#
+# With --embed, the topology is written as Station, Switch and Link
+# directives in the CSV setup file instead, for mininet_runner py_file -.
+
+LAYOUTS = ["ring", "mesh", "star", "line", "grid", "geometric"]
+MEDIUMS = ["wired", "wifi"]
+TRAFFICS = ["role", "neighbor"]
+
+# generator parameters and their defaults
+DEFAULTS = {"layout": "ring", "robots": 10, "seed": 1, "medium": "wired",
+            "spacing": 10.0, "radius": 0.0,
+            "traffic": "role", "roles": "robot:1", "topics": 1, "fanout": 1,
+            "frequency": "10", "size": "100", "history": "keep_last",
+            "depth": 0, "reliability": "best_effort",
+            "durability": "volatile", "arrival": "periodic", "sizes": "fixed",
+            "bw": 0, "delay": "", "loss": 0, "jitter": "",
+            "max_queue_size": 0}
+
+# parameters that change the generated network or the set of topics
+GENERATOR_KEYS = ["layout", "robots", "seed", "medium", "spacing",
+                  "radius", "traffic", "roles", "topics", "fanout"]
+
+def robot_names(count):
+    width = max(2, len(str(count)))
+    return ["R%0*d"%(width, i + 1) for i in range(count)]
+
+# positions on a circle with neighbors one unit apart
+def _circle(count):
+    if count < 2:
+        return [(0.0, 0.0)] * count
+    radius = max(0.5, 0.5 / sin(pi / count))
+    return [(radius * cos(2 * pi * i / count),
+             radius * sin(2 * pi * i / count)) for i in range(count)]
+
+# edges of points within radius, bucketed into cells of the radius
+def _geometric_edges(positions, radius):
+    cells = defaultdict(list)
+    for i, (x, y) in enumerate(positions):
+        cells[(int(x // radius), int(y // radius))].append(i)
+    edges = list()
+    for (cx, cy), members in cells.items():
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in cells.get((cx + dx, cy + dy), []):
+                    for i in members:
+                        if i < j and _distance(positions[i], positions[j]) \
+                                                             <= radius:
+                            edges.append((i, j))
+    return sorted(edges)
+
+def _distance(a, b):
+    return sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
+
+"""
+robot positions and the (i, j) edges, i < j, of a layout of count robots.
+geometric places one robot per unit square on average, and radius 0
+selects 1.5 times the radius at which such a graph is likely connected.
+"""
+def layout_graph(layout, count, rng, radius=0.0):
+    if layout in ("ring", "mesh"):
+        positions = _circle(count)
+        if layout == "mesh":
+            edges = [(i, j) for i in range(count)
+                            for j in range(i + 1, count)]
+        elif count > 2:
+            edges = [(i, i + 1) for i in range(count - 1)] \
+                  + [(0, count - 1)]
+        else:
+            edges = [(i, i + 1) for i in range(count - 1)]
+    elif layout == "star":
+        positions = [(0.0, 0.0)] + [(x * 2, y * 2)
+                                    for x, y in _circle(count - 1)]
+        edges = [(0, i) for i in range(1, count)]
+    elif layout == "line":
+        positions = [(float(i), 0.0) for i in range(count)]
+        edges = [(i, i + 1) for i in range(count - 1)]
+    elif layout == "grid":
+        columns = int(ceil(sqrt(count)))
+        positions = [(float(i % columns), float(i // columns))
+                     for i in range(count)]
+        edges = [(i, i + 1) for i in range(count - 1)
+                 if (i + 1) % columns] \
+              + [(i, i + columns) for i in range(count - columns)]
+    elif layout == "geometric":
+        side = sqrt(count)
+        positions = [(rng.uniform(0, side), rng.uniform(0, side))
+                     for _ in range(count)]
+        if not radius:
+            radius = 1.5 * sqrt(log(max(count, 2)) / pi)
+        edges = _geometric_edges(positions, radius)
+    else:
+        raise RuntimeError("Invalid layout '%s', use one of %s"%(
+                           layout, ", ".join(LAYOUTS)))
+    return positions, sorted(edges)
+
+# number of connected components of the layout graph
+def component_count(count, edges):
+    parents = list(range(count))
+    def root(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+    components = count
+    for i, j in edges:
+        ri, rj = root(i), root(j)
+        if ri != rj:
+            parents[ri] = rj
+            components -= 1
+    return components
+
+# a value "n" or a range "low:high" drawn uniformly
+def _draw(value, rng):
+    bounds = [int(x) for x in str(value).split(":")]
+    if len(bounds) == 1:
+        return bounds[0]
+    return rng.randint(bounds[0], bounds[1])
+
+# role of each robot by a role mix "name:weight,...", shuffled by rng
+def assign_roles(count, role_mix, rng):
+    weights = list()
+    for entry in role_mix.split(","):
+        name, _, weight = entry.strip().partition(":")
+        weights.append((name, float(weight or 1)))
+    total = sum(weight for _, weight in weights)
+
+    # largest remainder so the counts add up to count
+    shares = [(count * weight / total, name) for name, weight in weights]
+    counts = {name: int(share) for share, name in shares}
+    remainders = sorted(shares, key=lambda share: int(share[0]) - share[0])
+    for _, name in remainders[:count - sum(counts.values())]:
+        counts[name] += 1
+
+    roles = list()
+    for name, _ in weights:
+        roles.extend([name] * counts[name])
+    rng.shuffle(roles)
+    return roles
+
+"""
+Publisher, Subscriber and Robot rows of the traffic, as lists of values.
+Returns publishers, subscribers, robots.
+"""
+def traffic_rows(params, names, edges, rng):
+    qos = [params["history"], params["depth"], params["reliability"],
+           params["durability"]]
+    # the optional traffic model columns, only if not the defaults
+    traffic = [params["arrival"], params["sizes"]]
+    if traffic == [DEFAULTS["arrival"], DEFAULTS["sizes"]]:
+        traffic = []
+    publishers = list()
+    subscribers = list()
+    robots = list()
+    if params["traffic"] == "neighbor":
+        neighbors = defaultdict(list)
+        for i, j in edges:
+            neighbors[i].append(j)
+            neighbors[j].append(i)
+        for i, name in enumerate(names):
+            role = "%s_role"%name
+            topic = "%s_state"%name
+            robots.append([name, role])
+            publishers.append([role, topic, _draw(params["frequency"], rng),
+                               _draw(params["size"], rng)] + qos + traffic)
+            peers = sorted(neighbors[i])
+            if params["fanout"] and len(peers) > params["fanout"]:
+                peers = sorted(rng.sample(peers, params["fanout"]))
+            for j in peers:
+                subscribers.append(["%s_role"%names[j], topic] + qos)
+    elif params["traffic"] == "role":
+        roles = assign_roles(len(names), params["roles"], rng)
+        role_names = sorted(set(roles), key=roles.index)
+        for name, role in zip(names, roles):
+            robots.append([name, role])
+        for role in role_names:
+            others = [other for other in role_names if other != role] \
+                     or role_names
+            for k in range(params["topics"]):
+                topic = "%s_t%d"%(role, k + 1)
+                publishers.append([role, topic,
+                                   _draw(params["frequency"], rng),
+                                   _draw(params["size"], rng)] + qos
+                                  + traffic)
+                fanout = min(params["fanout"] or len(others), len(others))
+                for other in sorted(rng.sample(others, fanout)):
+                    subscribers.append([other, topic] + qos)
+    else:
+        raise RuntimeError("Invalid traffic '%s', use one of %s"%(
+                           params["traffic"], ", ".join(TRAFFICS)))
+    return publishers, subscribers, robots
+
+def setup_text(params, publishers, subscribers, robots):
+    lines = ["# Generated by scenario_generator.py with %s"%json.dumps(
+                                                  params, sort_keys=True),
+             "",
+             "# Publisher, Role, Topic, Frequency, Size, History, Depth, "
+             "Reliability, Durability, Arrival, Sizes"]
+    lines.extend("Publisher, %s"%", ".join(str(x) for x in row)
+                 for row in publishers)
+    lines.extend(["",
+             "# Subscriber, Role, Topic, History, Depth, Reliability, "
+             "Durability"])
+    lines.extend("Subscriber, %s"%", ".join(str(x) for x in row)
+                 for row in subscribers)
+    lines.extend(["", "# Robot, Name, Role"])
+    lines.extend("Robot, %s"%", ".join(row) for row in robots)
+    return "\n".join(lines) + "\n"
+
+# the host IP address of robot i in 10.0.0.0/8
+def _ip(i):
+    i += 1
+    return "10.%d.%d.%d"%(i >> 16, (i >> 8) & 255, i & 255)
+
+def link_params(params):
+    link_qos = dict()
+    for key in ("bw", "delay", "loss", "jitter", "max_queue_size"):
+        if params[key]:
+            link_qos[key] = params[key]
+    return link_qos
+
+_WIRED_HEADER = """#!/usr/bin/python
+
+from mininet.net import Mininet
+from mininet.node import Host, OVSKernelSwitch
+from mininet.log import setLogLevel, info
+from mininet.link import TCLink
+
+# %s
+
+def myNetwork():
+
+    net = Mininet( topo=None,
+                   build=False,
+                   ipBase='10.0.0.0/8')
+"""
+
+_WIFI_HEADER = """#!/usr/bin/python
+
+from mininet.log import setLogLevel, info
+from mn_wifi.net import Mininet_wifi
+from mn_wifi.link import wmediumd, adhoc
+from mn_wifi.wmediumdConnector import interference
+
+# %s
+
+def myNetwork():
+
+    net = Mininet_wifi(topo=None,
+                       build=False,
+                       link=wmediumd,
+                       wmediumd_mode=interference,
+                       ipBase='10.0.0.0/8')
+"""
+
+_FOOTER = """
+    info( '*** Starting network\\n')
+    net.build()
+    for controller in net.controllers:
+        controller.start()
+%s
+    return net
+
+if __name__ == '__main__':
+    setLogLevel( 'info' )
+    myNetwork()
+"""
+
+def _wired_text(params, names, edges, comment):
+    lines = [_WIRED_HEADER%comment]
+    link_qos = repr(link_params(params))
+    star = params["layout"] == "star"
+    switches = ["s1"] if star else ["s%d"%(i + 1) for i in range(len(names))]
+    stp = ", stp=True" if not star and \
+          len(edges) > len(names) - component_count(len(names), edges) \
+          else ""
+    lines.append("    info( '*** Add switches\\n')")
+    lines.extend("    %s = net.addSwitch('%s', cls=OVSKernelSwitch, "
+                 "failMode='standalone'%s)"%(s, s, stp) for s in switches)
+    lines.extend(["", "    info( '*** Add hosts\\n')"])
+    lines.extend("    %s = net.addHost('%s', cls=Host, ip='%s', "
+                 "defaultRoute=None)"%(name, name, _ip(i))
+                 for i, name in enumerate(names))
+    lines.extend(["", "    info( '*** Add links\\n')",
+                  "    link_qos = %s"%link_qos])
+    lines.extend("    net.addLink(%s, %s, cls=TCLink , **link_qos)"%(
+                 switches[0 if star else i], name)
+                 for i, name in enumerate(names))
+    if not star:
+        lines.extend("    net.addLink(%s, %s, cls=TCLink , **link_qos)"%(
+                     switches[i], switches[j]) for i, j in edges)
+    start = "".join("    net.get('%s').start([])\n"%s for s in switches)
+    return "\n".join(lines) + "\n" + _FOOTER%start
+
+# radio range of each station to reach its farthest layout neighbor
+def _ranges(positions, edges, spacing):
+    reach = [0.0] * len(positions)
+    for i, j in edges:
+        distance = _distance(positions[i], positions[j])
+        reach[i] = max(reach[i], distance)
+        reach[j] = max(reach[j], distance)
+    return [max(distance * 1.1, 1.0) * spacing for distance in reach]
+
+def _wifi_text(params, names, positions, edges, comment):
+    spacing = params["spacing"]
+    ranges = _ranges(positions, edges, spacing)
+    lines = [_WIFI_HEADER%comment]
+    lines.append("    info( '*** Add stations\\n')")
+    for i, name in enumerate(names):
+        x, y = positions[i]
+        lines.append("    %s = net.addStation('%s', ip='%s', "
+                     "position='%.1f,%.1f,0', range=%.1f)"%(
+                     name, name, _ip(i), x * spacing, y * spacing,
+                     ranges[i]))
+    lines.extend(["",
+                  "    info(\"*** Configuring Propagation Model\\n\")",
+                  "    net.setPropagationModel(model=\"logDistance\", exp=3)",
+                  "",
+                  "    info(\"*** Configuring wifi nodes\\n\")",
+                  "    net.configureWifiNodes()",
+                  "",
+                  "    info( '*** Add links\\n')"])
+    lines.extend("    net.addLink(%s, cls=adhoc, ssid='swarm', mode='g', "
+                 "channel=1, intf='%s-wlan0')"%(name, name) for name in names)
+    return "\n".join(lines) + "\n" + _FOOTER%""
+
+# Station, Switch, Link and PropagationModel directives of the topology
+def topology_text(params, names, positions, edges):
+    lines = ["", "# Station, Name, IP, Position, Range"]
+    if params["medium"] == "wifi":
+        spacing = params["spacing"]
+        ranges = _ranges(positions, edges, spacing)
+        lines.extend("Station, %s, %s, %.1f %.1f 0, %.1f"%(name, _ip(i),
+                     positions[i][0] * spacing, positions[i][1] * spacing,
+                     ranges[i]) for i, name in enumerate(names))
+        lines.extend(["", "PropagationModel, logDistance, exp=3",
+                      "", "# Link, Station, adhoc, SSID, Mode, Channel"])
+        lines.extend("Link, %s, adhoc, swarm, g, 1"%name for name in names)
+        return "\n".join(lines) + "\n"
+
+    lines.extend("Station, %s, %s"%(name, _ip(i))
+                 for i, name in enumerate(names))
+    star = params["layout"] == "star"
+    switches = ["s1"] if star else ["s%d"%(i + 1) for i in range(len(names))]
+    lines.extend(["", "# Switch, Name"])
+    lines.extend("Switch, %s"%switch for switch in switches)
+    qos = ", ".join("%s"%params[key] if params[key] else ""
+                    for key in ("bw", "delay", "loss", "jitter",
+                                "max_queue_size"))
+    lines.extend(["", "# Link, Node1, Node2, Bw, Delay, Loss, Jitter, "
+                      "Max_queue_size"])
+    lines.extend("Link, %s, %s, %s"%(switches[0 if star else i], name, qos)
+                 for i, name in enumerate(names))
+    if not star:
+        lines.extend("Link, %s, %s, %s"%(switches[i], switches[j], qos)
+                     for i, j in edges)
+    return "\n".join(lines) + "\n"
+
+"""
+generate the scenario of params, see DEFAULTS, writing the CSV setup file
+and the Python topology file, or with py_file None, writing the topology
+as directives in the CSV setup file.  Returns a summary of the scenario.
+"""
+def generate_scenario(params, csv_file, py_file=None):
+    params = dict(DEFAULTS, **params)
+    if params["medium"] not in MEDIUMS:
+        raise RuntimeError("Invalid medium '%s', use one of %s"%(
+                           params["medium"], ", ".join(MEDIUMS)))
+    rng = Random(params["seed"])
+    names = robot_names(params["robots"])
+    positions, edges = layout_graph(params["layout"], params["robots"], rng,
+                                    params["radius"])
+    publishers, subscribers, robots = traffic_rows(params, names, edges, rng)
+
+    with open(csv_file, "w") as f:
+        f.write(setup_text(params, publishers, subscribers, robots))
+        if py_file is None:
+            f.write(topology_text(params, names, positions, edges))
+    if py_file is not None:
+        comment = "Generated by scenario_generator.py with %s"%json.dumps(
+                                                  params, sort_keys=True)
+        if params["medium"] == "wifi":
+            text = _wifi_text(params, names, positions, edges, comment)
+        else:
+            text = _wired_text(params, names, edges, comment)
+        with open(py_file, "w") as f:
+            f.write(text)
+    return {"robots": len(names), "edges": len(edges),
+            "components": component_count(len(names), edges),
+            "publishers": len(publishers), "subscribers": len(subscribers)}
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Generate a matching CSV setup file "
+                                        "and Python topology file for a "
+                                        "synthetic swarm")
+    parser.add_argument("layout", type=str, choices=LAYOUTS,
+                        help="Robot layout")
+    parser.add_argument("robots", type=int, help="Number of robots")
+    parser.add_argument("out_prefix", type=str,
+                        help="Write <out_prefix>.csv and <out_prefix>.py")
+    parser.add_argument("-e", "--embed", action="store_true",
+                        help="Write the topology as directives in "
+                             "<out_prefix>.csv instead of <out_prefix>.py, "
+                             "for mininet_runner py_file -")
+    parser.add_argument("-S", "--seed", type=int, default=DEFAULTS["seed"],
+                        help="Random seed for positions, roles and topics")
+    parser.add_argument("-m", "--medium", type=str, choices=MEDIUMS,
+                        default=DEFAULTS["medium"],
+                        help="Wired hosts and switches or wifi stations")
+    parser.add_argument("-g", "--spacing", type=float,
+                        default=DEFAULTS["spacing"],
+                        help="Meters between layout neighbors, with wifi")
+    parser.add_argument("-R", "--radius", type=float,
+                        default=DEFAULTS["radius"],
+                        help="Connection radius of the geometric layout, "
+                             "0 for 1.5 times the connectivity radius")
+    parser.add_argument("-T", "--traffic", type=str, choices=TRAFFICS,
+                        default=DEFAULTS["traffic"],
+                        help="Topics by role or by layout neighbor")
+    parser.add_argument("-r", "--roles", type=str, default=DEFAULTS["roles"],
+                        help="Role mix, e.g. 'leader:1,scout:4,worker:15'")
+    parser.add_argument("-n", "--topics", type=int,
+                        default=DEFAULTS["topics"],
+                        help="Topics published by each role")
+    parser.add_argument("-o", "--fanout", type=int,
+                        default=DEFAULTS["fanout"],
+                        help="Subscriber roles per topic, or neighbors per "
+                             "robot with neighbor traffic, 0 for all")
+    parser.add_argument("-f", "--frequency", type=str,
+                        default=DEFAULTS["frequency"],
+                        help="Publish frequency in Hz, or a range 'low:high'")
+    parser.add_argument("-s", "--size", type=str, default=DEFAULTS["size"],
+                        help="Message size in bytes, or a range 'low:high'")
+    parser.add_argument("-a", "--arrival", type=str,
+                        default=DEFAULTS["arrival"],
+                        help="Arrival model, e.g. 'poisson' or 'onoff 1 4', "
+                             "see traffic_models")
+    parser.add_argument("-z", "--sizes", type=str, default=DEFAULTS["sizes"],
+                        help="Size model, e.g. 'uniform 100 1000', "
+                             "'lognormal 0.5' or 'trace sizes.txt', see "
+                             "traffic_models")
+    parser.add_argument("-H", "--history", type=str,
+                        choices=["keep_last", "keep_all"],
+                        default=DEFAULTS["history"], help="QoS history")
+    parser.add_argument("-D", "--depth", type=int, default=DEFAULTS["depth"],
+                        help="QoS depth, with keep_last")
+    parser.add_argument("-l", "--reliability", type=str,
+                        choices=["reliable", "best_effort"],
+                        default=DEFAULTS["reliability"],
+                        help="QoS reliability")
+    parser.add_argument("-u", "--durability", type=str,
+                        choices=["transient_local", "volatile"],
+                        default=DEFAULTS["durability"],
+                        help="QoS durability")
+    parser.add_argument("-b", "--bw", type=float, default=DEFAULTS["bw"],
+                        help="Wired link bandwidth in Mbit/s, 0 for none")
+    parser.add_argument("-d", "--delay", type=str, default=DEFAULTS["delay"],
+                        help="Wired link delay, e.g. '2ms'")
+    parser.add_argument("-L", "--loss", type=float, default=DEFAULTS["loss"],
+                        help="Wired link % loss")
+    parser.add_argument("-j", "--jitter", type=str,
+                        default=DEFAULTS["jitter"],
+                        help="Wired link jitter, e.g. '1ms'")
+    parser.add_argument("-q", "--max_queue_size", type=int,
+                        default=DEFAULTS["max_queue_size"],
+                        help="Wired link queue size in packets, 0 for none")
+    args = parser.parse_args()
+
+    params = {key: getattr(args, key) for key in DEFAULTS}
+    # a trace file given here is relative to the current directory
+    params["sizes"] = absolute_sizes(params["sizes"], ".")
+    out_prefix = expanduser(args.out_prefix)
+    py_file = None if args.embed else "%s.py"%out_prefix
+    summary = generate_scenario(params, "%s.csv"%out_prefix, py_file)
+    print("scenario_generator: %s.csv%s: %s"%(out_prefix,
+                  "" if args.embed else " and %s.py"%out_prefix,
+                  json.dumps(summary, sort_keys=True)))
+    if summary["components"] > 1:
+        print("scenario_generator: warning: the layout has %d disconnected "
+              "parts"%summary["components"])
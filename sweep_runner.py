@@ -0,0 +1,333 @@
+#!/usr/bin/python3
+
+import sys
+import csv
+import json
+import subprocess
+from argparse import ArgumentParser
+from datetime import datetime
+from hashlib import sha1
+from itertools import product
+from os import makedirs, replace, remove
+from os.path import join, expanduser, abspath, dirname, isfile, getmtime
+from scenario_generator import GENERATOR_KEYS, generate_scenario
+from setup_reader import absolute_sizes
+
+# Run a scenario once per point of a parameter sweep, headless through
+# mininet_runner, each run under <sweep_dir>/<run_id>/:
+#   setup.csv        the CSV setup file with the point's overrides
+#   log.csv          the robot log, with log.csv.run.json from the runner
+#   metadata.json    the point, command, times and status, written last
+# Points whose metadata.json exists are skipped, so an interrupted sweep
+# resumes where it stopped.  With --persistent, all points run as one
+# mininet_runner --batch on a network that is built once, and the runner
+# writes each point's log.csv.run.json as its run finishes, so points of
+# an interrupted batch that finished get their metadata.json on resume.
+#
+# The sweep spec is a JSON file with a grid of values to combine and/or a
+# list of points, e.g.
+#   {"grid": {"bw": [10, 50], "loss": [0, 1, 5]},
+#    "points": [{"frequency": 50, "reliability": "best_effort"},
+#               {"arrival": "onoff 1 4", "sizes": "lognormal 0.5"}]}
+# Size trace files are relative to the sweep spec file, and those in the
+# CSV setup file to it, as each run's setup.csv is in another directory.
+#
+# Points with scenario_generator keys such as robots or layout, or every
+# point if the spec has "generate" scenario_generator parameters, run on a
+# generated scenario instead of py_file and csv_file, written to the run's
+# generated.csv and topology.py, e.g.
+#   {"generate": {"layout": "grid", "roles": "leader:1,worker:9"},
+#    "grid": {"robots": [25, 50, 100], "bw": [10, 50]}}
+
+# link parameters applied with mininet_runner --link_config
+LINK_KEYS = ["bw", "delay", "loss", "jitter", "max_queue_size"]
+
+# publisher parameters and QoS policies rewritten in the CSV setup file,
+# by column of the Publisher and Subscriber rows
+PUBLISHER_COLUMNS = {"frequency": 3, "size": 4, "history": 5, "depth": 6,
+                     "reliability": 7, "durability": 8, "arrival": 9,
+                     "sizes": 10}
+SUBSCRIBER_COLUMNS = {"history": 3, "depth": 4, "reliability": 5,
+                      "durability": 6}
+
+SWEEP_KEYS = LINK_KEYS + list(PUBLISHER_COLUMNS.keys()) + GENERATOR_KEYS
+
+# the points of a sweep spec, grid points first
+def sweep_points(spec):
+    points = list()
+    grid = spec.get("grid", dict())
+    keys = sorted(grid.keys())
+    for values in product(*[grid[key] for key in keys]):
+        points.append(dict(zip(keys, values)))
+    points.extend(spec.get("points", list()))
+    for point in points:
+        for key in point:
+            if key not in SWEEP_KEYS:
+                raise RuntimeError("Invalid sweep key '%s', use one of %s"%(
+                                   key, ", ".join(SWEEP_KEYS)))
+    return points
+
+# a readable run ID that is the same for the same point on every resume
+def run_id(point):
+    name = "_".join("%s-%s"%(key, point[key]) for key in sorted(point))
+    digest = sha1(json.dumps(point, sort_keys=True).encode()).hexdigest()
+    return "%s_%s"%("".join(c if c.isalnum() or c in "-_." else "-"
+                            for c in name) or "base", digest[:8])
+
+"""
+write csv_file with the point's publisher and QoS overrides to out_csv,
+with size trace files made absolute, those of the point from spec_dir.
+"""
+def write_setup(csv_file, point, out_csv, spec_dir):
+    csv_dir = dirname(abspath(csv_file))
+    with open(csv_file) as f:
+        lines = f.readlines()
+    for i, line in enumerate(lines):
+        row = next(csv.reader([line]), [])
+        mode = row[0].strip() if row else ""
+        if mode == "Publisher":
+            columns = PUBLISHER_COLUMNS
+        elif mode == "Subscriber":
+            columns = SUBSCRIBER_COLUMNS
+        else:
+            # comments and other rows are kept as written
+            continue
+        for key, column in columns.items():
+            if key in point:
+                # the optional traffic model columns may be missing
+                row.extend([""] * (column + 1 - len(row)))
+                row[column] = " %s"%point[key]
+        sizes = PUBLISHER_COLUMNS["sizes"]
+        if mode == "Publisher" and len(row) > sizes:
+            row[sizes] = " %s"%absolute_sizes(row[sizes].strip(),
+                         spec_dir if "sizes" in point else csv_dir)
+        lines[i] = ",".join(row) + "\n"
+    with open(out_csv, "w") as f:
+        f.writelines(lines)
+
+def _write_json(filename, value):
+    # write then rename so an interrupted write never marks a run complete
+    with open("%s.tmp"%filename, "w") as f:
+        json.dump(value, f, indent=2)
+        f.write("\n")
+    replace("%s.tmp"%filename, filename)
+
+# the mininet_runner command line, without the files to run
+def _runner_command(py_file):
+    return [sys.executable, join(dirname(abspath(__file__)),
+                                 "mininet_runner.py"), py_file]
+
+def _runner_options(args):
+    return ["--duration", str(args.duration),
+            "--warmup", str(args.warmup)] + args.runner_options.split()
+
+# True if the point runs on a generated scenario
+def generates(point, args):
+    return args.generate is not None \
+           or any(key in point for key in GENERATOR_KEYS)
+
+"""
+the run's directory with its setup file, and its generated scenario if
+any.  Returns the run's py_file, csv_file and link_config.
+"""
+def _prepare_run(point, args, run_dir):
+    makedirs(run_dir, exist_ok=True)
+    py_file = args.py_file
+    csv_file = args.csv_file
+    if generates(point, args):
+        params = dict(args.generate or dict())
+        params.update({key: point[key] for key in GENERATOR_KEYS
+                       if key in point})
+        if "sizes" in params:
+            params["sizes"] = absolute_sizes(params["sizes"], args.spec_dir)
+        py_file = join(run_dir, "topology.py")
+        csv_file = join(run_dir, "generated.csv")
+        generate_scenario(params, csv_file, py_file)
+    write_setup(csv_file, point, join(run_dir, "setup.csv"), args.spec_dir)
+    # run metadata left by an earlier, interrupted attempt
+    if isfile(join(run_dir, "log.csv.run.json")):
+        remove(join(run_dir, "log.csv.run.json"))
+    return py_file, csv_file, \
+           {key: point[key] for key in LINK_KEYS if key in point}
+
+def _run_metadata(point, args, cmd, py_file, csv_file):
+    return {"run_id": run_id(point), "point": point,
+            "py_file": py_file, "csv_file": csv_file,
+            "command": cmd,
+            "started": datetime.now().isoformat(timespec="seconds")}
+
+def _run_command(cmd, log_file):
+    print("sweep_runner: %s"%" ".join(cmd))
+    with open(log_file, "w") as f:
+        status = subprocess.call(cmd, stdout=f, stderr=subprocess.STDOUT)
+    if status != 0:
+        # clear what a failed run may have left behind
+        subprocess.call(["mn", "-c"], stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL)
+    return status
+
+# run one point on its own network, returns the runner's exit status
+def run_point(point, args, run_dir):
+    py_file, csv_file, link_config = _prepare_run(point, args, run_dir)
+    cmd = _runner_command(py_file) + [join(run_dir, "setup.csv"),
+                                   join(run_dir, "log.csv")] \
+                                + _runner_options(args)
+    if link_config:
+        cmd += ["--link_config", json.dumps(link_config)]
+
+    metadata = _run_metadata(point, args, cmd, py_file, csv_file)
+    status = _run_command(cmd, join(run_dir, "runner.log"))
+    metadata["finished"] = datetime.now().isoformat(timespec="seconds")
+    metadata["status"] = status
+    _write_json(join(run_dir, "metadata.json"), metadata)
+    return status
+
+def _batch_command(batch, args, batch_file):
+    return _runner_command(args.py_file) + [batch[0]["csv_file"],
+                                   batch[0]["out_file"]] \
+                                + _runner_options(args) \
+                                + ["--batch", batch_file]
+
+"""
+write the metadata.json of a point run in a batch from the run metadata
+the runner wrote when the run finished.  Returns the run's status.
+"""
+def _write_batch_metadata(point, args, cmd, started, run_file):
+    with open(run_file) as f:
+        status = json.load(f)["status"]
+    metadata = _run_metadata(point, args, cmd, args.py_file, args.csv_file)
+    metadata["started"] = started
+    metadata["finished"] = datetime.fromtimestamp(getmtime(run_file)
+                                     ).isoformat(timespec="seconds")
+    metadata["status"] = status
+    _write_json(join(dirname(run_file), "metadata.json"), metadata)
+    return status
+
+"""
+write the metadata.json of points that finished in an interrupted batch,
+from <sweep_dir>/batch.json and the run metadata of each finished run.
+"""
+def recover_persistent(points, args, sweep_dir):
+    batch_file = join(sweep_dir, "batch.json")
+    if not isfile(batch_file):
+        return
+    with open(batch_file) as f:
+        batch = json.load(f)
+    cmd = _batch_command(batch, args, batch_file)
+    started = datetime.fromtimestamp(getmtime(batch_file)
+                                     ).isoformat(timespec="seconds")
+    out_files = set(run["out_file"] for run in batch)
+    for point in points:
+        run_dir = join(sweep_dir, run_id(point))
+        run_file = join(run_dir, "log.csv.run.json")
+        if join(run_dir, "log.csv") in out_files \
+                     and isfile(run_file) \
+                     and not isfile(join(run_dir, "metadata.json")):
+            print("sweep_runner: %s finished in an interrupted batch"
+                  %run_id(point))
+            _write_batch_metadata(point, args, cmd, started, run_file)
+
+"""
+run points as one mininet_runner batch on a network built once, only
+restarting the robots and resetting the links between points.  Returns
+the number of failed points.
+"""
+def run_points_persistent(points, args, sweep_dir):
+    batch = list()
+    for point in points:
+        run_dir = join(sweep_dir, run_id(point))
+        batch.append({"csv_file": join(run_dir, "setup.csv"),
+                      "out_file": join(run_dir, "log.csv"),
+                      "link_config": _prepare_run(point, args, run_dir)[2]})
+    batch_file = join(sweep_dir, "batch.json")
+    _write_json(batch_file, batch)
+    cmd = _batch_command(batch, args, batch_file)
+    started = datetime.now().isoformat(timespec="seconds")
+    _run_command(cmd, join(sweep_dir, "batch.log"))
+
+    # each point's status is in the run metadata the runner wrote for it
+    failures = 0
+    for point, run in zip(points, batch):
+        run_file = "%s.run.json"%run["out_file"]
+        if not isfile(run_file):
+            print("sweep_runner: %s did not run"%run_id(point))
+            failures += 1
+            continue
+        failures += _write_batch_metadata(point, args, cmd, started,
+                                          run_file) != 0
+    return failures
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Run a parameter sweep of Mininet "
+                                        "swarm emulations")
+    parser.add_argument("py_file", type=str,
+                        help="Python network setup file, unused by "
+                             "generated scenarios")
+    parser.add_argument("csv_file", type=str,
+                        help="CSV communication setup file, unused by "
+                             "generated scenarios")
+    parser.add_argument("sweep_file", type=str, help="JSON sweep spec file")
+    parser.add_argument("sweep_dir", type=str,
+                        help="Directory for the run results")
+    parser.add_argument("-d", "--duration", type=float, default=60,
+                        help="Seconds to measure in each run")
+    parser.add_argument("-w", "--warmup", type=float, default=5,
+                        help="Seconds to run robots before measuring")
+    parser.add_argument("-r", "--retry_failed", action="store_true",
+                        help="Rerun completed points whose status was not 0")
+    parser.add_argument("-p", "--persistent", action="store_true",
+                        help="Run all points on one network instead of "
+                             "building the network for each point")
+    parser.add_argument("-o", "--runner_options", type=str, default="",
+                        help="Extra mininet_runner options, e.g. "
+                             "'--log_format binary'")
+    args = parser.parse_args()
+    if args.py_file != "-":
+        args.py_file = abspath(expanduser(args.py_file))
+    args.csv_file = abspath(expanduser(args.csv_file))
+    sweep_dir = expanduser(args.sweep_dir)
+    args.spec_dir = dirname(abspath(expanduser(args.sweep_file)))
+
+    with open(expanduser(args.sweep_file)) as f:
+        spec = json.load(f)
+    points = sweep_points(spec)
+    args.generate = spec.get("generate")
+    if args.persistent and any(generates(point, args) for point in points):
+        raise RuntimeError("--persistent runs on one network, so it cannot "
+                           "run generated scenarios")
+    makedirs(sweep_dir, exist_ok=True)
+    _write_json(join(sweep_dir, "sweep.json"), {
+                "py_file": args.py_file, "csv_file": args.csv_file,
+                "generate": args.generate,
+                "duration": args.duration, "warmup": args.warmup,
+                "runs": [{"run_id": run_id(point), "point": point}
+                         for point in points]})
+
+    if args.persistent:
+        recover_persistent(points, args, sweep_dir)
+
+    failures = 0
+    pending = list()
+    for count, point in enumerate(points, 1):
+        run_dir = join(sweep_dir, run_id(point))
+        metadata_file = join(run_dir, "metadata.json")
+        if isfile(metadata_file):
+            with open(metadata_file) as f:
+                status = json.load(f)["status"]
+            if status == 0 or not args.retry_failed:
+                print("sweep_runner: %d of %d %s done, status %d"%(
+                          count, len(points), run_id(point), status))
+                failures += status != 0
+                continue
+        if args.persistent:
+            pending.append(point)
+            continue
+        print("sweep_runner: %d of %d %s"%(count, len(points), run_id(point)))
+        failures += run_point(point, args, run_dir) != 0
+
+    if pending:
+        print("sweep_runner: running %d points on one network"%len(pending))
+        failures += run_points_persistent(pending, args, sweep_dir)
+
+    print("sweep_runner: %d of %d runs failed"%(failures, len(points)))
+    sys.exit(1 if failures else 0)
@@ -14,6 +14,7 @@ setup(
     ],
     install_requires=['setuptools'],
     zip_safe=True,
+    tests_require=['pytest'],
     author='Bruce Allen',
     author_email='bdallen@nps.edu',
     maintainer='Bruce Allen',
@@ -28,7 +29,8 @@ setup(
     license='your license',
     entry_points={
         'console_scripts': [
-            'testbed_robot = testbed_nodes.testbed_robot:main'
+            'testbed_robot = testbed_nodes.testbed_robot:main',
+            'testbed_group = testbed_nodes.testbed_group:main'
         ],
     },
 )
@@ -0,0 +1,53 @@
+from os import listdir
+from os.path import join
+import pytest
+
+pytest.importorskip("rclpy")
+pytest.importorskip("testbed_msg")
+from testbed_nodes.testbed_robot import TestbedRobot
+
+# the barrier state of a TestbedRobot, without a ROS2 node or peers
+class BarrierRobot(TestbedRobot):
+    def __init__(self, ready_dir, start_file):
+        self.robot_name = "R1"
+        self.ready_dir = ready_dir
+        self.start_file = start_file
+        self.start_time = 0
+        self.ready = False
+        self.barrier_timer = "barrier_timer"
+        self.matched = False
+        self.destroyed_timers = list()
+        self.publishing = False
+
+    def _matched(self):
+        return self.matched
+
+    def destroy_timer(self, timer):
+        self.destroyed_timers.append(timer)
+
+    def _start_publishing(self):
+        self.publishing = True
+
+def test_barrier_callback(tmp_path):
+    ready_dir = str(tmp_path)
+    start_file = join(ready_dir, "start")
+    robot = BarrierRobot(ready_dir, start_file)
+
+    # not matched and not started
+    robot._barrier_callback()
+    assert listdir(ready_dir) == []
+    assert not robot.publishing
+
+    # matched, reported ready but held until the start file exists
+    robot.matched = True
+    robot._barrier_callback()
+    assert listdir(ready_dir) == ["R1"]
+    assert robot.ready
+    assert not robot.publishing
+
+    # started
+    with open(start_file, "w") as f:
+        f.write("0\n")
+    robot._barrier_callback()
+    assert robot.publishing
+    assert robot.destroyed_timers == ["barrier_timer"]
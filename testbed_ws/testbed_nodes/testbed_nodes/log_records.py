@@ -0,0 +1,59 @@
+from struct import Struct
+
+# Fixed-width binary log records, an alternative to the CSV tx/rx rows.
+#
+# Robot and topic names are interned as indexes into the name tables derived
+# from the scenario setup file, so every robot and every analysis tool
+# assigns the same IDs without writing a name table.  Timestamps are int64
+# perf_counter_ns() values, so no precision is lost to "%f" formatting.
+#
+# Record fields, little-endian, no padding:
+#   version, kind, from, to, topic, tx_count, rx_count, size, latency_ns,
+#   timestamp_ns
+# rx records carry the one-way latency computed by the receiver from the
+# transmit timestamp in the message.  tx records are written once per
+# publish with to set to ALL_RECIPIENTS, analysis expands them against the
+# setup file's all_recipients, and have rx_count, size and latency_ns 0.
+
+RECORD_VERSION = 2
+TX = 1
+RX = 2
+ALL_RECIPIENTS = 0xffff
+
+RECORD_STRUCT = Struct("<BBHHHIIIqq")
+RECORD_SIZE = RECORD_STRUCT.size
+
+# numpy dtype description of the same record, for numpy.dtype(RECORD_DTYPE)
+RECORD_DTYPE = [("version", "u1"), ("kind", "u1"),
+                ("from", "<u2"), ("to", "<u2"), ("topic", "<u2"),
+                ("tx_count", "<u4"), ("rx_count", "<u4"), ("size", "<u4"),
+                ("latency_ns", "<i8"), ("timestamp_ns", "<i8")]
+
+# robot names in setup order and topic names in sorted order
+def name_tables(setup):
+    robot_names = [robot["robot_name"] for robot in setup["robots"]]
+    topic_names = sorted(set(
+                     [publisher["topic"] for publisher in setup["publishers"]]
+                   + [subscriber["topic"]
+                      for subscriber in setup["subscribers"]]))
+    return robot_names, topic_names
+
+# key=name, value=ID
+def name_ids(names):
+    return {name: i for i, name in enumerate(names)}
+
+def tx_record(from_id, topic_id, tx_count, timestamp_ns):
+    return RECORD_STRUCT.pack(RECORD_VERSION, TX, from_id, ALL_RECIPIENTS,
+                              topic_id, tx_count, 0, 0, 0, timestamp_ns)
+
+def rx_record(from_id, to_id, topic_id, tx_count, rx_count, size,
+              latency_ns, timestamp_ns):
+    return RECORD_STRUCT.pack(RECORD_VERSION, RX, from_id, to_id, topic_id,
+                              tx_count, rx_count, size, latency_ns,
+                              timestamp_ns)
+
+# binary logs start with the record version byte, CSV logs with a name
+def is_binary_log(filename):
+    with open(filename, "rb") as f:
+        first = f.read(1)
+    return first == bytes([RECORD_VERSION])
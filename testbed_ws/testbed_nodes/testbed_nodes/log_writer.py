@@ -0,0 +1,71 @@
+from threading import Thread
+from queue import Queue, Empty
+from time import monotonic
+from fcntl import flock, LOCK_EX, LOCK_UN
+
+# Background log writer so that ROS2 callbacks only enqueue records.
+#
+# A single writer thread drains the queue and writes records to the out_file
+# in large chunks, taking the exclusive flock once per chunk instead of once
+# per message.  A chunk is written when it reaches max_batch_bytes or when
+# flush_interval seconds have passed since the last write, whichever is
+# first.  The queue holds at most max_queue records: when it is full,
+# callbacks block until the writer catches up, so memory stays bounded and
+# no records are dropped.  Records are str, or bytes if f is opened in
+# binary mode.
+class LogWriter():
+
+    _STOP = None # sentinel
+
+    def __init__(self, f, flush_interval=1.0, max_batch_bytes=1<<20,
+                 max_queue=100000):
+        self.f = f
+        self.flush_interval = flush_interval
+        self.max_batch_bytes = max_batch_bytes
+        self.empty = b"" if "b" in f.mode else ""
+        self.queue = Queue(maxsize=max_queue)
+        self.thread = Thread(target=self._run, name="log_writer", daemon=True)
+        self.thread.start()
+
+    # enqueue one record, called from ROS2 callbacks
+    def write(self, record):
+        self.queue.put(record)
+
+    # write any queued records and stop the writer thread
+    def close(self):
+        self.queue.put(LogWriter._STOP)
+        self.thread.join()
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        flock(self.f, LOCK_EX) # exclusive lock
+        self.f.write(self.empty.join(batch))
+        self.f.flush()
+        flock(self.f, LOCK_UN) # unlock
+
+    def _run(self):
+        batch = list()
+        batch_bytes = 0
+        deadline = monotonic() + self.flush_interval
+        while True:
+            try:
+                record = self.queue.get(
+                               timeout=max(0, deadline - monotonic()))
+            except Empty:
+                record = self.empty
+
+            if record is LogWriter._STOP:
+                self._write_batch(batch)
+                return
+
+            if record:
+                batch.append(record)
+                batch_bytes += len(record)
+
+            if batch_bytes >= self.max_batch_bytes or \
+                                   monotonic() >= deadline:
+                self._write_batch(batch)
+                batch = list()
+                batch_bytes = 0
+                deadline = monotonic() + self.flush_interval
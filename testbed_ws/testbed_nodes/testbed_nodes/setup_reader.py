@@ -1,17 +1,25 @@
 #!/usr/bin/env python3
-from sys import version_info
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
-from os.path import expanduser
+from os import makedirs, replace, stat, getpid
+from os.path import expanduser, join, dirname, abspath
+from urllib.parse import quote
 import csv
+import json
 from collections import defaultdict
-from json import dumps
-if version_info[0] == 3:
-    # Python3 is for ROS2
-    from rclpy.qos import QoSDurabilityPolicy, QoSHistoryPolicy, \
-         QoSReliabilityPolicy, QoSProfile
+
+# The setup is compiled once into <setup_file>.compiled/, invalidated by the
+# setup file's mtime and size:
+#   setup.json          the whole setup with its role and topic indexes
+#   role_<role>.json    the slice of the setup that robots of one role need
+# so that each robot loads only its own slice instead of parsing the CSV.
+SETUP_CACHE_VERSION = 3
 
 # ref. https://github.com/ros2/demos/blob/master/topic_monitor/topic_monitor/scripts/data_publisher.py
 def qos_profile(d):
+    # imported here so that tools without ROS2 can still read setup files
+    from rclpy.qos import QoSDurabilityPolicy, QoSHistoryPolicy, \
+         QoSReliabilityPolicy, QoSProfile
+
     history = d["history"]             # keep_last|keep_all
     depth = d["depth"]                 # used if using keep_last
     reliability = d["reliability"]     # reliable|best_effort
@@ -50,6 +58,31 @@ def qos_profile(d):
 
     return profile
 
+# Optional traffic model columns after Durability, see traffic_models:
+#   Arrival: periodic | poisson | onoff On Off | ramp To Over
+#   Sizes:   fixed | uniform Low High | lognormal Sigma | trace File
+# Model arguments are separated by spaces.  By argument count of each model:
+ARRIVAL_MODELS = {"periodic": 0, "poisson": 0, "onoff": 2, "ramp": 2}
+SIZE_MODELS = {"fixed": 0, "uniform": 2, "lognormal": 1, "trace": 1}
+
+# model name and arguments, as a list
+def _traffic_model(text, models):
+    name, *args = text.split()
+    if name not in models:
+        raise RuntimeError("Invalid traffic model: %s"%name)
+    if len(args) != models[name]:
+        raise RuntimeError("Traffic model %s takes %d arguments"%(
+                           name, models[name]))
+    return [name] + [_value(arg) for arg in args]
+
+# a Sizes column with a relative trace file made absolute from directory,
+# so that the setup can be copied to another directory
+def absolute_sizes(text, directory):
+    name, *args = text.split() or [""]
+    if name != "trace" or not args:
+        return text
+    return "trace %s"%abspath(join(directory, expanduser(args[0])))
+
 def _publish_record(row):
     d=dict()
     d["role"]=row[0]
@@ -61,6 +94,11 @@ def _publish_record(row):
     d["depth"] = int(row[5])
     d["reliability"] = row[6]
     d["durability"] = row[7]
+
+    # optional traffic models, default fixed size at a fixed period
+    d["arrival"] = _traffic_model(_column(row, 8, "periodic"),
+                                  ARRIVAL_MODELS)
+    d["sizes"] = _traffic_model(_column(row, 9, "fixed"), SIZE_MODELS)
     return d
 
 def _subscribe_record(row):
@@ -78,28 +116,132 @@ def _robot_record(row):
     d=dict()
     d["robot_name"] = row[0]
     d["role"] = row[1]
+
+    # optional Mininet host, robots on one host can run in one testbed_group
+    if len(row) > 2 and row[2]:
+        d["host"] = row[2]
+    else:
+        d["host"] = row[0]
     return d
 
-# get lists of subscriber robot names by key=topic, value=list(names)
-def _recipients(subscribers, robots):
+# Optional topology directives, used when mininet_runner builds the network
+# from the setup file instead of a Python topology file:
+#   Station, Name, IP, Position, Range
+#   Switch, Name
+#   Link, Node1, Node2, Bw, Delay, Loss, Jitter, Max_queue_size
+#   Link, Station, adhoc, SSID, Mode, Channel
+#   PropagationModel, Model, key=value, ...
+#   MobilityModel, Model, key=value, ...
+#   Mobility, Station, start|stop, Time, Position
+# Columns after the name may be empty.  Positions are "x y z" in meters.
+# Link QoS fields are those of TCLink, bw in Mbit/s, delay and jitter
+# such as 2ms, loss in % and max_queue_size in packets.
 
-    # get subscribers: key=topic, value=list(robot names)
-    all_recipients = defaultdict(list)
+# TCLink QoS fields by Link column
+LINK_FIELDS = [("bw", float), ("delay", str), ("loss", float),
+               ("jitter", str), ("max_queue_size", int)]
+
+# column i of row, or default if it is missing or empty
+def _column(row, i, default=None):
+    if len(row) > i and row[i]:
+        return row[i]
+    return default
+
+def _position(text):
+    return [float(x) for x in text.split()]
+
+# a number if the text is one
+def _value(text):
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+def _station_record(row):
+    d=dict()
+    d["name"] = row[0]
+    d["ip"] = _column(row, 1, "")
+    position = _column(row, 2)
+    d["position"] = _position(position) if position else None
+    node_range = _column(row, 3)
+    d["range"] = float(node_range) if node_range else None
+    return d
+
+def _switch_record(row):
+    d=dict()
+    d["name"] = row[0]
+    return d
+
+def _link_record(row):
+    d=dict()
+    d["node1"] = row[0]
+    d["node2"] = row[1]
+    if d["node2"] == "adhoc":
+        d["ssid"] = _column(row, 2, "adhoc")
+        d["mode"] = _column(row, 3, "g")
+        d["channel"] = int(_column(row, 4, 1))
+        return d
+    d["params"] = dict()
+    for i, (key, convert) in enumerate(LINK_FIELDS):
+        value = _column(row, i + 2)
+        if value:
+            d["params"][key] = convert(value)
+    return d
+
+# model and key=value parameters
+def _model_record(row):
+    d=dict()
+    d["model"] = row[0]
+    for field in row[1:]:
+        if field:
+            key, value = field.split("=")
+            d[key.strip()] = _value(value.strip())
+    return d
+
+def _mobility_record(row):
+    d=dict()
+    d["station"] = row[0]
+    d["action"] = row[1]
+    if d["action"] not in ("start", "stop"):
+        raise RuntimeError("Invalid mobility action: %s"%d["action"])
+    d["time"] = float(row[2])
+    d["position"] = _position(row[3])
+    return d
+
+# get lists of subscriber robot names by key=topic, value=list(names),
+# with every topic present, in linear time using the role indexes
+def _recipients(topics, subscribers_by_role, subscribers, robots):
+    all_recipients = {topic: list() for topic in topics}
     for robot in robots:
-        print("robot: ", robot)
-        for subscriber in subscribers:
-            print("subscriber: ", subscriber)
-            if subscriber["role"] == robot["role"]:
-                all_recipients[subscriber["topic"]].append(
+        for index in subscribers_by_role.get(robot["role"], []):
+            all_recipients[subscribers[index]["topic"]].append(
                                                        robot["robot_name"])
     return all_recipients
 
+# key=role, value=list(indexes of the role's records)
+def _role_index(records):
+    index = defaultdict(list)
+    for i, record in enumerate(records):
+        index[record["role"]].append(i)
+    return dict(index)
+
+# key=topic, value=number of robots publishing it
+def _publisher_counts(topics, publishers, robots_by_role):
+    publisher_counts = {topic: 0 for topic in topics}
+    for publisher in publishers:
+        publisher_counts[publisher["topic"]] += \
+                            len(robots_by_role.get(publisher["role"], []))
+    return publisher_counts
+
 # throws
-def read_setup(filename):
+def read_setup(filename, verbose=False):
     publishers = list()
     subscribers = list()
     robots = list()
     stations = list()
+    switches = list()
     links = list()
     propagation_model = dict()
     mobility_model = dict()
@@ -114,7 +256,8 @@ def read_setup(filename):
 
             # remove spaces
             row=[x.strip() for x in row]
-            print(row)
+            if verbose:
+                print(row)
 
             # blank or comment in first column
             if not row or not row[0] or row[0][0]=="#":
@@ -129,6 +272,18 @@ def read_setup(filename):
                     subscribers.append(_subscribe_record(row[1:]))
                 elif mode == "Robot":
                     robots.append(_robot_record(row[1:]))
+                elif mode == "Station":
+                    stations.append(_station_record(row[1:]))
+                elif mode == "Switch":
+                    switches.append(_switch_record(row[1:]))
+                elif mode == "Link":
+                    links.append(_link_record(row[1:]))
+                elif mode == "PropagationModel":
+                    propagation_model = _model_record(row[1:])
+                elif mode == "MobilityModel":
+                    mobility_model = _model_record(row[1:])
+                elif mode == "Mobility":
+                    mobilities.append(_mobility_record(row[1:]))
                 else:
                     print("invalid directive '%s' for row '%s'"%(
                                             mode, ",".join(row)))
@@ -136,25 +291,138 @@ def read_setup(filename):
             except Exception:
                 raise RuntimeError("Invalid line: %s.  Aborting"%row)
 
+    # size traces are relative to the setup file
+    for publisher in publishers:
+        if publisher["sizes"][0] == "trace":
+            publisher["sizes"][1] = join(dirname(abspath(filename)),
+                                         str(publisher["sizes"][1]))
+
     setup = dict()
     setup["publishers"] = publishers
     setup["subscribers"] = subscribers
     setup["robots"] = robots
-    setup["all_recipients"] = _recipients(subscribers, robots)
+    setup["stations"] = stations
+    setup["switches"] = switches
+    setup["links"] = links
+    setup["propagation_model"] = propagation_model
+    setup["mobility_model"] = mobility_model
+    setup["mobilities"] = mobilities
+    if mobilities:
+        start_mobility["time"] = min(m["time"] for m in mobilities)
+        stop_mobility["time"] = max(m["time"] for m in mobilities)
+    setup["start_mobility"] = start_mobility
+    setup["stop_mobility"] = stop_mobility
+    topics = sorted(set([publisher["topic"] for publisher in publishers]
+                      + [subscriber["topic"] for subscriber in subscribers]))
+    setup["publishers_by_role"] = _role_index(publishers)
+    setup["subscribers_by_role"] = _role_index(subscribers)
+    setup["robots_by_role"] = _role_index(robots)
+    setup["all_recipients"] = _recipients(topics,
+                          setup["subscribers_by_role"], subscribers, robots)
+    setup["publisher_counts"] = _publisher_counts(topics, publishers,
+                                                  setup["robots_by_role"])
     return setup
 
+"""
+the part of the setup that robots of one role need: the role's publishers
+and subscribers, the recipients of the topics it publishes, the publisher
+counts of the topics it subscribes to, and the robot and topic name
+tables for binary log records.
+"""
+def robot_setup(setup, role):
+    publishers = [setup["publishers"][i]
+                  for i in setup["publishers_by_role"].get(role, [])]
+    subscribers = [setup["subscribers"][i]
+                   for i in setup["subscribers_by_role"].get(role, [])]
+    role_setup = dict()
+    role_setup["role"] = role
+    role_setup["publishers"] = publishers
+    role_setup["subscribers"] = subscribers
+    role_setup["all_recipients"] = {publisher["topic"]:
+                     setup["all_recipients"][publisher["topic"]]
+                     for publisher in publishers}
+    role_setup["publisher_counts"] = {subscriber["topic"]:
+                     setup["publisher_counts"][subscriber["topic"]]
+                     for subscriber in subscribers}
+    role_setup["robot_names"] = [robot["robot_name"]
+                                 for robot in setup["robots"]]
+    role_setup["topic_names"] = sorted(setup["all_recipients"].keys())
+    return role_setup
+
+def cache_dir(filename):
+    return "%s.compiled"%filename
+
+def _role_file(filename, role):
+    return join(cache_dir(filename), "role_%s.json"%quote(role, safe=""))
+
+# identifies the version of the setup file that a compiled file came from
+def _stamp(filename):
+    st = stat(filename)
+    return [SETUP_CACHE_VERSION, st.st_mtime_ns, st.st_size]
+
+# the compiled value if it is from this version of the setup file else None
+def _load_compiled(compiled_file, stamp):
+    try:
+        with open(compiled_file) as f:
+            compiled = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if compiled.get("stamp") != stamp:
+        return None
+    return compiled["value"]
+
+def _write_compiled(compiled_file, stamp, value):
+    # write then rename so a concurrent reader never sees a partial file
+    tmp_file = "%s.%d.tmp"%(compiled_file, getpid())
+    with open(tmp_file, "w") as f:
+        json.dump({"stamp": stamp, "value": value}, f)
+    replace(tmp_file, compiled_file)
+
+# compile the setup file, writing the whole setup and every role's slice
+def compile_setup(filename, verbose=False):
+    stamp = _stamp(filename)
+    setup = read_setup(filename, verbose)
+    try:
+        makedirs(cache_dir(filename), exist_ok=True)
+        for role in setup["robots_by_role"]:
+            _write_compiled(_role_file(filename, role), stamp,
+                            robot_setup(setup, role))
+        _write_compiled(join(cache_dir(filename), "setup.json"), stamp,
+                        setup)
+    except OSError as e:
+        # a read-only scenario directory, read the CSV each time instead
+        print("setup_reader: not caching %s: %s"%(filename, e))
+    return setup
+
+# the setup, compiled when the setup file is new or changed
+def load_setup(filename, verbose=False):
+    setup = _load_compiled(join(cache_dir(filename), "setup.json"),
+                           _stamp(filename))
+    if setup is None:
+        setup = compile_setup(filename, verbose)
+    return setup
+
+# the setup slice for robots of one role, see robot_setup
+def load_robot_setup(filename, role):
+    role_setup = _load_compiled(_role_file(filename, role), _stamp(filename))
+    if role_setup is None:
+        role_setup = robot_setup(compile_setup(filename), role)
+    return role_setup
+
 def show_setup(filename, setup):
     print("Scenario file: %s"%filename)
-    print(dumps(setup, indent=4, sort_keys=True))
+    print(json.dumps(setup, indent=4, sort_keys=True))
 
 if __name__ == '__main__':
     parser = ArgumentParser(description="Check your setup file.",
                             formatter_class=ArgumentDefaultsHelpFormatter)
     parser.add_argument("setup_file", type=str, help="The scenario setup file.")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Show each row as it is read.")
     args = parser.parse_args()
 
-    # show setup
+    # show setup, compiling it again
     setup_file = expanduser(args.setup_file)
-    setup = read_setup(setup_file)
+    setup = compile_setup(setup_file, args.verbose)
     show_setup(setup_file, setup)
 
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+from sys import stdout
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from signal import signal, SIGTERM
+import rclpy
+from rclpy.executors import MultiThreadedExecutor, ExternalShutdownException
+from testbed_nodes.setup_reader import load_setup, robot_setup
+from testbed_nodes.log_writer import LogWriter
+from testbed_nodes.testbed_robot import TestbedRobot, add_options, \
+                                        log_file, interrupt
+
+# Run the TestbedRobot nodes of every robot assigned to one Mininet host in
+# one process, on one MultiThreadedExecutor and one rclpy context, so the
+# robots share the rclpy import and init cost and, on ROS2 distributions
+# that map a context to one DDS participant, the participant.  Robots are
+# assigned to hosts by the optional Host column of the Robot directive.
+
+def main():
+    parser = ArgumentParser(description="Run the testbed robots of one host "
+                                        "in one process.",
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("host", type=str,
+                        help="Run the robots assigned to this host.")
+    parser.add_argument("setup_file", type=str, help="The scenario setup file.")
+    parser.add_argument("out_file", type=str, help="The output file.")
+    parser.add_argument("-n", "--threads", type=int,
+                        help="Executor threads, 0 for one per CPU.",
+                        default=0)
+    add_options(parser)
+    args = parser.parse_args()
+
+    setup = load_setup(args.setup_file)
+    robots = [robot for robot in setup["robots"]
+              if robot["host"] == args.host]
+    print("Starting testbed_group %s robots %s"%(args.host,
+                    ", ".join([robot["robot_name"] for robot in robots])))
+    stdout.flush()
+    if not robots:
+        raise RuntimeError("No robots for host %s"%args.host)
+
+    # one log writer per log file, shared by robots logging to one file
+    binary = args.log_format == "binary"
+    files = dict()
+    logs = dict()
+    for robot in robots:
+        out_file = log_file(args.out_file, robot["robot_name"], args.shard)
+        if out_file not in logs:
+            files[out_file] = open(out_file, "ab" if binary else "a")
+            logs[out_file] = LogWriter(files[out_file],
+                                       flush_interval=args.flush_interval,
+                                       max_queue=args.max_queue)
+
+    signal(SIGTERM, interrupt)
+    rclpy.init()
+    executor = MultiThreadedExecutor(num_threads=args.threads or None)
+    robot_nodes = list()
+    role_setups = dict()
+    try:
+        for robot in robots:
+            if robot["role"] not in role_setups:
+                role_setups[robot["role"]] = robot_setup(setup, robot["role"])
+            robot_node = TestbedRobot(robot["robot_name"], robot["role"],
+                             args.setup_file,
+                             logs[log_file(args.out_file,
+                                           robot["robot_name"], args.shard)],
+                             binary, args.tx_log_every, args.ready_dir,
+                             args.start_file, args.start_time,
+                             role_setups[robot["role"]])
+            robot_nodes.append(robot_node)
+            executor.add_node(robot_node)
+        executor.spin()
+    except (KeyboardInterrupt, ExternalShutdownException):
+        pass
+    finally:
+        # stop the callbacks, then write out any log records still queued
+        executor.shutdown()
+        for robot_node in robot_nodes:
+            robot_node.destroy_node()
+        for log in logs.values():
+            log.close()
+        for f in files.values():
+            f.close()
+        if rclpy.ok():
+            rclpy.shutdown()
+
+if __name__ == '__main__':
+    main()
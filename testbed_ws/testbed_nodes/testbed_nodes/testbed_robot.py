@@ -1,98 +1,220 @@
 #!/usr/bin/env python3
 from sys import stdout
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
-from os.path import join, expanduser
+from os import makedirs, replace
+from os.path import join, expanduser, isfile
 from collections import defaultdict
-from time import perf_counter, sleep
+from time import perf_counter_ns, sleep, time
+from signal import signal, SIGTERM
 import random
-from fcntl import flock, LOCK_EX, LOCK_UN
 import rclpy
 from rclpy.node import Node
+from rclpy.executors import ExternalShutdownException
 from testbed_msg.msg import TestbedMessage
-from testbed_nodes.setup_reader import read_setup, qos_profile
+from testbed_nodes.setup_reader import load_robot_setup, qos_profile
+from testbed_nodes.log_writer import LogWriter
+from testbed_nodes.log_records import name_ids, tx_record, rx_record
+from testbed_nodes.traffic_models import arrival_model, size_model
 
 class TestbedRobot(Node):
 
-    def _make_publisher_timer_callback_function(self, topic_name, size,
-                                                recipients, f):
+    def _make_publisher_timer_callback_function(self, topic_name, sizes, log):
         def fn():
             self.publish_counters[topic_name] += 1
             transmit_count = self.publish_counters[topic_name]
 
             # compose message
+            tx_time_ns = perf_counter_ns()
             msg = TestbedMessage()
             msg.publisher_name = self.robot_name
             msg.tx_count = transmit_count
-            msg.message = topic_name[0]*size
+            msg.tx_time_ns = tx_time_ns
+            msg.message = topic_name[0]*sizes.next_size()
 
-            # compose network metadata log
-            s = ""
-            for recipient_robot_name in recipients:
-                s += "%s,%s,%s,%d,%f\n"%(
+            # publish the message
+            self.publisher_managers[topic_name].publish(msg)
+
+            # tx logging is optional since receivers log latency directly
+            if not self.tx_log_every or transmit_count % self.tx_log_every:
+                return
+
+            # tx log, once per publish: from, topic, tx count, ts
+            # Analysis expands it against the topic's recipients.
+            if self.binary:
+                s = tx_record(self.robot_ids[self.robot_name],
+                              self.topic_ids[topic_name],
+                              transmit_count,
+                              tx_time_ns)
+            else:
+                s = "%s,%s,%d,%f\n"%(
                            self.robot_name,
-                           recipient_robot_name,
                            topic_name,
                            transmit_count,
-                           perf_counter())
-
-            # publish the message
-            self.publisher_managers[topic_name].publish(msg)
+                           tx_time_ns / 1e9)
 
             # log the publish metadata
-            flock(f, LOCK_EX) # exclusive lock
-            f.write(s)
-            f.flush()
-            flock(f, LOCK_UN) # unlock
+            log.write(s)
         return fn
 
-    def _make_subscriber_callback_function(self, topic_name, f):
+    def _make_subscriber_callback_function(self, topic_name, log):
         def fn(msg):
             self.subscribe_counters[topic_name] += 1
             receive_count = self.subscribe_counters[topic_name]
 
-            # rx log: from, to, topic, tx count, rx count, msg size, ts
-            response = "%s,%s,%s,%d,%d,%d,%f\n"%(
-                           msg.publisher_name,
-                           self.robot_name,
-                           topic_name,
-                           msg.tx_count,
-                           self.subscribe_counters[topic_name],
-                           len(msg.message),
-                           perf_counter())
+            # one-way latency from the transmit timestamp in the message
+            rx_time_ns = perf_counter_ns()
+            latency_ns = rx_time_ns - msg.tx_time_ns
+
+            # rx log: from, to, topic, tx count, rx count, msg size,
+            # latency ms, ts
+            if self.binary:
+                response = rx_record(self.robot_ids[msg.publisher_name],
+                                     self.robot_ids[self.robot_name],
+                                     self.topic_ids[topic_name],
+                                     msg.tx_count,
+                                     receive_count,
+                                     len(msg.message),
+                                     latency_ns,
+                                     rx_time_ns)
+            else:
+                response = "%s,%s,%s,%d,%d,%d,%f,%f\n"%(
+                               msg.publisher_name,
+                               self.robot_name,
+                               topic_name,
+                               msg.tx_count,
+                               receive_count,
+                               len(msg.message),
+                               latency_ns / 1e6,
+                               rx_time_ns / 1e9)
 
             # log the response metadata
-            flock(f, LOCK_EX) # exclusive lock
-            f.write(response)
-            f.flush()
-            flock(f, LOCK_UN) # unlock
+            log.write(response)
         return fn
 
-    def __init__(self, robot_name, role, setup_file, f):
+    # publish at the times of the arrival model with a one-shot timer that
+    # is replaced after it fires, since rclpy timers are periodic.  Each
+    # time is from the previous one rather than from when the callback ran
+    # so that callback delays do not lower the offered rate.
+    def _schedule_publishing(self, index, publish, arrivals, due_ns):
+        interval = arrivals.next_interval()
+        if interval is None:
+            # the model stopped publishing
+            return
+        due_ns += int(interval * 1e9)
+        def fn():
+            self.destroy_timer(self.publisher_timers[index])
+            publish()
+            self._schedule_publishing(index, publish, arrivals, due_ns)
+        delay = max(due_ns - perf_counter_ns(), 0) / 1e9
+        self.publisher_timers[index] = self.create_timer(delay, fn)
+
+    # publish once matched and started, see __init__
+    def _start_publishing(self):
+        start_ns = perf_counter_ns()
+        for index, publisher in enumerate(self.publisher_specs):
+            topic = publisher["topic"]
+
+            # each publisher's models draw from their own seeded generator,
+            # seeded by index too as a robot may publish a topic twice
+            rng = random.Random("%s %s %d"%(self.robot_name, topic, index))
+
+            # the callback function that is dynamically created using closure
+            publisher_timer_callback_function = \
+                            self._make_publisher_timer_callback_function(
+                            topic, size_model(publisher, rng), self.log)
+            if publisher["arrival"][0] == "periodic":
+                period = 1/publisher["frequency"]
+                self.publisher_timers[index] = self.create_timer(period,
+                                          publisher_timer_callback_function)
+            else:
+                self._schedule_publishing(index,
+                                          publisher_timer_callback_function,
+                                          arrival_model(publisher, rng),
+                                          start_ns)
+
+    # True when every publisher and subscription matched its expected peers
+    def _matched(self):
+        for topic, publisher_manager in self.publisher_managers.items():
+            if publisher_manager.get_subscription_count() \
+                                < len(self.all_recipients[topic]):
+                return False
+        for topic, subscriber_object in self.subscriber_managers_by_topic:
+            if subscriber_object.get_publisher_count() \
+                                < self.publisher_counts[topic]:
+                return False
+        return True
+
+    def _started(self):
+        if self.start_file and isfile(self.start_file):
+            return True
+        if self.start_time and time() >= self.start_time:
+            return True
+        return not self.start_file and not self.start_time
+
+    def _barrier_callback(self):
+        if not self.ready and self._matched():
+            self.ready = True
+            if self.ready_dir:
+                # report ready, written then renamed so it appears complete
+                ready_file = join(self.ready_dir, self.robot_name)
+                with open("%s.tmp"%ready_file, "w") as f:
+                    f.write("%f\n"%time())
+                replace("%s.tmp"%ready_file, ready_file)
+        if self._started():
+            if not self.ready:
+                print("%s starting before all peers matched"%self.robot_name)
+                stdout.flush()
+            self.destroy_timer(self.barrier_timer)
+            self._start_publishing()
+
+    """
+    Publishing starts immediately unless a barrier is given.  With
+    ready_dir, the robot writes <ready_dir>/<robot_name> once its
+    publishers and subscriptions have matched their expected peers.  With
+    start_file, publishing starts when that file exists, and with
+    start_time, when the wall clock reaches it, so that the first samples
+    do not mix discovery with steady-state traffic.
+    """
+    def __init__(self, robot_name, role, setup_file, log, binary=False,
+                 tx_log_every=1, ready_dir="", start_file="", start_time=0,
+                 setup=None):
         super().__init__(robot_name)
         self.robot_name = robot_name
         self.role = role
-        self.f = f
+        self.log = log
+        self.binary = binary
+        self.tx_log_every = tx_log_every
+        self.ready_dir = ready_dir
+        self.start_file = start_file
+        self.start_time = start_time
+        self.ready = False
 
         # stagger start time randomly but deterministically
         random.seed(robot_name)
         random.random()
 
-        # get setup parameters
-        setup = read_setup(setup_file)
+        # get this role's slice of the compiled setup, see robot_setup,
+        # loaded once by testbed_group for its robots
+        if setup is None:
+            setup = load_robot_setup(setup_file, role)
         publishers = setup["publishers"]
         subscribers = setup["subscribers"]
-        all_recipients = setup["all_recipients"]
 
-        # start publishers for this role
+        # robot and topic IDs for binary log records
+        self.robot_ids = name_ids(setup["robot_names"])
+        self.topic_ids = name_ids(setup["topic_names"])
+
+        # expected peers: subscribers and publishers of each topic
+        self.all_recipients = setup["all_recipients"]
+        self.publisher_counts = setup["publisher_counts"]
+
+        # start publishers for this role, the slice has only its own
         self.publish_counters = defaultdict(int)
         self.subscribe_counters = defaultdict(int)
         self.publisher_managers = dict()
+        self.publisher_specs = list()
         self.publisher_timers = list()
         for publisher in publishers:
-            # only publish topics assigned to this role
-            if publisher["role"] != role:
-                continue
-
             # the topic
             topic = publisher["topic"]
 
@@ -101,28 +223,18 @@ class TestbedRobot(Node):
                              TestbedMessage, topic,
                              qos_profile=qos_profile(publisher))
 
-            # recipients
-            recipients = all_recipients[topic]
-
-            # the callback function that is dynamically created using closure
-            publisher_timer_callback_function = \
-                            self._make_publisher_timer_callback_function(
-                            topic, publisher["size"], recipients, f)
-            period = 1/publisher["frequency"]
-            timer = self.create_timer(period, publisher_timer_callback_function)
-            self.publisher_timers.append(timer)
+            # the publisher timers are made when publishing starts, each in
+            # its publisher's slot since a role may publish a topic twice
+            self.publisher_specs.append(publisher)
+            self.publisher_timers.append(None)
 
         # start subscribers
         self.subscriber_managers = list()
+        self.subscriber_managers_by_topic = list()
         for subscriber in subscribers:
-
-            # only subscribe to topics assigned to this role
-            if subscriber["role"] != role:
-                continue
-
             _subscriber_callback_function = \
                             self._make_subscriber_callback_function(
-                                  subscriber["topic"], f)
+                                  subscriber["topic"], log)
 
             subscriber_object = self.create_subscription(
                                   TestbedMessage,
@@ -130,6 +242,59 @@ class TestbedRobot(Node):
                                   _subscriber_callback_function,
                                   qos_profile=qos_profile(subscriber))
             self.subscriber_managers.append(subscriber_object)
+            self.subscriber_managers_by_topic.append((subscriber["topic"],
+                                                      subscriber_object))
+
+        # start publishing now or at the barrier
+        if ready_dir or start_file or start_time:
+            self.barrier_timer = self.create_timer(0.05,
+                                                   self._barrier_callback)
+        else:
+            self._start_publishing()
+
+# stop spinning on SIGTERM as on SIGINT so that queued log records are written
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+# options shared by testbed_robot and testbed_group
+def add_options(parser):
+    parser.add_argument("-i", "--flush_interval", type=float,
+                        help="Seconds between batched log writes.",
+                        default=1.0)
+    parser.add_argument("-q", "--max_queue", type=int,
+                        help="Maximum log records buffered before "
+                             "callbacks wait for the writer.",
+                        default=100000)
+    parser.add_argument("-s", "--shard", action="store_true",
+                        help="Write to each robot's own shard file "
+                             "<out_file>.shards/<robot_name>.")
+    parser.add_argument("-f", "--log_format", type=str,
+                        choices=["text", "binary"],
+                        help="Log CSV text rows or fixed-width binary "
+                             "records.",
+                        default="text")
+    parser.add_argument("-t", "--tx_log_every", type=int,
+                        help="Log every Nth publish, 0 to disable tx logs.",
+                        default=1)
+    parser.add_argument("-r", "--ready_dir", type=str,
+                        help="Write <ready_dir>/<robot_name> once all "
+                             "expected peers are matched.",
+                        default="")
+    parser.add_argument("-b", "--start_file", type=str,
+                        help="Start publishing once this file exists.",
+                        default="")
+    parser.add_argument("-a", "--start_time", type=float,
+                        help="Start publishing at this time, in seconds "
+                             "since the epoch.",
+                        default=0)
+
+# the log file of a robot
+def log_file(out_file, robot_name, shard):
+    if shard:
+        shard_dir = "%s.shards"%out_file
+        makedirs(shard_dir, exist_ok=True)
+        return join(shard_dir, robot_name)
+    return out_file
 
 def main():
     parser = ArgumentParser(description="Generic testbed robot.",
@@ -139,18 +304,33 @@ def main():
     parser.add_argument("role", type=str, help="This robot's role")
     parser.add_argument("setup_file", type=str, help="The scenario setup file.")
     parser.add_argument("out_file", type=str, help="The output file.")
+    add_options(parser)
     args = parser.parse_args()
     print("Starting testbed_robot %s role %s"%(args.robot_name, args.role))
     stdout.flush()
 
-    # open out_file w+
-    with open(args.out_file, "a") as f:
+    # open out_file or this robot's shard for append
+    out_file = log_file(args.out_file, args.robot_name, args.shard)
+    binary = args.log_format == "binary"
+    signal(SIGTERM, interrupt)
+    with open(out_file, "ab" if binary else "a") as f:
+        log = LogWriter(f, flush_interval=args.flush_interval,
+                        max_queue=args.max_queue)
         rclpy.init()
         robot_node = TestbedRobot(args.robot_name, args.role,
-                                  args.setup_file, f)
-        rclpy.spin(robot_node)
-        robot_node.destroy_node()
-        rclpy.shutdown()
+                                  args.setup_file, log, binary,
+                                  args.tx_log_every, args.ready_dir,
+                                  args.start_file, args.start_time)
+        try:
+            rclpy.spin(robot_node)
+        except (KeyboardInterrupt, ExternalShutdownException):
+            pass
+        finally:
+            # write out any log records still queued
+            log.close()
+            robot_node.destroy_node()
+            if rclpy.ok():
+                rclpy.shutdown()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+from math import ceil, exp, log, sqrt
+
+# Traffic models of a Publisher, from the optional Arrival and Sizes columns
+# of the Publisher directive, see setup_reader.  Arrival models, with the
+# Frequency column as the rate in Hz:
+#   periodic          one message every 1/Frequency seconds, the default
+#   poisson           exponential intervals with mean 1/Frequency seconds
+#   onoff On Off      periodic for On seconds then silent for Off seconds,
+#                     for bursts such as camera frames
+#   ramp To Over      rate changing linearly from Frequency to To Hz over
+#                     Over seconds, then constant at To Hz, 0 to stop
+# Size models, with the Size column as the size in bytes:
+#   fixed             Size bytes, the default
+#   uniform Low High  uniformly distributed from Low to High bytes
+#   lognormal Sigma   lognormally distributed with median Size bytes and
+#                     log standard deviation Sigma
+#   trace File        sizes from File, one per line, cycled from a random
+#                     line, relative to the setup file
+# The models are parsed and checked by setup_reader.  Times are from when
+# publishing starts.  Models draw from the rng they are given so that runs
+# are repeatable.
+
+class Periodic():
+    def __init__(self, frequency):
+        self.period = 1/frequency
+
+    def next_interval(self):
+        return self.period
+
+class Poisson():
+    def __init__(self, frequency, rng):
+        self.frequency = frequency
+        self.rng = rng
+
+    def next_interval(self):
+        return self.rng.expovariate(self.frequency)
+
+# messages in each on time, counted rather than timed so that rounding
+# does not add one
+def burst_count(frequency, on):
+    return max(1, int(ceil(on * frequency - 1e-9)))
+
+class OnOff():
+    def __init__(self, frequency, on, off):
+        self.period = 1/frequency
+        self.burst = burst_count(frequency, on)
+        self.cycle = on + off
+        self.sent = 0
+
+    def next_interval(self):
+        # the next period, or the start of the next on time after the burst
+        self.sent += 1
+        if self.sent < self.burst:
+            return self.period
+        self.sent = 0
+        return self.cycle - (self.burst - 1) * self.period
+
+class Ramp():
+    def __init__(self, frequency, to, over):
+        self.start = frequency
+        self.to = to
+        self.over = over
+        self.slope = (to - frequency) / over if over else 0.0
+        self.time = 0.0
+
+    # the time until the rate integrates to one message, None if never
+    def next_interval(self):
+        t = self.time
+        interval = None
+        if t < self.over:
+            rate = self.start + self.slope * t
+            if not self.slope:
+                dt = 1/rate if rate > 0 else None
+            else:
+                # rate*dt + slope/2*dt^2 = 1
+                discriminant = rate * rate + 2 * self.slope
+                dt = (sqrt(discriminant) - rate) / self.slope \
+                     if discriminant >= 0 else None
+            if dt is not None and t + dt <= self.over:
+                interval = dt
+            else:
+                # the rest of the message at the final rate
+                ramp = self.over - t
+                rest = 1 - rate * ramp - self.slope / 2 * ramp * ramp
+                if self.to > 0:
+                    interval = ramp + rest / self.to
+        elif self.to > 0:
+            interval = 1/self.to
+        if interval is not None:
+            self.time = t + interval
+        return interval
+
+class FixedSize():
+    def __init__(self, size):
+        self.size = size
+
+    def next_size(self):
+        return self.size
+
+class UniformSize():
+    def __init__(self, low, high, rng):
+        self.low = low
+        self.high = high
+        self.rng = rng
+
+    def next_size(self):
+        return self.rng.randint(self.low, self.high)
+
+class LognormalSize():
+    def __init__(self, size, sigma, rng):
+        self.mu = log(size)
+        self.sigma = sigma
+        self.rng = rng
+
+    def next_size(self):
+        return int(round(self.rng.lognormvariate(self.mu, self.sigma)))
+
+class TraceSize():
+    def __init__(self, sizes, rng):
+        self.sizes = sizes
+        self.index = rng.randrange(len(sizes))
+
+    def next_size(self):
+        size = self.sizes[self.index]
+        self.index = (self.index + 1) % len(self.sizes)
+        return size
+
+# the message sizes in a trace file
+def read_trace(filename):
+    with open(filename) as f:
+        sizes = [int(line) for line in f if line.strip()
+                                          and not line.startswith("#")]
+    if not sizes:
+        raise RuntimeError("Empty size trace %s"%filename)
+    return sizes
+
+# the arrival model of a publisher record
+def arrival_model(publisher, rng):
+    name, *args = publisher["arrival"]
+    frequency = publisher["frequency"]
+    if name == "periodic":
+        return Periodic(frequency)
+    if name == "poisson":
+        return Poisson(frequency, rng)
+    if name == "onoff":
+        return OnOff(frequency, *args)
+    if name == "ramp":
+        return Ramp(frequency, *args)
+    raise RuntimeError("Invalid arrival model: %s"%name)
+
+# the size model of a publisher record
+def size_model(publisher, rng):
+    name, *args = publisher["sizes"]
+    size = publisher["size"]
+    if name == "fixed":
+        return FixedSize(size)
+    if name == "uniform":
+        return UniformSize(args[0], args[1], rng)
+    if name == "lognormal":
+        return LognormalSize(size, args[0], rng)
+    if name == "trace":
+        return TraceSize(read_trace(args[0]), rng)
+    raise RuntimeError("Invalid size model: %s"%name)
+
+# mean messages per second, of the final rate with ramp
+def mean_rate(publisher):
+    name, *args = publisher["arrival"]
+    if name == "onoff":
+        return burst_count(publisher["frequency"], args[0]) \
+               / (args[0] + args[1])
+    if name == "ramp":
+        return args[0]
+    return publisher["frequency"]
+
+# mean message size in bytes
+def mean_size(publisher):
+    name, *args = publisher["sizes"]
+    if name == "uniform":
+        return (args[0] + args[1]) / 2
+    if name == "lognormal":
+        return publisher["size"] * exp(args[0] * args[0] / 2)
+    if name == "trace":
+        sizes = read_trace(args[0])
+        return sum(sizes) / len(sizes)
+    return publisher["size"]
@@ -0,0 +1,67 @@
+import random
+from log_records import name_ids, tx_record, rx_record
+
+# A small scenario and synthetic robot logs of it, text and binary, with
+# lost and reordered messages, for the analysis tests.
+
+SETUP = """\
+Publisher, GS, odometry, 10, 500, keep_last, 0, reliable, volatile
+Subscriber, red_team, odometry, keep_last, 0, reliable, volatile
+Robot, R1, GS
+Robot, R2, red_team
+Robot, R3, red_team
+"""
+ROBOTS = ["R1", "R2", "R3"]
+TOPICS = ["odometry"]
+SUBSCRIBERS = ["R2", "R3"]
+
+def write_setup(directory):
+    filename = str(directory / "setup.csv")
+    with open(filename, "w") as f:
+        f.write(SETUP)
+    return filename
+
+"""
+tx and rx events of count publishes of R1 at 10 Hz, in log order.  Each
+message is lost to a subscriber with probability loss, and latencies are
+random so rx arrive out of tx order.  Times are whole microseconds so the
+text log holds them exactly.  Returns tx (tx_count, tx_ns) and rx (to,
+tx_count, rx_count, size, latency_ns, rx_ns) lists.
+"""
+def events(count=200, loss=0.1, seed=1):
+    rng = random.Random(seed)
+    tx = list()
+    rx = list()
+    rx_counts = {name: 0 for name in SUBSCRIBERS}
+    for tx_count in range(1, count + 1):
+        tx_ns = 1000000000 + tx_count * 100000000
+        tx.append((tx_count, tx_ns))
+        for to in SUBSCRIBERS:
+            if rng.random() < loss:
+                continue
+            latency_ns = rng.randrange(1000, 300000000, 1000)
+            rx.append([to, tx_count, 0, 500, latency_ns, tx_ns + latency_ns])
+    rx.sort(key=lambda row: row[5])
+    for row in rx:
+        rx_counts[row[0]] += 1
+        row[2] = rx_counts[row[0]]
+    return tx, [tuple(row) for row in rx]
+
+def write_text_log(filename, tx, rx):
+    rows = [(tx_ns, "R1,odometry,%d,%f\n"%(tx_count, tx_ns / 1e9))
+            for tx_count, tx_ns in tx]
+    rows += [(rx_ns, "R1,%s,odometry,%d,%d,%d,%f,%f\n"%(to, tx_count,
+                     rx_count, size, latency_ns / 1e6, rx_ns / 1e9))
+             for to, tx_count, rx_count, size, latency_ns, rx_ns in rx]
+    with open(filename, "w") as f:
+        f.writelines(row for _ts, row in sorted(rows))
+
+def write_binary_log(filename, tx, rx):
+    robot_ids = name_ids(ROBOTS)
+    rows = [(tx_ns, tx_record(robot_ids["R1"], 0, tx_count, tx_ns))
+            for tx_count, tx_ns in tx]
+    rows += [(rx_ns, rx_record(robot_ids["R1"], robot_ids[to], 0, tx_count,
+                               rx_count, size, latency_ns, rx_ns))
+             for to, tx_count, rx_count, size, latency_ns, rx_ns in rx]
+    with open(filename, "wb") as f:
+        f.writelines(row for _ts, row in sorted(rows))
@@ -0,0 +1,93 @@
+import numpy as np
+from log_reader import read_datapoints
+from bin_aggregates import aggregate, merge_bins, flow_totals, totals
+from latency_sketch import sketch, merge_sketches, flow_sketches, \
+                           quantiles, quantile_cells, quantile_columns, \
+                           bucket_values, bucket_indexes
+from downsample import pixel_thin, lttb
+from logs import events, write_setup, write_text_log
+
+def _datapoints(tmp_path, count=400):
+    setup_file = write_setup(tmp_path)
+    tx, rx = events(count=count)
+    write_text_log(str(tmp_path / "log.csv"), tx, rx)
+    datapoints, _robots, _topics = read_datapoints(str(tmp_path / "log.csv"),
+                                                   setup_file)
+    return datapoints[np.argsort(datapoints["time"], kind="stable")]
+
+def _parts(datapoints, count):
+    # split by time so that each part holds whole bars
+    edges = np.searchsorted(datapoints["time"],
+                            np.linspace(0, datapoints["time"].max(),
+                                        count + 1)[1:-1].round())
+    return np.split(datapoints, edges)
+
+def test_merged_bins_match_one_shot(tmp_path):
+    datapoints = _datapoints(tmp_path)
+    bins = aggregate(datapoints, 1.0, 200)
+    parts = _parts(datapoints, 4)
+    merged = merge_bins([aggregate(part, 1.0, 200) for part in parts])
+    for name in ("flow", "bar", "count", "lost", "outliers",
+                 "latency_count", "bytes"):
+        assert (merged[name] == bins[name]).all()
+    assert np.allclose(merged["latency_sum"], bins["latency_sum"])
+    assert np.allclose(merged["latency_max"], bins["latency_max"])
+    assert totals(merged) == totals(bins)
+    assert totals(flow_totals(bins)) == totals(bins)
+    count, lost, outliers = totals(bins)
+    assert count == len(datapoints)
+    assert lost == (datapoints["loss"] > 0).sum()
+    assert outliers == ((datapoints["loss"] == 0)
+                        & (datapoints["latency"] > 200)).sum()
+
+def test_merged_sketches_match_one_shot(tmp_path):
+    datapoints = _datapoints(tmp_path)
+    sketches = sketch(datapoints, 1.0, 1000)
+    merged = merge_sketches([sketch(part, 1.0, 1000)
+                             for part in _parts(datapoints, 4)])
+    assert (merged == sketches).all()
+    assert (flow_sketches(merged) == flow_sketches(sketches)).all()
+
+def test_quantiles_within_bucket_error(tmp_path):
+    datapoints = _datapoints(tmp_path)
+    received = datapoints[datapoints["loss"] == 0]
+    flows, bars, values = quantiles(flow_sketches(sketch(datapoints, 1.0,
+                                                         1000)),
+                                    [0.5, 0.9])
+    assert len(flows) == 2
+    for to in np.unique(received["to"]):
+        latencies = received["latency"][received["to"] == to]
+        row = values[list(np.unique(received["to"])).index(to)]
+        for value, q in zip(row, [50, 90]):
+            exact = np.percentile(latencies, q, method="inverted_cdf")
+            assert abs(value - exact) <= exact * 0.02
+
+def test_bucket_values():
+    latencies = np.array([0.01, 1.0, 55.5, 900.0])
+    values = bucket_values(bucket_indexes(latencies))
+    assert np.allclose(values, latencies, rtol=0.02)
+
+def test_pixel_thin_and_lttb():
+    x = np.arange(10000, dtype=np.float64)
+    y = np.sin(x / 100)
+    y[5000] = 10
+    keep = pixel_thin(x, y, width=100, height=100)
+    assert len(keep) <= 100 * 100
+    assert 5000 in keep
+    keep = lttb(x, y, 200)
+    assert len(keep) == 200
+    assert keep[0] == 0 and keep[-1] == len(x) - 1
+    assert (np.diff(keep) > 0).all()
+    assert 5000 in keep
+
+def test_quantile_cells(tmp_path):
+    datapoints = _datapoints(tmp_path)
+    bins = flow_totals(aggregate(datapoints, 1.0, 1000))
+    cells = quantile_cells(flow_sketches(sketch(datapoints, 1.0, 1000)),
+                           bins)
+    assert quantile_columns() == ["p50_ms", "p95_ms", "p99_ms"]
+    assert len(cells) == len(bins)
+    for row, latency_max in zip(cells, bins["latency_max"].tolist()):
+        values = [float(cell) for cell in row]
+        assert values == sorted(values)
+        assert values[-1] <= latency_max
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from log_reader import read_datapoints
+from log_follower import LogFollower, chunked_aggregates
+from bin_aggregates import aggregate, totals
+from latency_sketch import sketch
+from logs import events, write_setup, write_text_log, write_binary_log
+
+def _chunked(filename, setup_file):
+    # small reads so the log takes many polls
+    return chunked_aggregates(filename, setup_file, 1.0, 1000,
+                              memory_limit=1<<16)
+
+def test_missing_log(tmp_path):
+    setup_file = write_setup(tmp_path)
+    with pytest.raises(RuntimeError):
+        _chunked(str(tmp_path / "missing.csv"), setup_file)
+
+def test_text_log_without_final_newline(tmp_path):
+    setup_file = write_setup(tmp_path)
+    filename = str(tmp_path / "log.csv")
+    tx, rx = events()
+    write_text_log(filename, tx, rx)
+    with open(filename, "rb+") as f:
+        f.truncate(f.seek(-1, 2))
+    datapoints, _robots, _topics = read_datapoints(filename, setup_file)
+    follower = _chunked(filename, setup_file)
+    assert totals(follower.bins) == totals(aggregate(datapoints, 1.0, 1000))
+
+def test_binary_log_with_partial_record(tmp_path):
+    setup_file = write_setup(tmp_path)
+    filename = str(tmp_path / "log.bin")
+    tx, rx = events()
+    write_binary_log(filename, tx, rx)
+    datapoints, _robots, _topics = read_datapoints(filename, setup_file)
+    with open(filename, "ab") as f:
+        f.write(b"\x02\x02\x00")
+    follower = _chunked(filename, setup_file)
+    assert totals(follower.bins) == totals(aggregate(datapoints, 1.0, 1000))
+
+def _followed(filename, setup_file, tx_timeout):
+    # many polls and spills
+    follower = LogFollower(filename, setup_file, 1.0, 200,
+                           tx_timeout=tx_timeout, read_bytes=4000,
+                           spill_bytes=2000)
+    follower.read_all()
+    assert follower.spill_files == list()
+    return follower
+
+def test_chunked_matches_batch(tmp_path):
+    setup_file = write_setup(tmp_path)
+    filename = str(tmp_path / "log.csv")
+    tx, rx = events(count=400)
+    write_text_log(filename, tx, rx)
+    datapoints, _robots, _topics = read_datapoints(filename, setup_file)
+    bins = aggregate(datapoints, 1.0, 200)
+    follower = _followed(filename, setup_file, 10.0)
+    for name in ("flow", "bar", "count", "lost", "outliers",
+                 "latency_count", "bytes"):
+        assert (follower.bins[name] == bins[name]).all()
+    assert np.allclose(follower.bins["latency_sum"], bins["latency_sum"])
+    assert np.allclose(follower.bins["latency_max"], bins["latency_max"])
+    assert (follower.bins["jitter_count"] <= bins["jitter_count"]).all()
+    assert (follower.sketches == sketch(datapoints, 1.0, 200)).all()
+
+def test_aged_out_tx_stay_lost(tmp_path):
+    # latencies are up to 0.3 s, so a 0.1 s timeout ages out received tx
+    setup_file = write_setup(tmp_path)
+    filename = str(tmp_path / "log.csv")
+    tx, rx = events(count=400)
+    write_text_log(filename, tx, rx)
+    datapoints, _robots, _topics = read_datapoints(filename, setup_file)
+    count, lost, _outliers = totals(aggregate(datapoints, 1.0, 200))
+    follower = _followed(filename, setup_file, 0.1)
+    follower_count, follower_lost, _outliers = totals(follower.bins)
+    assert follower_count == count
+    assert follower_lost > lost
@@ -0,0 +1,120 @@
+import json
+import numpy as np
+from log_reader import read_events, read_datapoints, resolve, \
+                       resolve_rx_only, TX_DTYPE, RX_DTYPE, NO_LATENCY
+from log_follower import chunked_aggregates
+from bin_aggregates import totals
+from logs import events, write_setup, write_text_log, write_binary_log, \
+                 SUBSCRIBERS
+
+def _sorted(datapoints):
+    return datapoints[np.lexsort((datapoints["time"], datapoints["to"]))]
+
+def test_text_and_binary_logs_match(tmp_path):
+    setup_file = write_setup(tmp_path)
+    tx, rx = events()
+    write_text_log(str(tmp_path / "log.csv"), tx, rx)
+    write_binary_log(str(tmp_path / "log.bin"), tx, rx)
+    for no_join in (False, True):
+        text, robots, topics = read_datapoints(str(tmp_path / "log.csv"),
+                                               setup_file, no_join)
+        binary, binary_robots, binary_topics = read_datapoints(
+                             str(tmp_path / "log.bin"), setup_file, no_join)
+        assert robots == binary_robots
+        assert topics == binary_topics
+        assert len(text) == len(binary)
+        text = _sorted(text)
+        binary = _sorted(binary)
+        for name in ("from", "to", "topic", "size", "loss"):
+            assert (text[name] == binary[name]).all()
+        assert np.allclose(text["time"], binary["time"])
+        assert np.allclose(text["latency"], binary["latency"])
+
+def test_tx_expanded_per_subscriber(tmp_path):
+    setup_file = write_setup(tmp_path)
+    tx, rx = events(count=10)
+    write_text_log(str(tmp_path / "log.csv"), tx, rx)
+    tx_events, rx_events, robots, _topics = read_events(
+                                 str(tmp_path / "log.csv"), setup_file)
+    assert len(tx_events) == len(tx) * len(SUBSCRIBERS)
+    assert sorted(set(robots[to] for to in tx_events["to"])) == SUBSCRIBERS
+    assert len(rx_events) == len(rx)
+
+def _tx(rows):
+    tx = np.zeros(len(rows), dtype=TX_DTYPE)
+    for i, (to, tx_count, ts) in enumerate(rows):
+        tx[i] = (0, to, 0, tx_count, ts)
+    return tx
+
+def _rx(rows):
+    rx = np.zeros(len(rows), dtype=RX_DTYPE)
+    for i, (to, tx_count, ts) in enumerate(rows):
+        rx[i] = (0, to, 0, tx_count, 100, ts - tx_count * 1000000, ts)
+    return rx
+
+def test_resolve_loss_and_out_of_order():
+    # counts 1 to 4 to robots 1 and 2, tx at count ms
+    tx = _tx([(to, count, count * 1000000)
+              for count in range(1, 5) for to in (1, 2)])
+    # 2 lost to robot 1, 3 lost to robot 2, rx out of order, one legacy rx
+    # without tx or latency
+    rx = _rx([(1, 4, 9000000), (1, 1, 10000000), (2, 2, 11000000),
+              (1, 3, 12000000), (2, 1, 13000000), (2, 4, 14000000),
+              (2, 1, 15000000)])
+    rx[-1]["from"] = 3
+    rx[-1]["latency_ns"] = NO_LATENCY
+    datapoints = resolve(tx, rx)
+    assert len(datapoints) == len(tx)
+    by_message = {(int(point["to"]), round(point["time"] * 1000) + 1): point
+                  for point in datapoints}
+    lost = sorted(key for key, point in by_message.items()
+                  if point["loss"] == 100)
+    assert lost == [(1, 2), (2, 3)]
+    assert by_message[(1, 4)]["latency"] == 5.0
+    assert by_message[(1, 1)]["latency"] == 9.0
+    assert by_message[(2, 2)]["latency"] == 9.0
+    assert by_message[(1, 4)]["size"] == 100
+
+def test_resolve_infers_sampled_tx():
+    # every 3rd tx logged, counts 1 to 10 to robot 1, 5 and 10 lost
+    tx = _tx([(1, count, count * 1000000) for count in (3, 6, 9)])
+    rx = _rx([(1, count, count * 1000000 + 2000000)
+              for count in (1, 2, 3, 4, 6, 7, 8, 9)])
+    datapoints = resolve(tx, rx)
+    # 10 comes after the last logged tx or rx so it is not seen
+    assert len(datapoints) == 9
+    assert np.allclose(np.sort(datapoints["time"]), np.arange(9) / 1000)
+    lost = datapoints[datapoints["loss"] == 100]
+    assert np.allclose(lost["time"], [0.004])
+    assert np.allclose(datapoints["latency"][datapoints["loss"] == 0], 2.0)
+
+def test_resolve_rx_only_infers_gaps():
+    rx = _rx([(1, 4, 9000000), (1, 1, 10000000), (1, 3, 12000000)])
+    datapoints = resolve_rx_only(rx)
+    assert len(datapoints) == 4
+    lost = datapoints[datapoints["loss"] == 100]
+    assert len(lost) == 1
+    # count 2 lies halfway between the tx times of counts 1 and 3
+    received = datapoints[datapoints["loss"] == 0]
+    assert np.isclose(lost["time"][0], np.sort(received["time"])[:2].mean())
+
+def test_run_window(tmp_path):
+    setup_file = write_setup(tmp_path)
+    filename = str(tmp_path / "log.csv")
+    tx, rx = events(count=200)
+    write_text_log(filename, tx, rx)
+    full, _robots, _topics = read_datapoints(filename, setup_file)
+    # tx are every 0.1 s from 1.1 s, measure from 5 to 10 s
+    with open("%s.run.json"%filename, "w") as f:
+        json.dump({"start_ns": 5000000000, "end_ns": 10000000000}, f)
+    for no_join in (False, True):
+        windowed, _robots, _topics = read_datapoints(filename, setup_file,
+                                                     no_join)
+        assert len(windowed) == 50 * len(SUBSCRIBERS)
+        assert windowed["time"].min() == 0
+        assert windowed["time"].max() < 5
+    unwindowed, _robots, _topics = read_datapoints(filename, setup_file,
+                                                   use_window=False)
+    assert len(unwindowed) == len(full)
+    follower = chunked_aggregates(filename, setup_file, 1.0, 1000)
+    assert totals(follower.bins)[0] == 50 * len(SUBSCRIBERS)
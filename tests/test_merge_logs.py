@@ -0,0 +1,32 @@
+from merge_logs import merged_lines, shard_files
+from log_records import RECORD_STRUCT
+from logs import events, write_text_log, write_binary_log
+
+def _shards(tmp_path, write, suffix):
+    tx, rx = events(count=50, loss=0)
+    directory = tmp_path / ("log%s.shards"%suffix)
+    directory.mkdir()
+    # one shard of tx, one per subscriber of rx
+    write(str(directory / "R1"), tx, [])
+    for to in ("R2", "R3"):
+        write(str(directory / to), [], [row for row in rx if row[0] == to])
+    return str(tmp_path / ("log%s"%suffix)), len(tx) + len(rx)
+
+def test_text_shards_merge_in_time_order(tmp_path):
+    out_file, count = _shards(tmp_path, write_text_log, ".csv")
+    shards = shard_files(out_file)
+    assert len(shards) == 3
+    for max_open in (2, 256):
+        lines = list(merged_lines(shards, max_open))
+        assert len(lines) == count
+        times = [float(line.rsplit(",", 1)[1]) for line in lines]
+        assert times == sorted(times)
+
+def test_binary_shards_merge_in_time_order(tmp_path):
+    out_file, count = _shards(tmp_path, write_binary_log, ".bin")
+    shards = shard_files(out_file)
+    for max_open in (2, 256):
+        records = list(merged_lines(shards, max_open, binary=True))
+        assert len(records) == count
+        times = [RECORD_STRUCT.unpack(record)[-1] for record in records]
+        assert times == sorted(times)
@@ -0,0 +1,28 @@
+import numpy as np
+from log_reader import DATAPOINT_DTYPE
+from pair_matrix import pair_matrices, frames, active_robots
+
+def test_pair_matrices_per_frame():
+    # robots 3 to 5 to robot 7 of 100, two frames of 10 seconds
+    datapoints = np.zeros(6, dtype=DATAPOINT_DTYPE)
+    datapoints["from"] = [3, 3, 5, 3, 5, 5]
+    datapoints["to"] = 7
+    datapoints["time"] = [1, 2, 3, 11, 12, 13]
+    datapoints["latency"] = [1, 3, 5, 7, 9, 0]
+    datapoints["loss"] = [0, 0, 0, 0, 0, 100]
+    robots = active_robots(datapoints, 100)
+    assert robots.tolist() == [3, 5, 7]
+
+    matrices = [(frame, pair_matrices(points, robots, 100))
+                for frame, points in frames(datapoints, 10)]
+    assert [frame for frame, _ in matrices] == [0, 1]
+    first = matrices[0][1]
+    assert first["median"].shape == (3, 3)
+    assert first["median"][0, 2] == 1
+    assert first["p99"][0, 2] == 3
+    assert first["median"][1, 2] == 5
+    assert np.isnan(first["median"][2, 0])
+    second = matrices[1][1]
+    assert second["loss"][1, 2] == 50
+    assert second["median"][1, 2] == 9
+    assert second["loss"][0, 2] == 0
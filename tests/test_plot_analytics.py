@@ -0,0 +1,42 @@
+import numpy as np
+from log_reader import DATAPOINT_DTYPE, size_models, group_datapoints
+from plot_analytics import latency_points
+from logs import write_setup
+
+def _datapoints():
+    # R1 to R2 and R3 on odometry, sizes varying from message to message
+    datapoints = np.zeros(100, dtype=DATAPOINT_DTYPE)
+    datapoints["to"] = np.arange(100) % 2 + 1
+    datapoints["time"] = np.arange(100) / 10
+    datapoints["size"] = np.arange(100) * 7 + 100
+    datapoints["latency"] = 1.0
+    return datapoints
+
+def test_latency_points_by_size():
+    series_x, _series_y, total, dropped, outliers = latency_points(
+               _datapoints(), ["R1", "R2", "R3"], ["odometry"], 1000, dict())
+    assert len(series_x) == 100
+    assert (total, dropped, outliers) == (100, 0, 0)
+
+def test_latency_points_of_size_model(tmp_path):
+    setup_file = str(tmp_path / "setup.csv")
+    with open(write_setup(tmp_path)) as f:
+        text = f.read()
+    with open(setup_file, "w") as f:
+        f.write(text.replace("volatile\nSubscriber",
+                             "volatile, periodic, uniform 100 800\n"
+                             "Subscriber"))
+    models = size_models(setup_file)
+    assert models[("R1", "odometry")] == "uniform 100 800"
+    robot_names = ["R1", "R2", "R3"]
+    series_x, series_y, _total, _dropped, _outliers = latency_points(
+                  _datapoints(), robot_names, ["odometry"], 1000, models)
+    assert sorted(series_x) == ["R1, R2, odometry, uniform 100 800",
+                                "R1, R3, odometry, uniform 100 800"]
+    assert sum(len(x) for x in series_x.values()) == 100
+
+    grouped, group_names = group_datapoints(_datapoints(), robot_names,
+                                            "topic")
+    series_x, _series_y, _total, _dropped, _outliers = latency_points(
+                  grouped, group_names, ["odometry"], 1000, models)
+    assert list(series_x) == ["*, *, odometry, uniform 100 800"]
@@ -0,0 +1,39 @@
+from os.path import join
+from setup_reader import read_setup
+from sweep_runner import write_setup
+
+SETUP = """\
+Publisher, GS, odometry, 10, 500, keep_last, 0, reliable, volatile, periodic, trace sizes.txt
+Publisher, GS, camera, 10, 500, keep_last, 0, reliable, volatile
+Subscriber, red_team, odometry, keep_last, 0, reliable, volatile
+Robot, R1, GS
+Robot, R2, red_team
+"""
+
+def test_write_setup_trace_paths(tmp_path):
+    scenario_dir = tmp_path / "scenario"
+    spec_dir = tmp_path / "spec"
+    run_dir = tmp_path / "run"
+    for directory in (scenario_dir, spec_dir, run_dir):
+        directory.mkdir()
+    (scenario_dir / "setup.csv").write_text(SETUP)
+    (scenario_dir / "sizes.txt").write_text("100\n200\n")
+    (spec_dir / "other.txt").write_text("300\n")
+
+    # the setup's trace, relative to the setup file
+    out_csv = str(run_dir / "setup.csv")
+    write_setup(str(scenario_dir / "setup.csv"), {"frequency": 20}, out_csv,
+                str(spec_dir))
+    publishers = read_setup(out_csv)["publishers"]
+    assert publishers[0]["sizes"] == ["trace",
+                                      join(str(scenario_dir), "sizes.txt")]
+    assert publishers[0]["frequency"] == 20
+    assert publishers[1]["sizes"] == ["fixed"]
+
+    # the point's trace, relative to the sweep spec
+    write_setup(str(scenario_dir / "setup.csv"),
+                {"sizes": "trace other.txt"}, out_csv, str(spec_dir))
+    publishers = read_setup(out_csv)["publishers"]
+    for publisher in publishers:
+        assert publisher["sizes"] == ["trace",
+                                      join(str(spec_dir), "other.txt")]
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+
+from argparse import ArgumentParser
+from os.path import expanduser
+
+from setup_reader import load_setup
+from scenario_generator import component_count
+
+# Build a Mininet network from the Station, Switch, Link, PropagationModel,
+# MobilityModel and Mobility directives of a setup file, see setup_reader,
+# instead of from a Python topology file.  The network is Mininet-WiFi if
+# any station has a position, any link is adhoc or a propagation or
+# mobility model is given, else wired Mininet.  Switches are standalone
+# OVS switches, with STP if the wired links form a loop.
+
+def is_wifi(setup):
+    return bool(setup["propagation_model"] or setup["mobility_model"]
+                or setup["mobilities"]
+                or any(station["position"] for station in setup["stations"])
+                or any(link["node2"] == "adhoc" for link in setup["links"]))
+
+def _position(position):
+    return ",".join("%g"%x for x in position)
+
+# True if the wired links between nodes form a loop
+def _has_loop(setup):
+    names = [node["name"] for node in setup["stations"] + setup["switches"]]
+    ids = {name: i for i, name in enumerate(names)}
+    edges = [(ids[link["node1"]], ids[link["node2"]])
+             for link in setup["links"] if link["node2"] != "adhoc"]
+    return len(edges) > len(names) - component_count(len(names), edges)
+
+def _check(setup):
+    names = set(node["name"] for node in setup["stations"]
+                                       + setup["switches"])
+    stations = set(station["name"] for station in setup["stations"])
+    for link in setup["links"]:
+        for node in (link["node1"], link["node2"]):
+            if node not in names and node != "adhoc":
+                raise RuntimeError("Link to undefined node '%s'"%node)
+    for robot in setup["robots"]:
+        if robot["host"] not in stations:
+            raise RuntimeError("Robot %s host '%s' is not a Station"%(
+                               robot["robot_name"], robot["host"]))
+    for mobility in setup["mobilities"]:
+        if mobility["station"] not in stations:
+            raise RuntimeError("Mobility of undefined station '%s'"%(
+                               mobility["station"]))
+
+def _no_info(text):
+    pass
+
+"""
+build and start the network of the setup's topology directives, returning
+net.  net_class replaces Mininet or Mininet_wifi, for example to record
+the topology without building it, and is then given the Mininet node and
+link classes by name, so Mininet need not be installed.
+"""
+def build_topology(setup, net_class=None):
+    if net_class is None:
+        from mininet.log import info
+        from mininet.node import Host, OVSKernelSwitch
+        from mininet.link import TCLink
+    else:
+        info = _no_info
+        Host, OVSKernelSwitch, TCLink = "Host", "OVSKernelSwitch", "TCLink"
+
+    _check(setup)
+    wifi = is_wifi(setup)
+    if wifi:
+        if net_class is None:
+            from mn_wifi.net import Mininet_wifi as net_class
+            from mn_wifi.link import wmediumd, adhoc
+            from mn_wifi.wmediumdConnector import interference
+        else:
+            wmediumd, adhoc, interference = "wmediumd", "adhoc", \
+                                            "interference"
+        net = net_class(topo=None, build=False, link=wmediumd,
+                        wmediumd_mode=interference, ipBase='10.0.0.0/8')
+    else:
+        if net_class is None:
+            from mininet.net import Mininet as net_class
+        net = net_class(topo=None, build=False, ipBase='10.0.0.0/8')
+
+    info("*** Add switches\n")
+    stp = _has_loop(setup)
+    nodes = dict()
+    for switch in setup["switches"]:
+        params = {"stp": True} if stp else dict()
+        nodes[switch["name"]] = net.addSwitch(switch["name"],
+                                   cls=OVSKernelSwitch,
+                                   failMode='standalone', **params)
+
+    info("*** Add hosts/stations\n")
+    for station in setup["stations"]:
+        params = dict()
+        if station["ip"]:
+            params["ip"] = station["ip"]
+        if wifi:
+            if station["position"]:
+                params["position"] = _position(station["position"])
+            if station["range"]:
+                params["range"] = station["range"]
+            nodes[station["name"]] = net.addStation(station["name"],
+                                                    **params)
+        else:
+            nodes[station["name"]] = net.addHost(station["name"], cls=Host,
+                                                 defaultRoute=None, **params)
+
+    if wifi:
+        if setup["propagation_model"]:
+            info("*** Configuring Propagation Model\n")
+            net.setPropagationModel(**setup["propagation_model"])
+        if setup["mobility_model"]:
+            net.setMobilityModel(**setup["mobility_model"])
+        info("*** Configuring wifi nodes\n")
+        net.configureWifiNodes()
+
+    info("*** Add links\n")
+    for link in setup["links"]:
+        if link["node2"] == "adhoc":
+            net.addLink(nodes[link["node1"]], cls=adhoc, ssid=link["ssid"],
+                        mode=link["mode"], channel=link["channel"],
+                        intf="%s-wlan0"%link["node1"])
+        else:
+            net.addLink(nodes[link["node1"]], nodes[link["node2"]],
+                        cls=TCLink, **link["params"])
+
+    if setup["mobilities"]:
+        net.startMobility(time=setup["start_mobility"]["time"])
+        for mobility in setup["mobilities"]:
+            net.mobility(nodes[mobility["station"]], mobility["action"],
+                         time=mobility["time"],
+                         position=_position(mobility["position"]))
+        net.stopMobility(time=setup["stop_mobility"]["time"])
+
+    info("*** Starting network\n")
+    net.build()
+    for controller in net.controllers:
+        controller.start()
+    for switch in setup["switches"]:
+        net.get(switch["name"]).start([])
+    return net
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Check the topology directives of a "
+                                        "setup file")
+    parser.add_argument("csv_file", type=str, help="CSV setup file")
+    args = parser.parse_args()
+
+    setup = load_setup(expanduser(args.csv_file))
+    _check(setup)
+    print("%s network: %d stations, %d switches, %d links%s"%(
+          "Mininet-WiFi" if is_wifi(setup) else "Wired",
+          len(setup["stations"]), len(setup["switches"]),
+          len(setup["links"]), ", STP" if _has_loop(setup) else ""))
@@ -0,0 +1 @@
+testbed_ws/testbed_nodes/testbed_nodes/traffic_models.py
\ No newline at end of file